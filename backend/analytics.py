@@ -0,0 +1,423 @@
+"""
+Nutrition and medication analytics for the weekly/monthly reports
+Each user's meal history is kept as columnar NumPy arrays sorted by time;
+a report is a few bincounts over a searchsorted slice, then vectorized
+rollups (totals, macro energy ratios, rolling averages, goal adherence)
+per day, ISO week or month, plus medication adherence from takenAt
+Per-day sums of closed days (before today in the user's time zone) are
+memoized, so a repeated monthly report only rescans today's meals; rows
+added later for a closed day drop that day from the memo
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# Users whose history and day memo are kept in memory (least recently used go first)
+ANALYTICS_MAX_USERS = int(os.environ.get("ANALYTICS_MAX_USERS", "256"))
+# A day meets a goal within this fraction of the target (protein: at least target minus this)
+GOAL_TOLERANCE = float(os.environ.get("GOAL_TOLERANCE", "0.1"))
+# A dose counts as on time within this many minutes of the scheduled "HH:MM"
+MEDICATION_ON_TIME_MINUTES = int(os.environ.get("MEDICATION_ON_TIME_MINUTES", "60"))
+
+NUTRIENTS = ("kcal", "protein_g", "carbs_g", "fat_g")
+PERIODS = ("day", "week", "month")
+# kcal per gram of protein, carbs and fat, for the macro energy ratios
+MACRO_KCAL = np.array([4.0, 4.0, 9.0])
+DAY_S = 86400
+# Day-sum columns: meal count, then NUTRIENTS
+_COLUMNS = 1 + len(NUTRIENTS)
+
+def epoch_seconds(value: str) -> int:
+    """ISO timestamp (Prisma's createdAt / takenAt) -> epoch seconds; naive ones are UTC"""
+    moment = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+def hash_ids(ids: List[str]) -> np.ndarray:
+    """64-bit hashes of row ids, for de-duplicating resent rows"""
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(row_id.encode(), digest_size=8).digest(), "little", signed=True) for row_id in ids],
+        dtype=np.int64
+    )
+
+def day_string(day: int) -> str:
+    return str(np.datetime64(int(day), "D"))
+
+def bin_days(timestamps: np.ndarray, values: np.ndarray, first_day: int, days: int, offset_s: int) -> np.ndarray:
+    """(days, 1 + NUTRIENTS) meal counts and sums of rows already limited to those local days (any order)"""
+    index = (timestamps + offset_s) // DAY_S - first_day
+    sums = np.empty((days, _COLUMNS))
+    sums[:, 0] = np.bincount(index, minlength=days)
+    for column in range(len(NUTRIENTS)):
+        sums[:, column + 1] = np.bincount(index, weights=values[:, column], minlength=days)
+    return sums
+
+class MealHistory:
+    """
+    One user's meals as columns sorted by timestamp: epoch seconds (int64)
+    and NUTRIENTS (float32, one row per meal)
+    Appends go into spare capacity; rows older than the newest ones are
+    merged into the tail after them, so late rows only move that tail
+    """
+
+    def __init__(self):
+        self._timestamps = np.empty(0, dtype=np.int64)
+        self._values = np.empty((0, len(NUTRIENTS)), dtype=np.float32)
+        self._size = 0
+        # Sorted hashes of the ids seen so far
+        self._ids = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[:self._size]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values[:self._size]
+
+    def extend(self, timestamps: np.ndarray, values: np.ndarray, ids: Optional[np.ndarray] = None,
+               names: Optional[List[str]] = None) -> np.ndarray:
+        """
+        Add rows (skipping ids already present); returns the timestamps
+        actually added. Names are only kept by the on-disk MealStore
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float32).reshape(len(timestamps), len(NUTRIENTS))
+        if ids is not None and len(ids):
+            ids, first = np.unique(np.asarray(ids, dtype=np.int64), return_index=True)
+            fresh = ~np.isin(ids, self._ids, assume_unique=True)
+            keep = first[fresh]
+            timestamps, values = timestamps[keep], values[keep]
+            self._ids = np.union1d(self._ids, ids[fresh])
+        if not len(timestamps):
+            return timestamps
+
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, values = timestamps[order], values[order]
+        # Only the rows after the earliest new one move; in-order appends move nothing
+        cut = int(np.searchsorted(self.timestamps, timestamps[0], side="right"))
+        tail_timestamps = np.concatenate([self._timestamps[cut:self._size], timestamps])
+        tail_values = np.concatenate([self._values[cut:self._size], values])
+        if cut < self._size:
+            order = np.argsort(tail_timestamps, kind="stable")
+            tail_timestamps, tail_values = tail_timestamps[order], tail_values[order]
+
+        needed = self._size + len(timestamps)
+        if needed > len(self._timestamps):
+            capacity = max(needed, 2 * len(self._timestamps), 1024)
+            grown_timestamps = np.empty(capacity, dtype=np.int64)
+            grown_values = np.empty((capacity, len(NUTRIENTS)), dtype=np.float32)
+            grown_timestamps[:cut] = self._timestamps[:cut]
+            grown_values[:cut] = self._values[:cut]
+            self._timestamps, self._values = grown_timestamps, grown_values
+        self._timestamps[cut:needed] = tail_timestamps
+        self._values[cut:needed] = tail_values
+        self._size = needed
+        return timestamps
+
+    def day_sums(self, first_day: int, last_day: int, offset_s: int) -> np.ndarray:
+        """(days, 1 + NUTRIENTS) meal counts and sums for local days first_day..last_day"""
+        start, end = np.searchsorted(self.timestamps, [first_day * DAY_S - offset_s, (last_day + 1) * DAY_S - offset_s])
+        return bin_days(self.timestamps[start:end], self.values[start:end], first_day, last_day - first_day + 1, offset_s)
+
+    def refresh(self) -> np.ndarray:
+        """Rows added elsewhere since the last call (an in-memory history only changes through extend())"""
+        return np.empty(0, dtype=np.int64)
+
+class UserAnalytics:
+    __slots__ = ("history", "memo", "lock")
+
+    def __init__(self, history=None):
+        # A MealHistory, or anything with its extend / day_sums / refresh (meal_store.MealStore)
+        self.history = history if history is not None else MealHistory()
+        # offset seconds -> day -> day sums, for closed days only
+        self.memo: Dict[int, Dict[int, np.ndarray]] = {}
+        self.lock = threading.Lock()
+
+    def forget_days(self, timestamps: Optional[np.ndarray]):
+        """Drop memoized days that just received rows (all of them when None: unknown rows changed)"""
+        if timestamps is None:
+            self.memo.clear()
+            return
+        for offset_s, days in self.memo.items():
+            for day in np.unique((timestamps + offset_s) // DAY_S).tolist():
+                days.pop(day, None)
+
+def _rolling(values: np.ndarray, weights: np.ndarray, window: int) -> np.ndarray:
+    """Trailing window mean of values over the rows with weight (logged days), NaN where none"""
+    sums = np.cumsum(np.vstack([np.zeros((1, values.shape[1])), values * weights[:, None]]), axis=0)
+    counts = np.cumsum(np.concatenate([[0.0], weights]))
+    lagged = np.maximum(np.arange(1, len(values) + 1) - window, 0)
+    window_sums = sums[1:] - sums[lagged]
+    window_counts = (counts[1:] - counts[lagged])[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(window_counts > 0, window_sums / window_counts, np.nan)
+
+def _goal_met(daily: np.ndarray, goals: Dict[str, float], tolerance: float) -> Dict[str, np.ndarray]:
+    """Per goal, whether each day met it: within tolerance, or for protein at least the target minus it"""
+    met = {}
+    for nutrient, target in goals.items():
+        if nutrient not in NUTRIENTS or not target or target <= 0:
+            continue
+        values = daily[:, 1 + NUTRIENTS.index(nutrient)]
+        if nutrient == "protein_g":
+            met[nutrient] = values >= target * (1 - tolerance)
+        else:
+            met[nutrient] = np.abs(values - target) <= target * tolerance
+    return met
+
+def _rounded(array: np.ndarray, digits: int = 1) -> list:
+    """JSON-ready list; NaN becomes None"""
+    rounded = np.round(array.astype(np.float64), digits)
+    return [None if value != value else value for value in rounded.tolist()]
+
+def medication_adherence(medicines: List[dict], first_day: int, days: int, offset_s: int,
+                         on_time_minutes: int = MEDICATION_ON_TIME_MINUTES) -> dict:
+    """
+    Daily doses taken per medicine ({"name", "time", "takenAt": [ISO...]}
+    like /api/medicine returns), counted from the day of the first recorded
+    intake (Medicine has no start date) or the start of the range
+    Returns per-day taken/expected counts and per-medicine rates
+    """
+    per_day_taken = np.zeros(days)
+    per_day_on_time = np.zeros(days)
+    per_day_expected = np.zeros(days)
+    summary = []
+    for medicine in medicines:
+        taken = np.array([epoch_seconds(value) for value in medicine.get("takenAt") or ()], dtype=np.int64)
+        local = taken + offset_s
+        day_index = local // DAY_S - first_day
+        start = max(int(day_index.min()), 0) if len(day_index) else 0
+        in_range = (day_index >= 0) & (day_index < days)
+        taken_days = np.unique(day_index[in_range])
+
+        scheduled = medicine.get("time")
+        on_time_days = np.empty(0, dtype=np.int64)
+        if scheduled and len(taken_days):
+            hours, minutes = scheduled.split(":")[:2]
+            minute = local[in_range] % DAY_S // 60
+            distance = np.abs(minute - (int(hours) * 60 + int(minutes)))
+            distance = np.minimum(distance, 1440 - distance)
+            on_time_days = np.unique(day_index[in_range][distance <= on_time_minutes])
+
+        expected = max(days - start, 0)
+        per_day_expected[start:] += 1
+        per_day_taken[taken_days] += 1
+        per_day_on_time[on_time_days] += 1
+        summary.append({
+            "name": medicine["name"],
+            "expected_doses": expected,
+            "taken_doses": len(taken_days),
+            "adherence": round(len(taken_days) / expected, 4) if expected else None,
+            "on_time_rate": round(len(on_time_days) / len(taken_days), 4) if scheduled and len(taken_days) else None
+        })
+    return {
+        "taken": per_day_taken,
+        "on_time": per_day_on_time,
+        "expected": per_day_expected,
+        "medicines": summary
+    }
+
+class AnalyticsEngine:
+    """
+    Per-user MealHistory and closed-day memo (LRU over users)
+    add_meals() feeds rows in; report() aggregates a range of days
+    history_factory(user_id) opens a persistent history instead (MealStores.open)
+    """
+
+    def __init__(self, max_users: int = ANALYTICS_MAX_USERS, tolerance: float = GOAL_TOLERANCE,
+                 history_factory: Optional[Callable[[str], object]] = None):
+        self.max_users = max_users
+        self.history_factory = history_factory
+        self.tolerance = tolerance
+        self._users: "OrderedDict[str, UserAnalytics]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.reports = 0
+        self.days_reused = 0
+        self.days_computed = 0
+
+    def user(self, user_id: str) -> UserAnalytics:
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                history = self.history_factory(user_id) if self.history_factory else None
+                user = self._users[user_id] = UserAnalytics(history)
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            self._users.move_to_end(user_id)
+            return user
+
+    def add_meals(self, user_id: str, timestamps: np.ndarray, values: np.ndarray, ids: Optional[np.ndarray] = None,
+                  names: Optional[List[str]] = None) -> int:
+        """Append meal rows (epoch seconds, NUTRIENTS columns); returns how many were new"""
+        user = self.user(user_id)
+        with user.lock:
+            added = user.history.extend(timestamps, values, ids, names)
+            if len(added):
+                user.forget_days(added)
+        return len(added)
+
+    def add_meal_rows(self, user_id: str, rows: List[dict]) -> int:
+        """add_meals() for Meal rows as /api/meal returns them (createdAt, kcal, macros, optional id)"""
+        if not rows:
+            return 0
+        timestamps = np.array([epoch_seconds(row["createdAt"]) for row in rows], dtype=np.int64)
+        values = np.array([[float(row.get(nutrient) or 0) for nutrient in NUTRIENTS] for row in rows], dtype=np.float32)
+        ids = hash_ids([row["id"] for row in rows]) if all(row.get("id") for row in rows) else None
+        names = [row.get("name") or "" for row in rows]
+        return self.add_meals(user_id, timestamps, values, ids, names)
+
+    def daily_sums(self, user: UserAnalytics, first_day: int, today: int, offset_s: int) -> tuple:
+        """(days, 1 + NUTRIENTS) day sums up to today, memoized for closed days; returns (sums, reused days)"""
+        days = today - first_day + 1
+        memo = user.memo.setdefault(offset_s, {})
+        sums = np.zeros((days, _COLUMNS))
+        missing = []
+        for day in range(first_day, today + 1):
+            cached = memo.get(day) if day < today else None
+            if cached is None:
+                missing.append(day)
+            else:
+                sums[day - first_day] = cached
+        if missing:
+            computed = user.history.day_sums(missing[0], missing[-1], offset_s)
+            for day in missing:
+                row = computed[day - missing[0]]
+                sums[day - first_day] = row
+                if day < today:
+                    memo[day] = row.copy()
+        self.days_reused += days - len(missing)
+        self.days_computed += len(missing)
+        return sums, days - len(missing)
+
+    def report(
+        self,
+        user_id: str,
+        days: int = 30,
+        period: str = "day",
+        goals: Optional[Dict[str, float]] = None,
+        medicines: Optional[List[dict]] = None,
+        tz_offset_minutes: int = 0,
+        rolling_days: int = 7,
+        now: Optional[float] = None
+    ) -> dict:
+        """
+        Rollups for the last `days` days up to today (local time), grouped
+        by `period`; averages are per logged day, goal adherence is the
+        share of logged days meeting each goal
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period {period!r}, expected one of {', '.join(PERIODS)}")
+        if days < 1:
+            raise ValueError("days must be at least 1")
+        goals = goals or {}
+        offset_s = tz_offset_minutes * 60
+        now = datetime.now(timezone.utc).timestamp() if now is None else now
+        today = int((now + offset_s) // DAY_S)
+        first_day = today - days + 1
+
+        user = self.user(user_id)
+        with user.lock:
+            user.forget_days(user.history.refresh())
+            daily, reused = self.daily_sums(user, first_day, today, offset_s)
+        self.reports += 1
+
+        day_numbers = np.arange(first_day, today + 1)
+        if period == "day":
+            keys = day_numbers
+        elif period == "week":
+            # Epoch day 0 was a Thursday; weeks start on Monday
+            keys = (day_numbers + 3) // 7
+        else:
+            keys = day_numbers.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        _, first_of_group, group = np.unique(keys, return_index=True, return_inverse=True)
+        groups = len(first_of_group)
+
+        logged = (daily[:, 0] > 0).astype(np.float64)
+        totals = np.zeros((groups, _COLUMNS))
+        np.add.at(totals, group, daily)
+        logged_days = np.bincount(group, weights=logged, minlength=groups)
+        calendar_days = np.bincount(group, minlength=groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            averages = np.where(logged_days[:, None] > 0, totals[:, 1:] / logged_days[:, None], np.nan)
+            macro_energy = totals[:, 2:] * MACRO_KCAL
+            ratios = macro_energy / macro_energy.sum(axis=1, keepdims=True)
+        rolling = _rolling(daily[:, 1:], logged, max(1, rolling_days))
+
+        met = _goal_met(daily, goals, self.tolerance)
+        medication = medication_adherence(medicines or [], first_day, days, offset_s)
+        taken_by_group = np.bincount(group, weights=medication["taken"], minlength=groups)
+        on_time_by_group = np.bincount(group, weights=medication["on_time"], minlength=groups)
+        expected_by_group = np.bincount(group, weights=medication["expected"], minlength=groups)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            goal_rates = {
+                nutrient: np.where(logged_days > 0, np.bincount(group, weights=flags * logged, minlength=groups) / logged_days, np.nan)
+                for nutrient, flags in met.items()
+            }
+            medication_rates = np.where(expected_by_group > 0, taken_by_group / expected_by_group, np.nan)
+            on_time_rates = np.where(taken_by_group > 0, on_time_by_group / taken_by_group, np.nan)
+
+        columns = {
+            "start": [day_string(day) for day in day_numbers[first_of_group]],
+            "days": calendar_days.tolist(),
+            "logged_days": logged_days.astype(int).tolist(),
+            "meals": totals[:, 0].astype(int).tolist(),
+            **{f"total_{nutrient}": _rounded(totals[:, 1 + i]) for i, nutrient in enumerate(NUTRIENTS)},
+            **{f"avg_{nutrient}": _rounded(averages[:, i]) for i, nutrient in enumerate(NUTRIENTS)},
+            **{f"{macro}_energy_ratio": _rounded(ratios[:, i], 3) for i, macro in enumerate(("protein", "carbs", "fat"))},
+            **{f"goal_{nutrient}_rate": _rounded(rates, 3) for nutrient, rates in goal_rates.items()},
+            "medication_adherence": _rounded(medication_rates, 3),
+            "medication_on_time_rate": _rounded(on_time_rates, 3)
+        }
+        if period == "day":
+            for i, nutrient in enumerate(NUTRIENTS):
+                columns[f"rolling_{nutrient}"] = _rounded(rolling[:, i])
+        rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+        logged_total = logged.sum()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            overall_energy = daily[:, 2:].sum(axis=0) * MACRO_KCAL
+            overall_ratios = overall_energy / overall_energy.sum()
+        summary = {
+            "days": days,
+            "logged_days": int(logged_total),
+            "meals": int(daily[:, 0].sum()),
+            **{f"avg_{nutrient}": round(float(daily[:, 1 + i].sum() / logged_total), 1) if logged_total else None
+               for i, nutrient in enumerate(NUTRIENTS)},
+            **{f"{macro}_energy_ratio": round(float(overall_ratios[i]), 3) if overall_energy.sum() else None
+               for i, macro in enumerate(("protein", "carbs", "fat"))},
+            **{f"goal_{nutrient}_rate": round(float((flags * logged).sum() / logged_total), 3) if logged_total else None
+               for nutrient, flags in met.items()},
+            "medication_adherence": round(float(medication["taken"].sum() / medication["expected"].sum()), 3)
+            if medication["expected"].sum() else None
+        }
+        return {
+            "range": {"start": day_string(first_day), "end": day_string(today), "period": period},
+            "periods": rows,
+            "summary": summary,
+            "medicines": medication["medicines"],
+            "memo": {"days_reused": reused, "days_computed": days - reused}
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            users = list(self._users.values())
+        return {
+            "users": len(users),
+            "rows": sum(len(user.history) for user in users),
+            "memo_days": sum(len(days) for user in users for days in user.memo.values()),
+            "reports": self.reports,
+            "days_reused": self.days_reused,
+            "days_computed": self.days_computed
+        }
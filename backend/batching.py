@@ -0,0 +1,150 @@
+"""
+Request batching helpers
+Packs many items into as few Gemini prompts as the token budget allows,
+splits the combined answer back out per item, and runs a micro-batching
+window so concurrent single requests can share one upstream call
+"""
+
+import os
+import re
+import json
+import asyncio
+from typing import Callable, List, Optional
+
+# Budget for one packed prompt (input side) and its answer
+BATCH_MAX_PROMPT_TOKENS = int(os.environ.get("BATCH_MAX_PROMPT_TOKENS", "8000"))
+BATCH_MAX_ITEMS_PER_PROMPT = int(os.environ.get("BATCH_MAX_ITEMS_PER_PROMPT", "20"))
+BATCH_MAX_IMAGES_PER_PROMPT = int(os.environ.get("BATCH_MAX_IMAGES_PER_PROMPT", "8"))
+# Max items accepted by one /batch request
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "100"))
+# How long a single request waits for company before going upstream (0 disables)
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", "10"))
+
+# Gemini bills each inline image as a fixed number of tokens
+IMAGE_TOKENS = 258
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for packing"""
+    return len(text) // 4 + 1
+
+def pack_items(costs: List[int], max_tokens: int, max_items: int) -> List[List[int]]:
+    """
+    Group item indices, in order, so each group stays within max_tokens and max_items
+    An item that is larger than the budget on its own still gets its own group
+    """
+    groups, current, used = [], [], 0
+    for index, cost in enumerate(costs):
+        if current and (used + cost > max_tokens or len(current) >= max_items):
+            groups.append(current)
+            current, used = [], 0
+        current.append(index)
+        used += cost
+    if current:
+        groups.append(current)
+    return groups
+
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+def parse_batch_response(response_text: str, count: int) -> List[Optional[list]]:
+    """
+    Split a packed answer of the form [{"item": 1, "dishes": [...]}, ...]
+    into one dishes list per item; items the model skipped come back as None
+    """
+    results = [None] * count
+    text = _CODE_FENCE.sub("", response_text.strip())
+
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError:
+        match = re.search(r"\[[\s\S]*\]", text)
+        if not match:
+            return results
+        try:
+            payload = json.loads(match.group())
+        except json.JSONDecodeError:
+            return results
+
+    if isinstance(payload, dict):
+        payload = payload.get("items") or payload.get("results") or []
+    if not isinstance(payload, list):
+        return results
+
+    for entry in payload:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            position = int(entry.get("item")) - 1
+        except (TypeError, ValueError):
+            continue
+        dishes = entry.get("dishes")
+        if 0 <= position < count and isinstance(dishes, list) and dishes:
+            results[position] = dishes
+    return results
+
+class MicroBatcher:
+    """
+    Collects concurrent submissions for up to window_ms (or max_items) and
+    hands them to process_batch in one call
+    process_batch(items) must return one result per item; a result that is
+    an exception is raised to that item's caller only
+    """
+
+    def __init__(self, process_batch: Callable, window_ms: float = BATCH_WINDOW_MS, max_items: int = BATCH_MAX_ITEMS_PER_PROMPT):
+        self.process_batch = process_batch
+        self.window_ms = window_ms
+        self.max_items = max_items
+        self._pending = []
+        self._timer = None
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item):
+        if self.window_ms <= 0:
+            result = (await self.process_batch([item]))[0]
+            self.batches += 1
+            self.items += 1
+            if isinstance(result, BaseException):
+                raise result
+            return result
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_ms / 1000.0, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: list):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.process_batch([item for item, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "upstream_calls_saved": self.items - self.batches
+        }
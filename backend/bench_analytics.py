@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the analytics rollups at a large meal history
+Loads synthetic meals (default 1M rows over 3 years) into the columnar
+history and times reports cold, warm (closed days memoized, only today
+rescanned) and after new meals arrive, against a per-row Python loop like
+the client-side report builds
+
+    python bench_analytics.py
+    python bench_analytics.py --rows 5000000 --years 5
+"""
+
+import sys
+import os
+import time
+import argparse
+import statistics
+from collections import defaultdict
+sys.path.append(os.path.dirname(__file__))
+
+import numpy as np
+
+from analytics import AnalyticsEngine, DAY_S, NUTRIENTS
+
+RUNS = 5
+GOALS = {"kcal": 2000, "protein_g": 100, "carbs_g": 250, "fat_g": 70}
+
+def synthetic_meals(rows: int, years: float, now: float, seed: int = 0) -> tuple:
+    """rows meals spread over the last `years` years, sorted by time"""
+    rng = np.random.default_rng(seed)
+    span = int(years * 365 * DAY_S)
+    timestamps = np.sort(rng.integers(int(now) - span, int(now), size=rows))
+    values = np.column_stack([
+        rng.normal(600, 200, rows).clip(50),
+        rng.normal(30, 10, rows).clip(0),
+        rng.normal(70, 25, rows).clip(0),
+        rng.normal(22, 8, rows).clip(0)
+    ]).astype(np.float32)
+    return timestamps, values
+
+def synthetic_medicines(days: int, now: float, seed: int = 1) -> list:
+    """Two daily medicines taken on most days"""
+    rng = np.random.default_rng(seed)
+    medicines = []
+    for name, hour in (("Synthroid", 7), ("Lipitor", 21)):
+        taken = []
+        for day in range(days):
+            if rng.random() < 0.85:
+                moment = now - day * DAY_S + (hour - 12) * 3600 + int(rng.normal(0, 2400))
+                taken.append(time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(moment)))
+        medicines.append({"name": name, "time": f"{hour:02d}:00", "takenAt": taken})
+    return medicines
+
+def python_report(timestamps: list, values: list, now: float, days: int) -> dict:
+    """Per-row loop: filter to the range, then sum per day"""
+    first = now - days * DAY_S
+    totals = defaultdict(lambda: [0, 0.0, 0.0, 0.0, 0.0])
+    for timestamp, row in zip(timestamps, values):
+        if first <= timestamp < now:
+            day = totals[int(timestamp // DAY_S)]
+            day[0] += 1
+            for i in range(len(NUTRIENTS)):
+                day[i + 1] += row[i]
+    return totals
+
+def median_ms(function, runs: int = RUNS) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="meal rows in the history")
+    parser.add_argument("--years", type=float, default=3, help="years the history spans")
+    args = parser.parse_args()
+
+    now = time.time()
+    timestamps, values = synthetic_meals(args.rows, args.years, now)
+    history_days = int(args.years * 365)
+    medicines = synthetic_medicines(min(history_days, 365), now)
+
+    engine = AnalyticsEngine()
+    start = time.perf_counter()
+    engine.add_meals("demo", timestamps, values)
+    load_ms = (time.perf_counter() - start) * 1000
+    print(f"\n📊 Analytics benchmark: {args.rows:,} meals over {history_days} days "
+          f"(load {load_ms:.1f}ms, {timestamps.nbytes + values.nbytes >> 20} MB of columns)\n")
+
+    reports = [
+        ("month by day", {"days": 30, "period": "day"}),
+        ("year by month", {"days": 365, "period": "month"}),
+        ("history by week", {"days": history_days, "period": "week"})
+    ]
+    python_rows = (timestamps.tolist(), values.tolist())
+    print(f"{'report':<16} {'python loop':>12} {'cold':>9} {'warm':>9} {'+3 meals':>9}  days reused")
+    for label, options in reports:
+        python_ms = median_ms(lambda: python_report(*python_rows, now, options["days"]), runs=1)
+
+        def run():
+            return engine.report("demo", goals=GOALS, medicines=medicines, now=now, **options)
+
+        # Cold: a fresh memo for every run
+        cold = []
+        for _ in range(RUNS):
+            engine.user("demo").memo.clear()
+            started = time.perf_counter()
+            run()
+            cold.append((time.perf_counter() - started) * 1000)
+        warm_ms = median_ms(run)
+
+        def append_then_run():
+            engine.add_meals("demo", np.full(3, int(now) - 60), np.full((3, len(NUTRIENTS)), 100, dtype=np.float32))
+            return run()
+        appended_ms = median_ms(append_then_run)
+        reused = run()["memo"]["days_reused"]
+        print(f"{label:<16} {python_ms:>10.1f}ms {statistics.median(cold):>7.2f}ms {warm_ms:>7.2f}ms {appended_ms:>7.2f}ms  "
+              f"{reused}/{options['days']}")
+
+if __name__ == "__main__":
+    main()
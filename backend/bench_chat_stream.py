@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Time-to-first-token benchmark for the chat endpoints
+Compares /nutrition-chat (full answer) with /nutrition-chat/stream (SSE)
+against a fake model that emits tokens at a steady rate
+"""
+
+import sys
+import os
+import time
+import asyncio
+import statistics
+sys.path.append(os.path.dirname(__file__))
+
+import ml
+from ml import ChatRequest
+
+FIRST_CHUNK_DELAY_S = 0.4
+CHUNK_DELAY_S = 0.05
+CHUNKS = 20
+RUNS = 5
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+class StreamingFakeModel:
+    """Stands in for genai.GenerativeModel with a token-by-token answer"""
+
+    def _chunks(self):
+        time.sleep(FIRST_CHUNK_DELAY_S)
+        for i in range(CHUNKS):
+            if i:
+                time.sleep(CHUNK_DELAY_S)
+            yield FakeChunk(f"word{i} ")
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        if stream:
+            return self._chunks()
+        return FakeChunk("".join(chunk.text for chunk in self._chunks()))
+
+async def time_blocking(request: ChatRequest) -> float:
+    start = time.perf_counter()
+    await ml.nutrition_chat(request)
+    return time.perf_counter() - start
+
+async def time_streaming(request: ChatRequest) -> tuple:
+    """Return (first meta event, first token, last event) times"""
+    start = time.perf_counter()
+    first_event = first_token = None
+    response = await ml.nutrition_chat_stream(request)
+    async for event in response.body_iterator:
+        now = time.perf_counter() - start
+        if first_event is None:
+            first_event = now
+        if first_token is None and event.startswith("event: token"):
+            first_token = now
+    return first_event, first_token, time.perf_counter() - start
+
+async def main():
+    ml.gemini_model = StreamingFakeModel()
+    request = ChatRequest(message="How much protein is in an egg?")
+
+    blocking = [await time_blocking(request) for _ in range(RUNS)]
+    streaming = [await time_streaming(request) for _ in range(RUNS)]
+
+    print(f"\n⏱️  Chat time-to-first-token ({RUNS} runs, {CHUNKS} chunks)\n")
+    print(f"/nutrition-chat         first byte {statistics.median(blocking) * 1000:7.1f}ms (whole answer)")
+    print(f"/nutrition-chat/stream  meta event {statistics.median(s[0] for s in streaming) * 1000:7.1f}ms")
+    print(f"                        first token {statistics.median(s[1] for s in streaming) * 1000:6.1f}ms")
+    print(f"                        complete   {statistics.median(s[2] for s in streaming) * 1000:7.1f}ms")
+
+    ml.shutdown_executor()
+    return statistics.median(s[1] for s in streaming) < statistics.median(blocking)
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
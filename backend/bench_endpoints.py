@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the Gemini-backed endpoints
+Swaps the Gemini models for fake_gemini.FakeGenerativeModel, drives each
+endpoint through the full ASGI stack at several concurrency levels and
+writes throughput, p50/p95/p99 latency and process memory (including the
+peak memory of single requests) as JSON, so two builds can be compared
+with a plain diff
+
+    python bench_endpoints.py --concurrency 1,8,32 --requests 200 --output before.json
+    python bench_endpoints.py --latency-ms 1200 --error-rate 0.02
+    python bench_endpoints.py --endpoints infer --image-size 4032x3024
+    python bench_endpoints.py --record answers.jsonl   # real API, needs GEMINI_API_KEY
+    python bench_endpoints.py --replay answers.jsonl
+"""
+
+import sys
+import os
+import io
+import glob
+import json
+import time
+import random
+import ctypes
+import asyncio
+import argparse
+import platform
+import resource
+import itertools
+import subprocess
+sys.path.append(os.path.dirname(__file__))
+
+import httpx
+import numpy as np
+from PIL import Image
+
+import ml
+from text_cache import TextResponseCache
+from fake_gemini import FakeGenerativeModel, RecordingModel, load_recording, save_recording
+
+ENDPOINTS = ["infer", "analyze-text", "quick-log", "nutrition-chat", "suggest-meals"]
+
+MEALS = [
+    "homemade vegetable lasagna", "chicken tikka masala with naan", "poke bowl with salmon and avocado",
+    "grandma's beef stew", "pad thai with tofu", "quinoa salad with feta and olives",
+    "breakfast burrito with eggs and chorizo", "mushroom risotto", "turkey club sandwich and chips"
+]
+QUESTIONS = [
+    "How much protein should I eat after a workout?",
+    "Is oatmeal a good breakfast for weight loss?",
+    "What are good sources of iron for vegetarians?",
+    "How many calories are in a glass of orange juice?"
+]
+
+def rss_mb() -> float:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+M_MMAP_THRESHOLD = -3
+
+def pin_mmap_threshold(size: int = 128 * 1024):
+    """
+    Keep glibc serving large blocks (decoded images) with mmap, so they are
+    unmapped on free instead of lingering in thread arenas where RSS deltas
+    can't see them being reused (glibc only)
+    """
+    try:
+        ctypes.CDLL("libc.so.6").mallopt(M_MMAP_THRESHOLD, size)
+    except (OSError, AttributeError):
+        pass
+
+def release_free_memory():
+    """Hand freed heap pages back to the OS so RSS deltas measure live memory (glibc only)"""
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def reset_peak_rss() -> bool:
+    """Reset the kernel's RSS high-water mark to the current RSS (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def high_water_mb() -> float:
+    """RSS high-water mark since the last reset_peak_rss()"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 2**10, 1)
+    return peak_rss_mb()
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def synthetic_photo(seed: int, size=(1600, 1200)) -> bytes:
+    """A phone-photo sized JPEG with smooth color fields and sensor-like noise"""
+    rng = np.random.default_rng(seed)
+    height, width = size[1], size[0]
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    channels = [
+        127 + 100 * np.sin(x / rng.uniform(60, 300) + rng.uniform(0, 6)) * np.cos(y / rng.uniform(60, 300))
+        for _ in range(3)
+    ]
+    pixels = np.stack(channels, axis=-1) + rng.normal(0, 12, (height, width, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def load_images(directory: str, count: int, size=(1600, 1200)) -> list:
+    """Sample uploads: files from `directory`, or synthetic photos"""
+    if directory:
+        paths = sorted(p for p in glob.glob(os.path.join(directory, "*")) if p.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+        if not paths:
+            sys.exit(f"No images found in {directory}")
+        return [open(path, "rb").read() for path in paths]
+    return [synthetic_photo(seed, size) for seed in range(min(count, 8))]
+
+class Workload:
+    """Request bodies for each endpoint; every request is distinct so single-flight can't merge them"""
+
+    def __init__(self, images: list):
+        self.images = images
+        self._ids = itertools.count()
+
+    def request(self, endpoint: str) -> dict:
+        n = next(self._ids)
+        if endpoint == "infer":
+            # Trailing bytes after the JPEG end marker make each upload unique without changing the pixels
+            data = self.images[n % len(self.images)] + f"#{n}".encode()
+            return {"files": {"file": (f"meal{n}.jpg", data, "image/jpeg")}}
+        if endpoint in ("analyze-text", "quick-log"):
+            return {"json": {"description": f"{MEALS[n % len(MEALS)]} #{n}"}}
+        return {"json": {"message": f"{QUESTIONS[n % len(QUESTIONS)]} ({n})"}}
+
+def percentile(values: list, p: float) -> float:
+    return round(float(np.percentile(values, p)), 1) if values else None
+
+async def request_memory(client: httpx.AsyncClient, workload: Workload, endpoint: str, samples: int) -> dict:
+    """
+    Peak memory of single requests: sent one at a time, each with the RSS
+    high-water mark reset first, so the rise over the starting RSS is what
+    that request needed at its peak
+    """
+    peaks = []
+    for _ in range(samples):
+        body = workload.request(endpoint)
+        release_free_memory()
+        before = rss_mb()
+        if not reset_peak_rss():
+            return None
+        await client.post(f"/{endpoint}", **body)
+        # Trimming folds memory freed but still resident during the request into the mark
+        release_free_memory()
+        peaks.append(max(0.0, high_water_mb() - before))
+    return {"median": percentile(peaks, 50), "max": round(max(peaks), 1)} if peaks else None
+
+async def run_level(client: httpx.AsyncClient, workload: Workload, endpoint: str, concurrency: int, requests: int) -> dict:
+    """Send `requests` calls with `concurrency` in flight and summarize them"""
+    latencies, statuses = [], {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            body = workload.request(endpoint)
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"/{endpoint}", **body)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    release_free_memory()
+    rss_before = rss_mb()
+    tracking = reset_peak_rss()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    peak = high_water_mb() if tracking else peak_rss_mb()
+
+    ok = statuses.get("200", 0)
+    return {
+        "endpoint": f"/{endpoint}",
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": ok,
+        "errors": {status: count for status, count in sorted(statuses.items()) if status != "200"},
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": round(max(latencies), 1) if latencies else None
+        },
+        # peak: high-water mark during this level (process lifetime where it can't be reset)
+        "rss_mb": {"before": rss_before, "after": rss_mb(), "peak": peak}
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated subset of " + ",".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint and level")
+    parser.add_argument("--latency-ms", type=float, default=800, help="median fake upstream latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="log-normal spread of the latency (0 = fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--images", help="directory of sample photos for /infer (default: synthetic)")
+    parser.add_argument("--image-size", default="1600x1200", help="WIDTHxHEIGHT of the synthetic photos")
+    parser.add_argument("--memory-samples", type=int, default=5, help="single requests per endpoint measured for peak memory (0 = skip)")
+    parser.add_argument("--cache", action="store_true", help="keep the response caches on (default: every call goes upstream)")
+    parser.add_argument("--replay", help="answer from a JSONL recording, canned answers for anything missing")
+    parser.add_argument("--record", help="call the real Gemini API and save its answers to this JSONL file")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+async def main():
+    args = parse_args()
+    endpoints = [e.strip().lstrip("/") for e in args.endpoints.split(",") if e.strip()]
+    levels = [int(level) for level in args.concurrency.split(",")]
+    random.seed(args.seed)
+    pin_mmap_threshold()
+    # Same setup the lifespan hook runs (food index, local model, real Gemini models for --record)
+    await ml.startup(warm=False)
+
+    if args.record:
+        if not ml.gemini_model:
+            sys.exit("--record needs a configured Gemini model (set GEMINI_API_KEY)")
+        model = RecordingModel(ml.gemini_model)
+        vision_model = RecordingModel(ml.gemini_vision_model)
+    else:
+        recorded = load_recording(args.replay) if args.replay else None
+        model = vision_model = FakeGenerativeModel(
+            latency_ms=args.latency_ms,
+            latency_sigma=args.latency_sigma,
+            error_rate=args.error_rate,
+            recorded=recorded,
+            seed=args.seed
+        )
+    ml.gemini_model = model
+    ml.gemini_vision_model = vision_model
+
+    # Nothing is persisted; without --cache every request reaches the (fake) upstream
+    ml.text_cache = TextResponseCache(path=None)
+    if ml.image_cache is not None:
+        ml.image_cache.clear()
+        ml.image_cache.path = None
+        if not args.cache:
+            # The /infer uploads share pixels, so their perceptual hashes collide
+            ml.image_cache.get = lambda image_hash: None
+
+    image_size = tuple(int(side) for side in args.image_size.lower().split("x"))
+    images = load_images(args.images, max(levels), image_size) if "infer" in endpoints else []
+    workload = Workload(images)
+    results = []
+
+    transport = httpx.ASGITransport(app=ml.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for endpoint in endpoints:
+            memory = await request_memory(client, workload, endpoint, args.memory_samples) if args.memory_samples else None
+            if memory:
+                print(f"{'/' + endpoint:<16} peak per request {memory['median']}MB (max {memory['max']}MB)", file=sys.stderr)
+            for concurrency in levels:
+                result = await run_level(client, workload, endpoint, concurrency, args.requests)
+                result["request_peak_mb"] = memory
+                results.append(result)
+                print(
+                    f"{result['endpoint']:<16} c={concurrency:<3} {result['throughput_rps']:>8} req/s  "
+                    f"p50 {result['latency_ms']['p50']}ms  p95 {result['latency_ms']['p95']}ms  "
+                    f"p99 {result['latency_ms']['p99']}ms  errors {result['errors'] or 0}  "
+                    f"rss {result['rss_mb']['after']}MB",
+                    file=sys.stderr
+                )
+
+    if args.record:
+        recorded = {**model.recorded, **vision_model.recorded}
+        save_recording(recorded, args.record)
+        print(f"📼 Recorded {len(recorded)} answers to {args.record}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "upstream": "gemini (recording)" if args.record else "fake",
+            "latency_ms": args.latency_ms,
+            "latency_sigma": args.latency_sigma,
+            "error_rate": args.error_rate,
+            "replay": args.replay,
+            "cache": args.cache,
+            "image_size": args.image_size if not args.images else None,
+            "requests_per_level": args.requests,
+            "upstream_calls": getattr(model, "calls", None),
+            "governor": ml.governor.stats()["rejected"]
+        },
+        "results": results
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    ml.shutdown_executor()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark the local ONNX food model tier
+Reports images/sec and p50/p99 latency for single-image and batched inference
+"""
+
+import sys
+import os
+import io
+import time
+import asyncio
+sys.path.append(os.path.dirname(__file__))
+
+import numpy as np
+from PIL import Image
+
+from food_index import FoodIndex
+from local_model import load_local_classifier, LOCAL_MODEL_BATCH_SIZE, LOCAL_MODEL_WORKERS
+
+SINGLE_RUNS = 200
+BATCH_IMAGES = 256
+
+def make_photos(count: int) -> list:
+    """Random 1024x768 JPEGs, the size /infer hands to the local tier"""
+    rng = np.random.default_rng(0)
+    photos = []
+    for _ in range(count):
+        pixels = rng.integers(0, 256, size=(768, 1024, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+        photos.append(buffer.getvalue())
+    return photos
+
+def percentile_ms(samples: list, q: float) -> float:
+    return float(np.percentile(np.array(samples) * 1000, q))
+
+async def bench_single(classifier, photos: list):
+    latencies = []
+    start = time.perf_counter()
+    for i in range(SINGLE_RUNS):
+        t0 = time.perf_counter()
+        await classifier.classify_async(photos[i % len(photos)])
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    print(f"single   {SINGLE_RUNS / elapsed:8.1f} img/s   "
+          f"p50 {percentile_ms(latencies, 50):7.2f}ms   p99 {percentile_ms(latencies, 99):7.2f}ms")
+
+async def bench_batch(classifier, photos: list):
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, BATCH_IMAGES, LOCAL_MODEL_BATCH_SIZE * LOCAL_MODEL_WORKERS):
+        chunk = [photos[j % len(photos)] for j in range(i, i + LOCAL_MODEL_BATCH_SIZE * LOCAL_MODEL_WORKERS)]
+        t0 = time.perf_counter()
+        await classifier.classify_batch_async(chunk)
+        # Per-image latency inside a batch is the time until the whole batch returns
+        latencies.extend([time.perf_counter() - t0] * len(chunk))
+    elapsed = time.perf_counter() - start
+
+    print(f"batched  {len(latencies) / elapsed:8.1f} img/s   "
+          f"p50 {percentile_ms(latencies, 50):7.2f}ms   p99 {percentile_ms(latencies, 99):7.2f}ms   "
+          f"(batch {LOCAL_MODEL_BATCH_SIZE} x {LOCAL_MODEL_WORKERS} workers)")
+
+async def main():
+    classifier = load_local_classifier(FoodIndex())
+    if classifier is None:
+        print("❌ Local model unavailable: install onnxruntime and run download_models.py")
+        return False
+
+    photos = make_photos(16)
+    # Warm up the session so graph optimization isn't timed
+    await classifier.classify_batch_async(photos[:4])
+
+    print(f"\n🏎️  Local model benchmark (input {classifier.input_size}px)\n")
+    await bench_single(classifier, photos)
+    await bench_batch(classifier, photos)
+    classifier.close()
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
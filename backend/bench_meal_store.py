@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the memory-mapped meal store at a large history
+Writes synthetic meals (default 1M rows over 3 years) in sync-sized
+batches, then times reopening the store, time-range slices, day sums next
+to the in-memory MealHistory, late-row appends and a compaction
+
+    python bench_meal_store.py
+    python bench_meal_store.py --rows 5000000 --batch 5000
+"""
+
+import sys
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+sys.path.append(os.path.dirname(__file__))
+
+import numpy as np
+
+from analytics import MealHistory, DAY_S, NUTRIENTS, hash_ids
+from bench_analytics import synthetic_meals
+from meal_store import MealStore
+
+RUNS = 5
+DISHES = ["Oatmeal with berries", "Grilled chicken salad", "Salmon rice bowl", "Greek yogurt", "Lentil soup",
+          "Turkey sandwich", "Pasta bolognese", "Banana", "Protein shake", "Beef stir fry"]
+
+def median_ms(function, runs: int = RUNS) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="meal rows in the history")
+    parser.add_argument("--years", type=float, default=3, help="years the history spans")
+    parser.add_argument("--batch", type=int, default=5000, help="rows per append (MEAL_SYNC_BATCH_ROWS)")
+    args = parser.parse_args()
+
+    now = time.time()
+    timestamps, values = synthetic_meals(args.rows, args.years, now)
+    ids = hash_ids([f"meal-{i}" for i in range(args.rows)])
+    names = [DISHES[i % len(DISHES)] for i in range(args.rows)]
+    path = tempfile.mkdtemp(prefix="meal_store_")
+    try:
+        store = MealStore(path)
+        start = time.perf_counter()
+        for first in range(0, args.rows, args.batch):
+            batch = slice(first, first + args.batch)
+            store.extend(timestamps[batch], values[batch], ids[batch], names[batch])
+        write_ms = (time.perf_counter() - start) * 1000
+        stats = store.stats()
+        print(f"\n🗄️ Meal store benchmark: {args.rows:,} meals in batches of {args.batch:,} "
+              f"({write_ms:.0f}ms to write, {stats['bytes'] >> 20} MB on disk)\n")
+
+        reopen_ms = median_ms(lambda: MealStore(path))
+        history = MealHistory()
+        load_ms = median_ms(lambda: MealHistory().extend(timestamps, values), runs=1)
+        history.extend(timestamps, values)
+        print(f"{'open (mmap)':<28} {reopen_ms:>8.2f}ms")
+        print(f"{'load into MealHistory':<28} {load_ms:>8.2f}ms\n")
+
+        today = int(now // DAY_S)
+        print(f"{'range':<12} {'slice':>9} {'day sums':>10} {'in memory':>10}")
+        for label, days in (("month", 30), ("year", 365), ("history", int(args.years * 365))):
+            first_day = today - days + 1
+            slice_ms = median_ms(lambda: store.range(first_day * DAY_S, (today + 1) * DAY_S))
+            sums_ms = median_ms(lambda: store.day_sums(first_day, today, 0))
+            memory_ms = median_ms(lambda: history.day_sums(first_day, today, 0))
+            print(f"{label:<12} {slice_ms:>7.3f}ms {sums_ms:>8.3f}ms {memory_ms:>8.3f}ms")
+
+        # Late rows (a week back) go to the tail until compaction merges them
+        late = int(now) - 7 * DAY_S
+        late_ms = median_ms(lambda: store.extend(np.full(10, late), np.full((10, len(NUTRIENTS)), 100, dtype=np.float32)))
+        tail_sums_ms = median_ms(lambda: store.day_sums(today - 29, today, 0))
+        compact_ms = median_ms(store.compact, runs=1)
+        print(f"\n{'append 10 late rows':<28} {late_ms:>8.2f}ms")
+        print(f"{'month day sums with tail':<28} {tail_sums_ms:>8.3f}ms")
+        print(f"{'compaction':<28} {compact_ms:>8.2f}ms")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the cross-worker shared state: cache hit rate and throughput
+from 1 to N worker processes
+Each worker answers Zipf-distributed requests (a few popular meals, a long
+tail), paying a simulated upstream call on every miss. Per-worker caches
+(what each uvicorn worker had before) are compared with SharedState, then
+every setup is run again by fresh processes to show a restart
+
+    python bench_shared_state.py
+    python bench_shared_state.py --workers 1 2 4 8 --requests 500 --latency-ms 50
+"""
+
+import sys
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+sys.path.append(os.path.dirname(__file__))
+
+from shared_state import SharedState
+
+def zipf_keys(count: int, keys: int, skew: float, seed: int) -> list:
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) ** skew for rank in range(keys)]
+    return [f"meal-{key}" for key in rng.choices(range(keys), weights=weights, k=count)]
+
+def serve(args, worker: int, path, results):
+    """One worker: look up each request, call "upstream" and store the answer on a miss"""
+    local = {}
+    shared = SharedState(path) if path else None
+    hits = 0
+    start = time.perf_counter()
+    for key in zipf_keys(args.requests, args.keys, args.skew, seed=worker * 7919 + args.round):
+        answer = shared.get("bench", key) if shared else local.get(key)
+        if answer is not None:
+            hits += 1
+            continue
+        time.sleep(args.latency_ms / 1000)
+        answer = {"dishes": [{"name": key, "kcal": 500}]}
+        if shared:
+            shared.put("bench", key, answer, 3600)
+        else:
+            local[key] = answer
+    results.put((hits, time.perf_counter() - start))
+    if shared:
+        shared.close()
+
+def run(args, workers: int, path) -> tuple:
+    """(hit rate, requests per second) of `workers` processes running at once"""
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=serve, args=(args, worker, path, results)) for worker in range(workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    total = workers * args.requests
+    return sum(hits for hits, _ in outcomes) / total, total / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker process counts")
+    parser.add_argument("--requests", type=int, default=400, help="requests per worker")
+    parser.add_argument("--keys", type=int, default=2000, help="distinct requests")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of request popularity")
+    parser.add_argument("--latency-ms", type=float, default=20, help="simulated upstream call on a miss")
+    args = parser.parse_args()
+
+    print(f"\n🔁 Shared state benchmark: {args.requests} requests per worker over {args.keys} keys "
+          f"(Zipf {args.skew}), {args.latency_ms:.0f}ms per upstream call\n")
+    print(f"{'workers':>7}  {'cache':<11} {'hit rate':>9} {'req/s':>8}   {'after restart':>13} {'req/s':>8}")
+    for workers in args.workers:
+        root = tempfile.mkdtemp(prefix="shared_state_")
+        try:
+            for label, path in (("per-worker", None), ("shared", os.path.join(root, "state.sqlite3"))):
+                args.round = 0
+                hit_rate, throughput = run(args, workers, path)
+                # Fresh processes with new request streams: per-worker caches start cold again
+                args.round = 1
+                restart_hit_rate, restart_throughput = run(args, workers, path)
+                print(f"{workers:>7}  {label:<11} {hit_rate:>8.1%} {throughput:>8.0f}   "
+                      f"{restart_hit_rate:>12.1%} {restart_throughput:>8.0f}")
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
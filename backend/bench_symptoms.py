@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the chat symptom/topic detector
+Grows the bundled lexicon with synthetic terms and times one detect() per
+message against the keyword loop it replaced (a substring test per term);
+the automaton's cost should stay flat while the loop's grows with the lexicon
+
+    python bench_symptoms.py
+    python bench_symptoms.py --sizes 1000,10000,50000 --runs 2000
+"""
+
+import sys
+import os
+import time
+import random
+import argparse
+import statistics
+sys.path.append(os.path.dirname(__file__))
+
+from symptom_detector import SymptomDetector, load_lexicon
+
+MESSAGES = [
+    "How much protein is in an egg?",
+    "I have chest pain after eating eggs",
+    "No nausea or vomiting, but my stomach hurts after dairy and I'm worried it's lactose intolerance",
+    "Is keto good for weight loss if I'm prediabetic and my blood pressure is a bit high?",
+    "I've had really bad bloating and gas for weeks, it won't go away even on a low fodmap diet",
+    "My throat feels like it is closing after I ate peanuts at lunch",
+    "What should I eat before a marathon? I usually get cramps and feel dizzy around mile 18",
+    "I'm pregnant and I don't have much appetite, which vitamins and how much iron should I take?",
+    "Can I drink coffee with my medication, I'm on metformin for type 2 diabetes",
+    "Lately I'm tired all the time, my hair is thinning and I bruise easily, could it be anemia or my thyroid?"
+]
+
+_SYLLABLES = ["ka", "lo", "mi", "ter", "zu", "pha", "ren", "dol", "xi", "bor", "tan", "sel", "qui", "vo", "nar"]
+
+def synthetic_rows(count: int, seed: int = 0) -> list:
+    """count made-up one to three word terms, grouped ten to an entry"""
+    rng = random.Random(seed)
+    rows = []
+    for group in range(0, count, 10):
+        terms = []
+        for _ in range(min(10, count - group)):
+            words = [
+                "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+                for _ in range(rng.randint(1, 3))
+            ]
+            terms.append(" ".join(words))
+        rows.append((f"synthetic {group // 10}", rng.choice(["symptom", "topic"]), "low", terms))
+    return rows
+
+def keyword_terms(rows: list) -> list:
+    return [term.lower() for _, _, _, terms in rows for term in terms]
+
+def time_per_message_us(function, runs: int) -> float:
+    """Median over five rounds of the mean time per message"""
+    rounds = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for i in range(runs):
+            function(MESSAGES[i % len(MESSAGES)])
+        rounds.append((time.perf_counter() - start) / runs * 1e6)
+    return statistics.median(rounds)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,2000,5000,10000,20000", help="comma-separated lexicon sizes (terms)")
+    parser.add_argument("--runs", type=int, default=1000, help="detect() calls per round")
+    args = parser.parse_args()
+
+    lexicon = load_lexicon()
+    base_terms = sum(len(terms) for _, _, _, terms in lexicon)
+    sizes = sorted({base_terms, *(int(size) for size in args.sizes.split(",") if int(size) > base_terms)})
+
+    print(f"\n🔎 Symptom detector benchmark ({len(MESSAGES)} messages, avg {statistics.mean(len(m) for m in MESSAGES):.0f} chars)\n")
+    print(f"{'terms':>8} {'states':>8} {'build ms':>9} {'detect us':>10} {'keyword loop us':>16}")
+    for size in sizes:
+        rows = lexicon + synthetic_rows(size - base_terms)
+        start = time.perf_counter()
+        detector = SymptomDetector(rows=rows)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        terms = keyword_terms(rows)
+        def keyword_loop(message):
+            lowered = message.lower()
+            return [term for term in terms if term in lowered]
+
+        detect_us = time_per_message_us(detector.detect, args.runs)
+        loop_us = time_per_message_us(keyword_loop, max(1, args.runs // 10))
+        print(f"{detector.terms:>8} {detector.stats()['states']:>8} {build_ms:>9.1f} {detect_us:>10.1f} {loop_us:>16.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Token-budgeted chat context
+The nutrition context and history the frontend sends grow with every turn;
+this keeps the recent part verbatim and folds everything older into a
+rolling summary cached per conversation, so the context in each prompt
+stays under a fixed token budget however long the conversation gets
+Summaries only move forward in steps (when the verbatim tail has filled
+its share of the budget), so consecutive turns share the same prompt prefix
+"""
+
+import os
+import re
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+# Context token budget per endpoint
+CHAT_CONTEXT_TOKENS = int(os.environ.get("CHAT_CONTEXT_TOKENS", "800"))
+SUGGEST_CONTEXT_TOKENS = int(os.environ.get("SUGGEST_CONTEXT_TOKENS", "400"))
+# Part of the budget reserved for the summary of older context
+CHAT_SUMMARY_SHARE = float(os.environ.get("CHAT_SUMMARY_SHARE", "0.4"))
+# Conversations whose rolling summary is kept
+CHAT_SUMMARY_CACHE_SIZE = int(os.environ.get("CHAT_SUMMARY_CACHE_SIZE", "1024"))
+
+CONTEXT_BUDGETS = {"chat": CHAT_CONTEXT_TOKENS, "suggest": SUGGEST_CONTEXT_TOKENS}
+
+# Words cost about one token per 4 letters, numbers one per 3 digits, punctuation one each
+_TOKEN_PIECES = re.compile(r"[^\W\d_]+|\d+|[^\w\s]")
+_SEGMENT_BREAK = re.compile(r"\n+|(?<=[.!?])\s+")
+# Lines worth keeping when summarizing without the model
+_FACT_WORDS = re.compile(
+    r"allerg|intoleran|vegan|vegetarian|halal|kosher|gluten|diabet|pregnan|medication|"
+    r"goal|target|limit|budget|avoid|condition|blood|weight",
+    re.IGNORECASE
+)
+
+def count_tokens(text: str) -> int:
+    """Local token estimate, rounded up so budgets hold against the real tokenizer"""
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        if piece[0].isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif piece[0].isalpha():
+            tokens += (len(piece) + 3) // 4
+        else:
+            tokens += 1
+    return tokens
+
+def truncate_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """Cut text at a word boundary to fit max_tokens, from the front or (keep_end) the back"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    if keep_end:
+        words.reverse()
+    kept, used = [], 0
+    for word in words:
+        cost = count_tokens(word)
+        if used + cost > max_tokens:
+            break
+        kept.append(word)
+        used += cost
+    if keep_end:
+        kept.reverse()
+    return " ".join(kept)
+
+def split_segments(text: str) -> list:
+    """(start, end) offsets of the lines (or sentences) of a context string"""
+    segments, start = [], 0
+    for match in _SEGMENT_BREAK.finditer(text):
+        if match.start() > start:
+            segments.append((start, match.start()))
+        start = match.end()
+    if start < len(text):
+        segments.append((start, len(text)))
+    return segments
+
+def extractive_summary(text: str, max_tokens: int) -> str:
+    """
+    Summary without the model: the segments stating facts (numbers, diets,
+    allergies, goals) first, newest first among equals, kept in original order
+    """
+    segments = [text[start:end].strip() for start, end in split_segments(text)]
+    ranked = sorted(
+        range(len(segments)),
+        key=lambda i: (bool(_FACT_WORDS.search(segments[i])) * 2 + any(c.isdigit() for c in segments[i]), i),
+        reverse=True
+    )
+    chosen, used = set(), 0
+    for i in ranked:
+        cost = count_tokens(segments[i])
+        if cost and used + cost <= max_tokens:
+            chosen.add(i)
+            used += cost
+    return "\n".join(segments[i] for i in sorted(chosen))
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+class CompactedContext:
+    """Context that fits an endpoint's budget: summary of older context plus the verbatim tail"""
+    __slots__ = ("summary", "recent", "original_tokens", "tokens")
+
+    def __init__(self, summary: str, recent: str, original_tokens: int):
+        self.summary = summary
+        self.recent = recent
+        self.original_tokens = original_tokens
+        self.tokens = count_tokens(summary) + count_tokens(recent)
+
+class SummaryEntry:
+    __slots__ = ("covered_chars", "covered_digest", "summary", "updated")
+
+    def __init__(self, covered_chars: int, covered_digest: str, summary: str):
+        self.covered_chars = covered_chars
+        self.covered_digest = covered_digest
+        self.summary = summary
+        self.updated = time.time()
+
+class ContextManager:
+    """
+    Fits ChatRequest.context into CONTEXT_BUDGETS[endpoint] tokens
+    summarize(previous_summary, new_text, max_tokens) is an optional async
+    model call that refreshes a conversation's summary in the background;
+    until it lands (or without it) an extractive summary is used
+    """
+
+    def __init__(
+        self,
+        summarize: Optional[Callable[[Optional[str], str, int], Awaitable[str]]] = None,
+        budgets: Optional[dict] = None,
+        summary_share: float = CHAT_SUMMARY_SHARE,
+        max_entries: int = CHAT_SUMMARY_CACHE_SIZE
+    ):
+        self.summarize = summarize
+        self.budgets = budgets or CONTEXT_BUDGETS
+        self.summary_share = summary_share
+        self.max_entries = max_entries
+        self._summaries: "OrderedDict[tuple, SummaryEntry]" = OrderedDict()
+        self._refreshing = {}
+        self._lock = threading.Lock()
+        self.passthrough = 0
+        self.summary_hits = 0
+        self.summary_advances = 0
+        self.summaries_generated = 0
+        self.summary_failures = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def conversation_key(self, endpoint: str, context: str, conversation_id: Optional[str]) -> tuple:
+        """Explicit id, or else the conversation's opening line (it stays put as the context grows)"""
+        if conversation_id:
+            return endpoint, "id", conversation_id
+        segments = split_segments(context)
+        opening = context[segments[0][0]:segments[0][1]] if segments else context
+        return endpoint, "opening", _digest(opening)
+
+    def compact(self, endpoint: str, context: Optional[str], conversation_id: Optional[str] = None) -> CompactedContext:
+        context = (context or "").strip()
+        budget = self.budgets.get(endpoint, CHAT_CONTEXT_TOKENS)
+        original_tokens = count_tokens(context)
+        self.tokens_in += original_tokens
+        if original_tokens <= budget:
+            self.passthrough += 1
+            self.tokens_out += original_tokens
+            return CompactedContext("", context, original_tokens)
+
+        summary_budget = int(budget * self.summary_share)
+        recent_budget = budget - summary_budget
+        key = self.conversation_key(endpoint, context, conversation_id)
+
+        with self._lock:
+            entry = self._summaries.get(key)
+            if entry is not None:
+                self._summaries.move_to_end(key)
+
+        covered = entry is not None and entry.covered_chars <= len(context) and \
+            _digest(context[:entry.covered_chars]) == entry.covered_digest
+        if covered and count_tokens(context[entry.covered_chars:]) <= recent_budget:
+            # The tail still fits: same summary as last turn, so the prompt prefix is unchanged
+            self.summary_hits += 1
+            result = CompactedContext(entry.summary, context[entry.covered_chars:].strip(), original_tokens)
+            self.tokens_out += result.tokens
+            return result
+
+        # Advance the boundary so the tail fills only half its share, leaving room for the next turns
+        boundary = self._boundary(context, recent_budget // 2)
+        aged = context[:boundary]
+        self.summary_advances += 1
+        if covered:
+            previous, new_text = entry.summary, aged[entry.covered_chars:]
+            summary = extractive_summary(previous + "\n" + new_text, summary_budget)
+        else:
+            previous, new_text = None, aged
+            summary = extractive_summary(aged, summary_budget)
+        self._store(key, SummaryEntry(boundary, _digest(aged), summary))
+        self._refresh(key, previous, new_text, boundary, aged, summary_budget)
+
+        result = CompactedContext(summary, truncate_tokens(context[boundary:].strip(), recent_budget, keep_end=True), original_tokens)
+        self.tokens_out += result.tokens
+        return result
+
+    def _boundary(self, context: str, tail_budget: int) -> int:
+        """Start offset of the longest run of trailing segments that fits tail_budget (at least the last one)"""
+        segments = split_segments(context)
+        boundary, used = segments[-1][0], 0
+        for start, end in reversed(segments):
+            used += count_tokens(context[start:end])
+            if used > tail_budget and start != segments[-1][0]:
+                break
+            boundary = start
+        return boundary
+
+    def _store(self, key: tuple, entry: SummaryEntry):
+        with self._lock:
+            self._summaries[key] = entry
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.max_entries:
+                self._summaries.popitem(last=False)
+
+    def _refresh(self, key: tuple, previous: Optional[str], new_text: str, covered_chars: int, aged: str, max_tokens: int):
+        """Replace the extractive summary with a model-written one, off the request path"""
+        if self.summarize is None or key in self._refreshing:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        async def run():
+            try:
+                summary = truncate_tokens((await self.summarize(previous, new_text, max_tokens) or "").strip(), max_tokens)
+                if summary:
+                    current = self._summaries.get(key)
+                    # Only if no later turn has moved the boundary in the meantime
+                    if current is not None and current.covered_chars == covered_chars:
+                        self._store(key, SummaryEntry(covered_chars, _digest(aged), summary))
+                        self.summaries_generated += 1
+            except Exception as e:
+                self.summary_failures += 1
+                print(f"⚠️ Context summary failed, keeping the extractive one: {e}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = loop.create_task(run())
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self._summaries),
+            "passthrough": self.passthrough,
+            "summary_hits": self.summary_hits,
+            "summary_advances": self.summary_advances,
+            "summaries_generated": self.summaries_generated,
+            "summary_failures": self.summary_failures,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out
+        }
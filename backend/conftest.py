@@ -0,0 +1,11 @@
+"""
+pytest setup for the backend unit tests (run from backend/: python -m pytest)
+The modules import each other by plain name, so backend/ goes on sys.path
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+# Manual script against helpers ml.py no longer has, not a unit test
+collect_ignore = ["test_medical_ai.py"]
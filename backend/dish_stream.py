@@ -0,0 +1,177 @@
+"""
+Dish list parsing and validation
+Schema-constrained JSON output configs for Gemini, an incremental parser
+that emits each dish object as soon as it closes, and the one shared
+validator every endpoint uses to normalize dishes
+"""
+
+import re
+import json
+from typing import List, Optional
+
+_DISH_PROPERTIES = {
+    "name": {"type": "string"},
+    "weight_g": {"type": "integer"},
+    "kcal": {"type": "integer"},
+    "protein_g": {"type": "integer"},
+    "carbs_g": {"type": "integer"},
+    "fat_g": {"type": "integer"},
+    "confidence": {"type": "number"}
+}
+_DISH_SCHEMA = {
+    "type": "object",
+    "properties": _DISH_PROPERTIES,
+    "required": list(_DISH_PROPERTIES)
+}
+
+# generation_config values that make Gemini answer with bare JSON in our shape
+DISH_LIST_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {"type": "array", "items": _DISH_SCHEMA}
+}
+SINGLE_DISH_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": _DISH_SCHEMA
+}
+BATCH_DISH_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "item": {"type": "integer"},
+                "dishes": {"type": "array", "items": _DISH_SCHEMA}
+            },
+            "required": ["item", "dishes"]
+        }
+    }
+}
+
+_STRUCTURAL = re.compile(r'[{}"\\]')
+
+class DishStreamParser:
+    """
+    Incremental parser for a JSON array of dish objects (or one bare object)
+    feed() accepts text chunks as they stream in and returns the dishes whose
+    closing brace arrived; the scan only visits structural characters, each
+    once, and surrounding prose or code fences are skipped
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escape_pending = False
+        # Text of the top-level object currently being read
+        self._pending = ""
+
+    def feed(self, chunk: str) -> List[dict]:
+        dishes = []
+        start = 0 if self._depth else None
+        escaped_at = 0 if self._escape_pending else -1
+        self._escape_pending = False
+
+        for match in _STRUCTURAL.finditer(chunk):
+            i = match.start()
+            char = match.group()
+
+            if self._in_string:
+                if i == escaped_at:
+                    continue
+                if char == "\\":
+                    escaped_at = i + 1
+                    self._escape_pending = escaped_at == len(chunk)
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = self._depth > 0
+            elif char == "{":
+                if self._depth == 0:
+                    start = i
+                    self._pending = ""
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    text = self._pending + chunk[start:i + 1]
+                    self._pending = ""
+                    start = None
+                    try:
+                        value = json.loads(text)
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(value, dict):
+                        dishes.append(value)
+
+        if self._depth:
+            self._pending += chunk[start:]
+        return dishes
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+def _to_number(value, default: float) -> float:
+    """Coerce model output like 150, 150.0, "150" or "150 g" to a number"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        match = _NUMBER.search(value)
+        if match:
+            return float(match.group())
+    return default
+
+def validate_dish(dish: dict, defaults: Optional[dict] = None) -> dict:
+    """
+    Normalize one model-produced dish: all fields present, integers for
+    weights and macros (never negative), confidence as a 0-100 percentage
+    """
+    fallback = DISH_DEFAULTS if defaults is None else defaults
+    get = dish.get if isinstance(dish, dict) else {}.get
+
+    name = get("name")
+    confidence = _to_number(get("confidence"), fallback["confidence"])
+    # Models occasionally answer 85 instead of 0.85
+    if confidence > 1:
+        confidence /= 100.0
+
+    return {
+        "name": str(name) if name else fallback["name"],
+        "weight_g": max(0, int(_to_number(get("weight_g"), fallback["weight_g"]))),
+        "kcal": max(0, int(_to_number(get("kcal"), fallback["kcal"]))),
+        "protein_g": max(0, int(_to_number(get("protein_g"), fallback["protein_g"]))),
+        "carbs_g": max(0, int(_to_number(get("carbs_g"), fallback["carbs_g"]))),
+        "fat_g": max(0, int(_to_number(get("fat_g"), fallback["fat_g"]))),
+        "confidence": round(min(max(float(confidence), 0.0), 1.0) * 100, 1)
+    }
+
+DISH_DEFAULTS = {
+    "name": "Unknown Food",
+    "weight_g": 150,
+    "kcal": 200,
+    "protein_g": 10,
+    "carbs_g": 20,
+    "fat_g": 8,
+    "confidence": 0.8
+}
+
+def validate_dishes(dishes: List[dict]) -> List[dict]:
+    return [validate_dish(dish) for dish in dishes]
+
+def parse_dishes(response_text: str) -> List[dict]:
+    """
+    Dishes from a complete response
+    Schema-constrained answers are plain JSON and take the json.loads fast
+    path; anything else goes through the incremental parser in one pass
+    """
+    text = response_text.strip()
+    try:
+        value = json.loads(text)
+        if isinstance(value, list):
+            return [item for item in value if isinstance(item, dict)]
+        if isinstance(value, dict):
+            nested = value.get("dishes")
+            return [item for item in nested if isinstance(item, dict)] if isinstance(nested, list) else [value]
+    except json.JSONDecodeError:
+        pass
+    return DishStreamParser().feed(text)
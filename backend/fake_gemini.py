@@ -0,0 +1,186 @@
+"""
+Offline stand-in for google.generativeai.GenerativeModel
+Answers every prompt ml.py sends with a realistic canned (or recorded)
+response after a configurable latency, with optional injected errors, so
+endpoints can be load tested without touching the real API
+RecordingModel wraps a real model and saves its answers for later replay
+"""
+
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from typing import Optional
+
+BATCH_PROMPT = re.compile(r"each of the following (\d+)")
+
+CANNED_DISHES = [
+    {"name": "White Rice", "weight_g": 200, "kcal": 260, "protein_g": 5, "carbs_g": 56, "fat_g": 1, "confidence": 0.9},
+    {"name": "Grilled Chicken", "weight_g": 150, "kcal": 248, "protein_g": 46, "carbs_g": 0, "fat_g": 5, "confidence": 0.88}
+]
+CANNED_SUGGESTIONS = [
+    {"name": "Greek Yogurt Bowl", "description": "Yogurt with berries and oats", "estimated_kcal": 350, "protein_g": 25, "carbs_g": 40, "fat_g": 8},
+    {"name": "Salmon and Quinoa", "description": "Baked salmon with quinoa and greens", "estimated_kcal": 520, "protein_g": 38, "carbs_g": 45, "fat_g": 18},
+    {"name": "Lentil Soup", "description": "Red lentils, carrots and cumin", "estimated_kcal": 410, "protein_g": 24, "carbs_g": 60, "fat_g": 6}
+]
+CANNED_CHAT = (
+    "A large egg has about 6 grams of protein and 70 calories. Pairing eggs with "
+    "whole grains and vegetables makes a balanced breakfast. If you have specific "
+    "health concerns, please check with a healthcare professional."
+)
+
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, response_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = response_tokens
+        self.total_token_count = prompt_tokens + response_tokens
+
+class FakeResponse:
+    def __init__(self, text: str, usage: Optional[FakeUsage] = None):
+        self.text = text
+        self.usage_metadata = usage
+
+class FakeUpstreamError(Exception):
+    """Injected upstream failure"""
+
+def prompt_key(contents) -> str:
+    """Stable key for a generate_content payload (text parts and image bytes)"""
+    digest = hashlib.sha256()
+    for part in contents if isinstance(contents, (list, tuple)) else [contents]:
+        if isinstance(part, dict):
+            digest.update(part.get("data", b"") if isinstance(part.get("data"), bytes) else str(part).encode())
+        else:
+            digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def canned_response(contents) -> str:
+    """Answer in the shape the prompt asks for"""
+    prompt = contents if isinstance(contents, str) else next((p for p in contents if isinstance(p, str)), "")
+    batch = BATCH_PROMPT.search(prompt)
+    if batch:
+        return json.dumps([{"item": i, "dishes": CANNED_DISHES[:1]} for i in range(1, int(batch.group(1)) + 1)])
+    if "single JSON object" in prompt:
+        return json.dumps(CANNED_DISHES[0])
+    if "JSON array of strings" in prompt:
+        count = len(re.findall(r"^\d+\. ", prompt, re.MULTILINE))
+        return json.dumps(["A balanced, satisfying option that fits what you have left today."] * count)
+    if "meal ideas" in prompt:
+        return json.dumps(CANNED_SUGGESTIONS)
+    if "nutrition information" in prompt:
+        return json.dumps(CANNED_DISHES)
+    return CANNED_CHAT
+
+class FakeGenerativeModel:
+    """
+    Drop-in for genai.GenerativeModel (generate_content, including stream=True)
+    Latency is log-normal around latency_ms with spread latency_sigma
+    (0 = fixed); error_rate of calls raise FakeUpstreamError; recorded
+    answers (prompt_key -> text) take precedence over canned ones
+    """
+
+    def __init__(
+        self,
+        model_name: str = "fake",
+        latency_ms: float = 800,
+        latency_sigma: float = 0.4,
+        error_rate: float = 0.0,
+        recorded: Optional[dict] = None,
+        stream_chunks: int = 8,
+        seed: Optional[int] = None
+    ):
+        self.model_name = model_name
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.recorded = recorded or {}
+        self.stream_chunks = max(1, stream_chunks)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.replayed = 0
+
+    def _latency_s(self) -> tuple:
+        """(latency in seconds, whether this call fails) for the next call"""
+        with self._lock:
+            self.calls += 1
+            jitter = self._random.lognormvariate(0, self.latency_sigma) if self.latency_sigma > 0 else 1.0
+            failed = self._random.random() < self.error_rate
+        return self.latency_ms * jitter / 1000.0, failed
+
+    def _answer(self, contents) -> str:
+        text = self.recorded.get(prompt_key(contents))
+        if text is not None:
+            self.replayed += 1
+            return text
+        return canned_response(contents)
+
+    def _usage(self, contents, text: str) -> FakeUsage:
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        prompt_tokens = sum(len(p) // 4 + 1 if isinstance(p, str) else 258 for p in parts)
+        return FakeUsage(prompt_tokens, len(text) // 4 + 1)
+
+    def _stream(self, contents, latency_s: float, failed: bool):
+        text = self._answer(contents)
+        size = max(1, len(text) // self.stream_chunks)
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        # Roughly a third of the latency before the first chunk, the rest spread over the others
+        time.sleep(latency_s / 3)
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(latency_s * 2 / 3 / len(pieces))
+            if failed and index == len(pieces) // 2:
+                raise FakeUpstreamError("injected upstream failure")
+            last = index == len(pieces) - 1
+            yield FakeResponse(piece, self._usage(contents, text) if last else None)
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        latency_s, failed = self._latency_s()
+        if stream:
+            return self._stream(contents, latency_s, failed)
+        time.sleep(latency_s)
+        if failed:
+            raise FakeUpstreamError("injected upstream failure")
+        text = self._answer(contents)
+        return FakeResponse(text, self._usage(contents, text))
+
+class RecordingModel:
+    """Wraps a real model and keeps prompt_key -> answer text for replay"""
+
+    def __init__(self, model):
+        self.model = model
+        self.recorded = {}
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        if stream:
+            return self._stream(contents, **kwargs)
+        response = self.model.generate_content(contents, **kwargs)
+        with self._lock:
+            self.recorded[prompt_key(contents)] = response.text
+        return response
+
+    def _stream(self, contents, **kwargs):
+        parts = []
+        for chunk in self.model.generate_content(contents, stream=True, **kwargs):
+            parts.append(getattr(chunk, "text", "") or "")
+            yield chunk
+        with self._lock:
+            self.recorded[prompt_key(contents)] = "".join(parts)
+
+def load_recording(path: str) -> dict:
+    """prompt_key -> text from a JSONL recording"""
+    recorded = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                recorded[entry["key"]] = entry["text"]
+    return recorded
+
+def save_recording(recorded: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for key, text in recorded.items():
+            f.write(json.dumps({"key": key, "text": text}) + "\n")
@@ -0,0 +1,286 @@
+"""
+Offline food nutrition index
+Answers simple single-food entries ("2 eggs", "200g chicken breast",
+"1 cup rice") from a bundled per-100g table without calling Gemini
+"""
+
+import os
+import re
+import csv
+from collections import defaultdict
+from typing import Optional
+
+import numpy as np
+
+FOOD_DB_PATH = os.environ.get(
+    "FOOD_DB_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "foods.csv")
+)
+# Matches scoring below this go to Gemini instead
+FOOD_INDEX_MIN_CONFIDENCE = float(os.environ.get("FOOD_INDEX_MIN_CONFIDENCE", "0.85"))
+# Taken off fuzzy matches whose words disagree in order ("chocolate milk" is
+# not "Milk Chocolate"), so only near-exact ones among them get through
+FOOD_INDEX_REORDER_PENALTY = float(os.environ.get("FOOD_INDEX_REORDER_PENALTY", "0.15"))
+# Words that may trail a food name without making it another food
+_PREPARATIONS = frozenset(("cooked", "raw", "fresh", "boiled", "steamed", "baked", "grilled", "fried", "roasted", "plain"))
+# Trigram Dice two words need to count as the same word despite a typo
+_WORD_SIMILARITY = 0.6
+
+_NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "dozen": 12,
+    "half": 0.5, "quarter": 0.25, "couple": 2, "few": 3
+}
+
+_UNIT_ALIASES = {
+    "g": "g", "gm": "g", "gms": "g", "gram": "g", "grams": "g",
+    "kg": "kg", "kilo": "kg", "kilos": "kg", "kilogram": "kg", "kilograms": "kg",
+    "oz": "oz", "ounce": "oz", "ounces": "oz",
+    "lb": "lb", "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "ml": "ml", "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml",
+    "l": "l", "liter": "l", "liters": "l", "litre": "l", "litres": "l",
+    "cup": "cup", "cups": "cup",
+    "tbsp": "tbsp", "tablespoon": "tbsp", "tablespoons": "tbsp",
+    "tsp": "tsp", "teaspoon": "tsp", "teaspoons": "tsp",
+    "slice": "slice", "slices": "slice",
+    "piece": "piece", "pieces": "piece", "pc": "piece", "pcs": "piece",
+    "serving": "serving", "servings": "serving", "portion": "serving", "portions": "serving",
+    "bowl": "bowl", "bowls": "bowl",
+    "glass": "glass", "glasses": "glass",
+    "plate": "plate", "plates": "plate",
+    "scoop": "scoop", "scoops": "scoop",
+    "can": "can", "cans": "can"
+}
+
+_MASS_GRAMS = {"g": 1.0, "kg": 1000.0, "oz": 28.35, "lb": 453.6}
+_VOLUME_ML = {"ml": 1.0, "l": 1000.0}
+# Units that simply mean "one typical serving"
+_SERVING_UNITS = {"piece", "serving"}
+
+_CLEAN = re.compile(r"[^a-z0-9./\s]")
+_NUMBER_UNIT = re.compile(r"(\d+(?:\.\d+)?)([a-z]+)")
+_NUMBER = re.compile(r"^\d+(?:\.\d+)?$")
+_FRACTION = re.compile(r"^(\d+)/(\d+)$")
+# Descriptions listing several foods are not single-food entries
+_MULTI_ITEM = re.compile(r",|\b(?:and|with|plus)\b|&")
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def normalize_food_name(text: str) -> str:
+    """Lowercase, strip punctuation and singularize each word"""
+    words = _CLEAN.sub(" ", text.lower()).replace(".", " ").replace("/", " ").split()
+    return " ".join(_singular(word) for word in words)
+
+def _parse_number(token: str) -> Optional[float]:
+    if _NUMBER.match(token):
+        return float(token)
+    fraction = _FRACTION.match(token)
+    if fraction and int(fraction.group(2)):
+        return int(fraction.group(1)) / int(fraction.group(2))
+    return _NUMBER_WORDS.get(token)
+
+def parse_quantity(description: str) -> tuple:
+    """
+    Split a free-text entry into (quantity, unit, food_text)
+    "2 slices toast" -> (2.0, "slice", "toast"); "200g chicken" -> (200.0, "g", "chicken")
+    quantity defaults to 1 and unit is None when there is no explicit unit
+    """
+    text = _NUMBER_UNIT.sub(r"\1 \2", _CLEAN.sub(" ", description.lower()))
+    tokens = text.split()
+    quantity = None
+    index = 0
+
+    if tokens:
+        quantity = _parse_number(tokens[0])
+        if quantity is not None:
+            index = 1
+            # "1 1/2 cups", "half a cup"
+            if index < len(tokens):
+                extra = _FRACTION.match(tokens[index])
+                if extra and int(extra.group(2)):
+                    quantity += int(extra.group(1)) / int(extra.group(2))
+                    index += 1
+                elif tokens[index] in ("a", "an"):
+                    index += 1
+
+    # A unit needs a food after it: "2 cups rice", not "2 cups"
+    unit = None
+    if index < len(tokens) - 1 and tokens[index] in _UNIT_ALIASES:
+        unit = _UNIT_ALIASES[tokens[index]]
+        index += 1
+    if index < len(tokens) and tokens[index] == "of":
+        index += 1
+
+    return (quantity if quantity is not None else 1.0), unit, " ".join(tokens[index:])
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _same_word(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    first, second = _trigrams(a), _trigrams(b)
+    return 2.0 * len(first & second) / (len(first) + len(second)) >= _WORD_SIMILARITY
+
+def words_agree(query: str, key: str) -> bool:
+    """
+    Whether a fuzzy match keeps the meaning: the last word (the head noun)
+    is the same, or the query's words appear in order in the key's
+    A query with words after the matched name names another dish ("sweet
+    potato fries" is not "Sweet Potato"), unless they only say how it was
+    prepared ("brown rice cooked")
+    """
+    query_words, key_words = query.split(), key.split()
+    while len(query_words) > 1 and query_words[-1] in _PREPARATIONS:
+        query_words = query_words[:-1]
+    if _same_word(query_words[-1], key_words[-1]):
+        return True
+    if len(query_words) > len(key_words):
+        return False
+    position = 0
+    for word in query_words:
+        while position < len(key_words) and not _same_word(word, key_words[position]):
+            position += 1
+        if position == len(key_words):
+            return False
+        position += 1
+    return True
+
+class FoodIndex:
+    """
+    Array-backed per-100g nutrition table with a character-trigram inverted index
+    Row i of `macros` holds kcal, protein, carbs and fat for `names[i]`
+    """
+
+    def __init__(self, path: str = FOOD_DB_PATH, min_confidence: float = FOOD_INDEX_MIN_CONFIDENCE):
+        # Matches scoring below this are left to Gemini
+        self.min_confidence = min_confidence
+        self.names = []
+        self.units = []
+        macros, servings = [], []
+
+        # Every name and synonym becomes a searchable key pointing at its row
+        self._keys = []
+        self._key_food = []
+        self._key_trigram_count = []
+        self._exact = {}
+        self._postings = defaultdict(list)
+
+        with open(path, newline="") as f:
+            for food_id, row in enumerate(csv.DictReader(f)):
+                self.names.append(row["name"])
+                macros.append([float(row[column]) for column in ("kcal", "protein_g", "carbs_g", "fat_g")])
+                servings.append(float(row["serving_g"]))
+                units = {}
+                for pair in filter(None, row["units"].split(";")):
+                    unit, grams = pair.split(":")
+                    units[unit.strip()] = float(grams)
+                self.units.append(units)
+
+                for name in [row["name"], *filter(None, row["synonyms"].split(";"))]:
+                    key = normalize_food_name(name)
+                    if not key or key in self._exact:
+                        continue
+                    key_id = len(self._key_food)
+                    self._exact[key] = food_id
+                    self._keys.append(key)
+                    self._key_food.append(food_id)
+                    grams = _trigrams(key)
+                    self._key_trigram_count.append(len(grams))
+                    for gram in grams:
+                        self._postings[gram].append(key_id)
+
+        self.macros = np.array(macros, dtype=np.float32)
+        self.serving_g = np.array(servings, dtype=np.float32)
+
+        print(f"✅ Food index loaded: {len(self.names)} foods, {len(self._key_food)} names")
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, food_text: str) -> tuple:
+        """Return (food_id, similarity 0-1) of the closest name, or (None, 0.0)"""
+        key = normalize_food_name(food_text)
+        if not key:
+            return None, 0.0
+        if key in self._exact:
+            return self._exact[key], 1.0
+
+        query = _trigrams(key)
+        shared = defaultdict(int)
+        for gram in query:
+            for key_id in self._postings.get(gram, ()):
+                shared[key_id] += 1
+        if not shared:
+            return None, 0.0
+
+        # Dice coefficient over trigram sets, less the penalty for reordered words
+        best_key, best_score = None, 0.0
+        for key_id, count in shared.items():
+            score = 2.0 * count / (len(query) + self._key_trigram_count[key_id])
+            if score > best_score and not words_agree(key, self._keys[key_id]):
+                score -= FOOD_INDEX_REORDER_PENALTY
+            if score > best_score:
+                best_key, best_score = key_id, score
+        if best_key is None:
+            return None, 0.0
+        return self._key_food[best_key], best_score
+
+    def grams_for(self, food_id: int, quantity: float, unit: Optional[str]) -> Optional[float]:
+        """Convert a quantity/unit for this food to grams, None if the unit doesn't apply"""
+        if unit is None or unit in _SERVING_UNITS:
+            return quantity * float(self.serving_g[food_id])
+        if unit in _MASS_GRAMS:
+            return quantity * _MASS_GRAMS[unit]
+        if unit in _VOLUME_ML:
+            density = self.units[food_id].get("ml")
+            return quantity * _VOLUME_ML[unit] * density if density else None
+        unit_grams = self.units[food_id].get(unit)
+        return quantity * unit_grams if unit_grams else None
+
+    def estimate(self, description: str, weight_g: Optional[int] = None) -> Optional[dict]:
+        """
+        Nutrition for a single-food description, or None when it can't be answered locally
+        The returned confidence is the name-match similarity (0-1)
+        """
+        if _MULTI_ITEM.search(description.lower()):
+            return None
+
+        quantity, unit, food_text = parse_quantity(description)
+        food_id, score = self.match(food_text)
+        if food_id is None:
+            return None
+
+        grams = float(weight_g) if weight_g else self.grams_for(food_id, quantity, unit)
+        if not grams or grams <= 0:
+            return None
+
+        return self.dish(food_id, grams, score)
+
+    def lookup(self, name: str) -> Optional[int]:
+        """Exact (normalized) name or synonym lookup"""
+        return self._exact.get(normalize_food_name(name))
+
+    def dish(self, food_id: int, grams: Optional[float] = None, confidence: float = 1.0) -> dict:
+        """Dish dict for `grams` of a food (one typical serving by default)"""
+        if grams is None:
+            grams = float(self.serving_g[food_id])
+
+        kcal, protein, carbs, fat = (self.macros[food_id] * (grams / 100.0)).tolist()
+        return {
+            "name": self.names[food_id],
+            "weight_g": int(round(grams)),
+            "kcal": int(round(kcal)),
+            "protein_g": int(round(protein)),
+            "carbs_g": int(round(carbs)),
+            "fat_g": int(round(fat)),
+            "confidence": round(confidence, 3)
+        }
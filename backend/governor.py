@@ -0,0 +1,481 @@
+"""
+Upstream concurrency governor
+Admits Gemini calls through a concurrency limit, requests-per-minute and
+tokens-per-minute buckets and bounded wait queues with a deadline.
+When the quota or the queue can't take a call, it is refused at once with
+429/503 and Retry-After instead of piling up and failing with a 500 later
+Calls belong to priority classes (meal logging, chat, batch) that share the
+capacity by weighted fair queuing, each with its own queue limit and
+maximum share of the slots
+"""
+
+import os
+import math
+import time
+import asyncio
+from collections import deque
+
+from fastapi import HTTPException
+
+from batching import estimate_tokens, IMAGE_TOKENS
+
+# Calls talking to Gemini at once (matches the upstream thread pool by default)
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", os.environ.get("GEMINI_MAX_WORKERS", "16")))
+# API quota (0 = unlimited), for the whole host when shared state is on, else per worker process
+GEMINI_RPM = int(os.environ.get("GEMINI_RPM", "0"))
+GEMINI_TPM = int(os.environ.get("GEMINI_TPM", "0"))
+# How long a worker trusts its copy of a 429 back-off another worker may have started
+GEMINI_SHARED_BLOCK_REFRESH_S = 1.0
+# Shortest wait before retrying a shared bucket another worker just emptied
+GEMINI_SHARED_RETRY_S = 0.05
+# Calls allowed to wait for a slot, and how long each may wait
+GEMINI_QUEUE_SIZE = int(os.environ.get("GEMINI_QUEUE_SIZE", "64"))
+GEMINI_QUEUE_TIMEOUT_S = float(os.environ.get("GEMINI_QUEUE_TIMEOUT_S", "10"))
+# Answer tokens charged up front; corrected from usage_metadata afterwards
+GEMINI_EXPECTED_OUTPUT_TOKENS = int(os.environ.get("GEMINI_EXPECTED_OUTPUT_TOKENS", "400"))
+
+def _class_setting(variable: str, default: str) -> dict:
+    """Parse "logging:8,chat:2,batch:1" style per-class settings"""
+    settings = {}
+    for item in os.environ.get(variable, default).split(","):
+        name, _, value = item.partition(":")
+        if name.strip() and value.strip():
+            settings[name.strip()] = float(value)
+    return settings
+
+# Relative share of upstream capacity when classes compete
+GEMINI_CLASS_WEIGHTS = _class_setting("GEMINI_CLASS_WEIGHTS", "logging:8,chat:2,batch:1")
+# Waiting calls each class may have before it is shed (503)
+GEMINI_CLASS_QUEUE_SIZE = _class_setting("GEMINI_CLASS_QUEUE_SIZE", "logging:64,chat:16,batch:32")
+# Fraction of the concurrency slots each class may occupy at once
+GEMINI_CLASS_MAX_SHARE = _class_setting("GEMINI_CLASS_MAX_SHARE", "logging:1.0,chat:0.5,batch:0.5")
+
+# Meal logging (/infer, /analyze-text, /quick-log) is latency critical
+PRIORITY_LOGGING = "logging"
+# Chat and meal suggestions: long generations that can wait
+PRIORITY_CHAT = "chat"
+# Batch endpoints and background jobs
+PRIORITY_BATCH = "batch"
+
+class UpstreamBusyError(HTTPException):
+    """429 (quota) or 503 (queue) with a Retry-After header"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(status_code=status_code, detail=detail, headers={"Retry-After": str(self.retry_after)})
+
+def estimate_request_tokens(contents) -> int:
+    """Prompt plus expected answer tokens for a generate_content payload"""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    prompt = sum(estimate_tokens(part) if isinstance(part, str) else IMAGE_TOKENS for part in parts)
+    return prompt + GEMINI_EXPECTED_OUTPUT_TOKENS
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for Gemini's own quota errors (google.api_core ResourceExhausted / HTTP 429)"""
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests") or getattr(error, "code", None) == 429
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to a burst of one minute's worth"""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.per_minute <= 0
+
+    def refill(self, now: float):
+        if self.unlimited:
+            return
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)"""
+        if self.unlimited:
+            return 0.0
+        self.refill(now)
+        deficit = min(amount, self.per_minute) - self.level
+        return max(0.0, deficit * 60.0 / self.per_minute)
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self.level -= min(amount, self.per_minute)
+
+    def try_take(self, amount: float, now: float) -> bool:
+        """take() if `amount` units are available now"""
+        if self.wait_time(amount, now) > 0:
+            return False
+        self.take(amount)
+        return True
+
+    def adjust(self, amount: float):
+        """Charge (or refund, when negative) units after the fact; the level may go below zero"""
+        if not self.unlimited:
+            self.level = min(self.per_minute, self.level - amount)
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket kept in shared state, so every worker on the host draws from one quota"""
+
+    def __init__(self, state, name: str, per_minute: int):
+        super().__init__(per_minute)
+        self.state = state
+        self.name = name
+
+    def refill(self, now: float):
+        if not self.unlimited:
+            self.level = self.state.bucket_level(self.name, self.per_minute)
+
+    def take(self, amount: float):
+        self.try_take(amount, time.monotonic())
+
+    def try_take(self, amount: float, now: float) -> bool:
+        return self.unlimited or self.state.bucket_take([(self.name, min(amount, self.per_minute), self.per_minute)])
+
+    def adjust(self, amount: float):
+        if not self.unlimited:
+            self.state.bucket_adjust(self.name, amount, self.per_minute)
+
+class Lease:
+    """One admitted upstream call; release() must be called exactly once"""
+
+    def __init__(self, governor: "UpstreamGovernor", priority: "PriorityClass", tokens: int, waited_ms: float):
+        self.governor = governor
+        self.priority = priority
+        self.tokens = tokens
+        self.waited_ms = waited_ms
+        self.started = time.monotonic()
+        self._released = False
+
+    def record_usage(self, usage):
+        """Reconcile the up-front token estimate with a response's usage_metadata"""
+        total = getattr(usage, "total_token_count", None)
+        if isinstance(total, int) and total > 0:
+            self.governor.tpm.adjust(total - self.tokens)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.governor._release(self.priority, time.monotonic() - self.started)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+class PriorityClass:
+    """Wait queue, weight and counters of one class of upstream calls"""
+
+    def __init__(self, name: str, weight: float, max_queue: int, max_active: int):
+        self.name = name
+        self.weight = max(weight, 0.001)
+        self.max_queue = max_queue
+        self.max_active = max_active
+        # (tokens, future, virtual finish tag)
+        self.waiters = deque()
+        self.active = 0
+        self.last_tag = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self.wait_ms = deque(maxlen=1024)
+
+    def stats(self) -> dict:
+        waits = sorted(self.wait_ms)
+
+        def percentile(p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 1) if waits else 0.0
+
+        return {
+            "weight": self.weight,
+            "in_flight": self.active,
+            "max_in_flight": self.max_active,
+            "queue_depth": len(self.waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_ms": {
+                "mean": round(sum(waits) / len(waits), 1) if waits else 0.0,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(waits[-1], 1) if waits else 0.0
+            }
+        }
+
+class UpstreamGovernor:
+    """
+    Admission control for upstream calls
+    acquire(tokens, priority) returns a Lease once a concurrency slot and
+    enough RPM/TPM budget are available
+    Waiting calls are ordered by weighted fair queuing: each gets a virtual
+    finish tag of max(now, its class's last tag) + 1/weight and the smallest
+    tag goes next, so under contention classes get slots in proportion to
+    their weights and an idle class can't bank credit
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+        rpm: int = GEMINI_RPM,
+        tpm: int = GEMINI_TPM,
+        max_queue: int = GEMINI_QUEUE_SIZE,
+        queue_timeout_s: float = GEMINI_QUEUE_TIMEOUT_S,
+        weights: dict = GEMINI_CLASS_WEIGHTS,
+        class_queue_size: dict = GEMINI_CLASS_QUEUE_SIZE,
+        class_max_share: dict = GEMINI_CLASS_MAX_SHARE,
+        shared=None
+    ):
+        self.max_concurrency = max_concurrency
+        self.rpm = TokenBucket(rpm)
+        self.tpm = TokenBucket(tpm)
+        self.share(shared)
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.classes = {}
+        for name in (PRIORITY_LOGGING, PRIORITY_CHAT, PRIORITY_BATCH, *weights):
+            if name not in self.classes:
+                share = class_max_share.get(name, 1.0)
+                self.classes[name] = PriorityClass(
+                    name,
+                    weights.get(name, 1.0),
+                    int(class_queue_size.get(name, max_queue)),
+                    max(1, int(share * max_concurrency))
+                )
+        self.active = 0
+        self.queued = 0
+        self._queued_tokens = 0
+        self._virtual_time = 0.0
+        self._timer = None
+        self._blocked_until = 0.0
+        # (checked at, wall-clock end) of the last host-wide 429 back-off read
+        self._shared_blocked = (float("-inf"), 0.0)
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "quota": 0, "timeout": 0, "shed": 0}
+        self.upstream_rate_limited = 0
+        self._call_s = deque(maxlen=256)
+
+    def share(self, state):
+        """
+        Draw the quota from host-wide buckets in `state` (a SharedState,
+        opened by the worker at startup) and share 429 back-offs through it;
+        None goes back to per-worker buckets
+        """
+        self.shared = state
+        rpm, tpm = self.rpm.per_minute, self.tpm.per_minute
+        self.rpm = SharedTokenBucket(state, "gemini_rpm", rpm) if state else TokenBucket(rpm)
+        self.tpm = SharedTokenBucket(state, "gemini_tpm", tpm) if state else TokenBucket(tpm)
+        self._shared_blocked = (float("-inf"), 0.0)
+
+    def _budget_wait(self, requests: int, tokens: int, now: float) -> float:
+        return max(
+            self.rpm.wait_time(requests, now),
+            self.tpm.wait_time(tokens, now),
+            self._blocked_until - now,
+            self._shared_blocked_wait()
+        )
+
+    def _shared_blocked_wait(self) -> float:
+        """Seconds left of a 429 back-off started by any worker, re-read at most every GEMINI_SHARED_BLOCK_REFRESH_S"""
+        if not self.shared:
+            return 0.0
+        wall = time.time()
+        checked_at, blocked_until = self._shared_blocked
+        if wall - checked_at >= GEMINI_SHARED_BLOCK_REFRESH_S:
+            blocked_until = self.shared.get("governor", "blocked_until", memory=False) or 0.0
+            self._shared_blocked = (wall, blocked_until)
+        return blocked_until - wall
+
+    def _try_admit(self, priority: PriorityClass, tokens: int, now: float) -> bool:
+        if self.active >= self.max_concurrency or priority.active >= priority.max_active:
+            return False
+        if self._budget_wait(1, tokens, now) > 0 or not self._take_budget(tokens, now):
+            return False
+        self.active += 1
+        priority.active += 1
+        return True
+
+    def _take_budget(self, tokens: int, now: float) -> bool:
+        """Take one request and `tokens` from the quota, both or neither"""
+        if not self.shared:
+            self.rpm.take(1)
+            self.tpm.take(tokens)
+            return True
+        # Other workers draw from the same buckets, so the level read by
+        # _budget_wait may be gone: check and take in one transaction
+        takes = [
+            (bucket.name, min(amount, bucket.per_minute), bucket.per_minute)
+            for bucket, amount in ((self.rpm, 1), (self.tpm, tokens)) if not bucket.unlimited
+        ]
+        return not takes or self.shared.bucket_take(takes)
+
+    def _typical_call_s(self) -> float:
+        return sum(self._call_s) / len(self._call_s) if self._call_s else 1.0
+
+    def _busy(self, reason: str, waiting: int) -> UpstreamBusyError:
+        self.rejected[reason] += 1
+        retry_after = self._typical_call_s() * (waiting + 1) / self.max_concurrency
+        return UpstreamBusyError(503, "AI service is busy. Please retry shortly.", retry_after)
+
+    def _shed_for(self, priority: PriorityClass) -> bool:
+        """
+        Make room in a full queue by dropping the newest waiter of the
+        lowest-weight class that ranks below `priority`
+        """
+        victims = [c for c in self.classes.values() if c.waiters and c.weight < priority.weight]
+        if not victims:
+            return False
+        victim = min(victims, key=lambda c: c.weight)
+        tokens, future, _ = victim.waiters.pop()
+        self.queued -= 1
+        self._queued_tokens -= tokens
+        victim.shed += 1
+        self.rejected["shed"] += 1
+        future.set_exception(self._busy_error(victim))
+        return True
+
+    def _busy_error(self, priority: PriorityClass) -> UpstreamBusyError:
+        retry_after = self._typical_call_s() * (len(priority.waiters) + 1) / priority.max_active
+        return UpstreamBusyError(503, "AI service is busy. Please retry shortly.", retry_after)
+
+    async def acquire(self, tokens: int, priority: str = PRIORITY_LOGGING) -> Lease:
+        cls = self.classes.get(priority) or self.classes[PRIORITY_LOGGING]
+        now = time.monotonic()
+        if not self.queued and self._try_admit(cls, tokens, now):
+            return self._admitted(cls, tokens, 0.0)
+
+        # Per-class shedding: a class over its own queue limit is refused
+        # without touching anyone else's place in line
+        if len(cls.waiters) >= cls.max_queue:
+            cls.shed += 1
+            self.rejected["shed"] += 1
+            raise self._busy_error(cls)
+        if self.queued >= self.max_queue and not self._shed_for(cls):
+            raise self._busy("queue_full", self.queued)
+
+        # Everyone ahead is paid for first; if the quota can't cover us before
+        # the deadline there is no point in queueing
+        budget_wait = self._budget_wait(self.queued + 1, self._queued_tokens + tokens, now)
+        if budget_wait > self.queue_timeout_s:
+            self.rejected["quota"] += 1
+            raise UpstreamBusyError(429, "AI request quota exhausted. Please retry later.", budget_wait)
+
+        cls.last_tag = max(self._virtual_time, cls.last_tag) + 1.0 / cls.weight
+        entry = (tokens, asyncio.get_running_loop().create_future(), cls.last_tag)
+        cls.waiters.append(entry)
+        self.queued += 1
+        self._queued_tokens += tokens
+        self._dispatch()
+        try:
+            done, _ = await asyncio.wait((entry[1],), timeout=self.queue_timeout_s)
+        except asyncio.CancelledError:
+            self._abandon(cls, entry)
+            raise
+        if not done:
+            self._abandon(cls, entry)
+            raise self._busy("timeout", self.queued)
+        # Raises if this waiter was shed to make room for a higher class
+        entry[1].result()
+        return self._admitted(cls, tokens, (time.monotonic() - now) * 1000)
+
+    def _admitted(self, priority: PriorityClass, tokens: int, waited_ms: float) -> Lease:
+        self.admitted += 1
+        priority.admitted += 1
+        priority.wait_ms.append(waited_ms)
+        return Lease(self, priority, tokens, waited_ms)
+
+    def _abandon(self, priority: PriorityClass, entry: tuple):
+        tokens, future, _ = entry
+        if future.done() and not future.cancelled():
+            if future.exception() is None:
+                # Admitted just as the caller gave up: hand the slot back
+                self._release(priority, 0.0, record=False)
+            return
+        future.cancel()
+        try:
+            priority.waiters.remove(entry)
+            self.queued -= 1
+            self._queued_tokens -= tokens
+        except ValueError:
+            pass
+
+    def _next_class(self) -> PriorityClass:
+        """Class whose head waiter has the smallest finish tag and a free class slot"""
+        best = None
+        for cls in self.classes.values():
+            if cls.waiters and cls.active < cls.max_active:
+                if best is None or cls.waiters[0][2] < best.waiters[0][2]:
+                    best = cls
+        return best
+
+    def _dispatch(self):
+        """Admit waiters in fair-queuing order while capacity and budget allow"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        blocked_on_budget = None
+        while self.active < self.max_concurrency:
+            cls = self._next_class()
+            if cls is None:
+                break
+            tokens, future, tag = cls.waiters[0]
+            if not self._try_admit(cls, tokens, now):
+                blocked_on_budget = tokens
+                break
+            cls.waiters.popleft()
+            self.queued -= 1
+            self._queued_tokens -= tokens
+            self._virtual_time = tag
+            future.set_result(None)
+
+        # Blocked on quota rather than on a slot: nothing will call us back, so set a timer
+        if blocked_on_budget is not None:
+            delay = self._budget_wait(1, blocked_on_budget, now)
+            # A shared bucket can look full and still lose the take to another worker: don't spin on it
+            floor = GEMINI_SHARED_RETRY_S if self.shared else 0.001
+            self._timer = asyncio.get_running_loop().call_later(max(delay, floor), self._dispatch)
+
+    def _release(self, priority: PriorityClass, call_s: float, record: bool = True):
+        self.active -= 1
+        priority.active -= 1
+        if record:
+            self._call_s.append(call_s)
+        self._dispatch()
+
+    def rate_limited(self, retry_after: float = 10.0):
+        """Gemini itself answered 429: hold every queued call back for a while"""
+        self.upstream_rate_limited += 1
+        self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        if self.shared:
+            blocked_until = max(self._shared_blocked[1], time.time() + retry_after)
+            self.shared.put("governor", "blocked_until", blocked_until, retry_after)
+            self._shared_blocked = (time.time(), blocked_until)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+
+        def bucket(b: TokenBucket) -> dict:
+            b.refill(now)
+            return {
+                "limit_per_minute": b.per_minute or None,
+                "available": None if b.unlimited else int(b.level),
+                "scope": "host" if isinstance(b, SharedTokenBucket) else "worker"
+            }
+
+        return {
+            "in_flight": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "upstream_rate_limited": self.upstream_rate_limited,
+            "classes": {name: cls.stats() for name, cls in self.classes.items()},
+            "rpm": bucket(self.rpm),
+            "tpm": bucket(self.tpm)
+        }
+
+governor = UpstreamGovernor()
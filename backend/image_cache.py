@@ -0,0 +1,238 @@
+"""
+Perceptual-hash result cache for food photos
+Near-duplicate uploads (retries, bursts, the same lunch box every day)
+reuse the dishes from an earlier Gemini vision call
+With shared state, exact hashes are also looked up in (and written to) the
+host-wide store, so a photo another worker analyzed is a hit here too;
+near-duplicate matching stays within each worker's own entries
+"""
+
+import os
+import json
+import time
+import tempfile
+from collections import OrderedDict
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process lock (Windows): concurrent saves may drop each other's new entries
+    fcntl = None
+
+IMAGE_CACHE_SIZE = int(os.environ.get("IMAGE_CACHE_SIZE", "2048"))
+IMAGE_CACHE_TTL = int(os.environ.get("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))
+# Max differing bits (out of 64) for two photos to count as the same plate
+IMAGE_CACHE_MAX_DISTANCE = int(os.environ.get("IMAGE_CACHE_MAX_DISTANCE", "6"))
+IMAGE_CACHE_PATH = os.environ.get(
+    "IMAGE_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), ".cache", "image_cache.json")
+)
+# Persist after this many new entries (and always on shutdown)
+IMAGE_CACHE_SAVE_EVERY = 32
+
+HASH_SIZE = 8
+_SAMPLE_SIZE = 32
+
+def _dct_matrix(n: int):
+    """Orthonormal DCT-II basis, so a 2-D DCT is two matrix products"""
+    import numpy as np
+
+    k = np.arange(n).reshape(-1, 1)
+    i = np.arange(n).reshape(1, -1)
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+# Built on first use so importing the cache doesn't pull in numpy
+_DCT = None
+
+def perceptual_hash(image) -> int:
+    """
+    64-bit pHash of a PIL image
+    Low-frequency DCT coefficients of a 32x32 grayscale thumbnail,
+    thresholded at their median
+    """
+    global _DCT
+    import numpy as np
+    from PIL import Image
+
+    if _DCT is None:
+        _DCT = _dct_matrix(_SAMPLE_SIZE)
+    gray = image.convert("L").resize((_SAMPLE_SIZE, _SAMPLE_SIZE), Image.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.float64)
+    coefficients = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # The DC term only tracks overall brightness, so leave it out of the median
+    bits = coefficients > np.median(coefficients[1:])
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class PerceptualHashCache:
+    """LRU + TTL cache of dishes keyed by perceptual hash"""
+
+    def __init__(
+        self,
+        max_entries: int = IMAGE_CACHE_SIZE,
+        ttl_seconds: int = IMAGE_CACHE_TTL,
+        max_distance: int = IMAGE_CACHE_MAX_DISTANCE,
+        path: Optional[str] = IMAGE_CACHE_PATH,
+        shared=None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.path = path or None
+        self.shared = shared
+        # hash -> (stored_at, dishes), oldest first
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._unsaved = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, image_hash: int) -> Optional[List[dict]]:
+        """Return cached dishes for this photo or a near-duplicate, else None"""
+        now = time.time()
+        match = None
+
+        if image_hash in self._entries:
+            match = image_hash
+        else:
+            best_distance = self.max_distance + 1
+            for cached_hash in self._entries:
+                distance = hamming_distance(image_hash, cached_hash)
+                if distance < best_distance:
+                    match, best_distance = cached_hash, distance
+
+        if match is not None:
+            stored_at, dishes = self._entries[match]
+            if now - stored_at <= self.ttl_seconds:
+                self._entries.move_to_end(match)
+                self.hits += 1
+                if match != image_hash:
+                    self.near_hits += 1
+                return dishes
+            del self._entries[match]
+            self.evictions += 1
+
+        if self.shared:
+            dishes = self.shared.get("image", f"{image_hash:016x}")
+            if dishes is not None:
+                self._remember(image_hash, dishes)
+                self.hits += 1
+                self.shared_hits += 1
+                return dishes
+
+        self.misses += 1
+        return None
+
+    def put(self, image_hash: int, dishes: List[dict]):
+        if self.shared:
+            self.shared.put("image", f"{image_hash:016x}", dishes, self.ttl_seconds)
+        self._remember(image_hash, dishes)
+
+    def _remember(self, image_hash: int, dishes: List[dict]):
+        self._entries[image_hash] = (time.time(), dishes)
+        self._entries.move_to_end(image_hash)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+        self._unsaved += 1
+        if self._unsaved >= IMAGE_CACHE_SAVE_EVERY:
+            self.save()
+
+    def clear(self):
+        self._entries.clear()
+        self._unsaved = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def save(self):
+        """
+        Merge the cache into the file on disk atomically; failures only log
+        Every worker saves to the same file, so entries other workers wrote
+        are kept (the newest of each hash wins) and writers take turns on a
+        lock file
+        """
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(f"{self.path}.lock", "a") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    entries = self._read()
+                    for image_hash, (stored_at, dishes) in self._entries.items():
+                        if image_hash not in entries or entries[image_hash][0] <= stored_at:
+                            entries[image_hash] = (stored_at, dishes)
+                    cutoff = time.time() - self.ttl_seconds
+                    newest = sorted((item for item in entries.items() if item[1][0] >= cutoff), key=lambda item: item[1][0])
+                    payload = [
+                        {"hash": f"{image_hash:016x}", "stored_at": stored_at, "dishes": dishes}
+                        for image_hash, (stored_at, dishes) in newest[-self.max_entries:]
+                    ]
+                    descriptor, tmp_path = tempfile.mkstemp(dir=directory, prefix=".image_cache.", suffix=".tmp")
+                    try:
+                        with os.fdopen(descriptor, "w") as f:
+                            json.dump(payload, f)
+                        os.replace(tmp_path, self.path)
+                    except BaseException:
+                        os.unlink(tmp_path)
+                        raise
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+            self._unsaved = 0
+        except OSError as e:
+            print(f"⚠️ Failed to save image cache: {e}")
+
+    def _read(self) -> dict:
+        """hash -> (stored_at, dishes) of the file on disk; empty when missing or unreadable"""
+        try:
+            with open(self.path) as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Ignoring unreadable image cache file: {e}")
+            return {}
+        return {int(entry["hash"], 16): (entry["stored_at"], entry["dishes"]) for entry in payload}
+
+    def load(self):
+        """Restore entries saved by a previous process, dropping expired ones"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                payload = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Failed to load image cache: {e}")
+            return
+
+        cutoff = time.time() - self.ttl_seconds
+        for entry in payload[-self.max_entries:]:
+            if entry["stored_at"] >= cutoff:
+                self._entries[int(entry["hash"], 16)] = (entry["stored_at"], entry["dishes"])
+        print(f"✅ Loaded {len(self._entries)} cached image results")
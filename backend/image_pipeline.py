@@ -0,0 +1,250 @@
+"""
+Image preprocessing pipeline for /infer
+Fixes orientation, downscales and re-encodes uploads off the event loop
+so Gemini only receives the pixels it actually needs
+Uploads are checked in chunks straight from the multipart spool file and
+JPEGs are decoded at reduced scale, so a request never holds the upload
+bytes or a full-resolution bitmap in memory
+Pillow is imported on the first upload, not when the module is imported
+"""
+
+import os
+import io
+import json
+import time
+import hashlib
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from image_cache import perceptual_hash
+
+# Longest edge (px) of the image sent to the model
+IMAGE_MAX_EDGE = int(os.environ.get("IMAGE_MAX_EDGE", "1024"))
+# Output encoding: JPEG or WEBP
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "85"))
+# Hard limits on what we accept from clients
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", str(15 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", str(50_000_000)))
+# Read size when scanning an upload
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_BYTES", str(256 * 1024)))
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+class ImageRejectedError(ValueError):
+    """Raised when an upload cannot be preprocessed; carries the HTTP status to return"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+# Leading bytes of the formats we decode
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF")
+)
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Image format from the first bytes of a file, or None if unsupported"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, image_format in _SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return None
+
+def scan_upload(source, declared_size: Optional[int] = None, limit: int = IMAGE_MAX_BYTES) -> tuple:
+    """
+    Validate an upload file object chunk by chunk without keeping its bytes
+    Rejects on the declared size before reading, on the header after the
+    first chunk and on the byte cap as soon as it is crossed; returns
+    (size, format, sha256 hex) and leaves the file at position 0
+    """
+    if declared_size is not None and declared_size > limit:
+        raise ImageRejectedError(f"Image is too large ({declared_size} bytes, limit {limit})", status_code=413)
+
+    digest = hashlib.sha256()
+    size = 0
+    image_format = None
+    source.seek(0)
+    while True:
+        chunk = source.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        if image_format is None:
+            image_format = sniff_format(chunk[:12])
+            if image_format is None:
+                raise ImageRejectedError("Unsupported image format (expected JPEG, PNG, WEBP or GIF)", status_code=415)
+        size += len(chunk)
+        if size > limit:
+            raise ImageRejectedError(f"Image is too large (over {limit} bytes)", status_code=413)
+        digest.update(chunk)
+
+    if not size:
+        raise ImageRejectedError("The uploaded image is empty")
+    source.seek(0)
+    return size, image_format, digest.hexdigest()
+
+_executor: ThreadPoolExecutor = None
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the CPU pool used for decoding and resizing"""
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=os.cpu_count() or 2,
+            thread_name_prefix="image"
+        )
+    return _executor
+
+def preprocess_image(image) -> tuple:
+    """
+    Normalize an uploaded photo for the vision model
+    image is the upload's bytes or a seekable file object (read in place)
+    Returns (encoded_bytes, mime_type, stats) where stats reports
+    before/after size, the perceptual hash and how long the pipeline took
+    """
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+
+    if isinstance(image, (bytes, bytearray)):
+        original_bytes = len(image)
+        source = io.BytesIO(image)
+    else:
+        source = image
+        original_bytes = source.seek(0, io.SEEK_END)
+        source.seek(0)
+
+    if original_bytes > IMAGE_MAX_BYTES:
+        raise ImageRejectedError(
+            f"Image is too large ({original_bytes} bytes, limit {IMAGE_MAX_BYTES})",
+            status_code=413
+        )
+
+    try:
+        image = Image.open(source)
+    except Exception:
+        raise ImageRejectedError("Could not decode the uploaded image")
+
+    # Image.open only parses the header, so this check runs before any pixel decode
+    original_size = image.size
+    if original_size[0] * original_size[1] > IMAGE_MAX_PIXELS:
+        raise ImageRejectedError(
+            f"Image resolution {original_size[0]}x{original_size[1]} exceeds the pixel limit",
+            status_code=413
+        )
+
+    try:
+        # JPEG only: the decoder scales by 1/2, 1/4 or 1/8 while decoding,
+        # staying at or above the target size, so the full bitmap is never built
+        image.draft("RGB", (IMAGE_MAX_EDGE, IMAGE_MAX_EDGE))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        # Downscale before rotating; the EXIF orientation survives thumbnail()
+        image.thumbnail((IMAGE_MAX_EDGE, IMAGE_MAX_EDGE), Image.LANCZOS)
+        image = ImageOps.exif_transpose(image)
+
+        output_format = IMAGE_FORMAT if IMAGE_FORMAT in MIME_TYPES else "JPEG"
+        buffer = io.BytesIO()
+        image.save(buffer, format=output_format, quality=IMAGE_QUALITY, optimize=True)
+        image_hash = perceptual_hash(image)
+    except Exception:
+        raise ImageRejectedError("Could not decode the uploaded image")
+
+    encoded = buffer.getvalue()
+    stats = {
+        "original_bytes": original_bytes,
+        "processed_bytes": len(encoded),
+        "original_size": list(original_size),
+        "processed_size": list(image.size),
+        "format": output_format,
+        "phash": f"{image_hash:016x}",
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)
+    }
+    return encoded, MIME_TYPES[output_format], stats
+
+async def preprocess_image_async(image) -> tuple:
+    """Run preprocess_image on the CPU pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(),
+        functools.partial(preprocess_image, image)
+    )
+
+async def scan_upload_async(source, declared_size: Optional[int] = None, limit: int = IMAGE_MAX_BYTES) -> tuple:
+    """scan_upload on the CPU pool (spooled uploads live on disk)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(),
+        functools.partial(scan_upload, source, declared_size, limit)
+    )
+
+def shutdown_executor():
+    """Release the preprocessing pool (called on application shutdown)"""
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+class UploadLimitMiddleware:
+    """
+    Pure ASGI middleware capping request bodies on the upload routes before
+    the multipart parser spools them: a declared Content-Length over the cap
+    gets a 413 without reading the body, and a chunked body is cut off with
+    a 413 as soon as it crosses the cap
+    limits maps route path -> maximum body bytes
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits
+
+    async def _reject(self, send, limit: int):
+        body = json.dumps({"detail": f"Upload is too large (limit {limit} bytes)"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    rejected = True
+                    await self._reject(send, limit)
+                    # The app sees a disconnect and stops parsing; its own response is dropped
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            if not rejected:
+                await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
@@ -0,0 +1,286 @@
+"""
+Drug-food interaction checks ("Contraindication Alerts")
+The bundled knowledge base (data/medications.csv, data/food_classes.csv,
+data/interactions.csv) is compiled at startup into hash indexes: medication
+name/brand -> ingredient, food name/synonym -> food classes and ingredient
+-> food class -> rule, so checking a meal is a handful of dict lookups per
+dish instead of a model round trip
+Rules written for a drug class ("maoi", "nsaid") apply to every
+ingredient of that class; rules with separate_hours only fire when the meal
+is that close to the dose (or when either time is unknown)
+"""
+
+import os
+import re
+import csv
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+MEDICATIONS_DB_PATH = os.environ.get("MEDICATIONS_DB_PATH", os.path.join(DATA_DIR, "medications.csv"))
+FOOD_CLASSES_DB_PATH = os.environ.get("FOOD_CLASSES_DB_PATH", os.path.join(DATA_DIR, "food_classes.csv"))
+INTERACTIONS_DB_PATH = os.environ.get("INTERACTIONS_DB_PATH", os.path.join(DATA_DIR, "interactions.csv"))
+
+SEVERITIES = ("major", "moderate", "minor")
+# Dish names whose food classes are remembered (dish names repeat a lot)
+DISH_CACHE_SIZE = 4096
+# Food class whose terms only shadow shorter ones ("ginger ale" is not "ale")
+NO_CLASS = "none"
+
+_WORD = re.compile(r"[a-z0-9]+")
+_DOSE = re.compile(r"^\d+(?:\.\d+)?(?:mg|mcg|ug|g|ml|iu|units?)?$")
+_CLOCK = re.compile(r"^(\d{1,2}):(\d{2})")
+
+def _fold(word: str) -> str:
+    """Plural -> singular, the same way for the knowledge base and the input"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+def terms_of(text: str) -> tuple:
+    return tuple(_fold(word) for word in _WORD.findall(text.lower()))
+
+def minute_of_day(value: Optional[str], tz_offset_minutes: Optional[int] = None) -> Optional[int]:
+    """
+    Local minutes after midnight of "HH:MM" or an ISO timestamp, else None
+    "HH:MM" and naive timestamps are local clock time already; a timestamp
+    with "Z" or an offset is moved to local time with tz_offset_minutes
+    (minutes ahead of UTC) and is unknown (None) without it
+    """
+    if not value:
+        return None
+    match = _CLOCK.match(value.strip())
+    if match:
+        return int(match.group(1)) % 24 * 60 + int(match.group(2))
+    try:
+        moment = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if moment.tzinfo is not None:
+        if tz_offset_minutes is None:
+            return None
+        moment = moment.astimezone(timezone.utc) + timedelta(minutes=tz_offset_minutes)
+    return moment.hour * 60 + moment.minute
+
+def hours_apart(first: int, second: int) -> float:
+    """Clock distance between two minutes-of-day, across midnight"""
+    difference = abs(first - second) % 1440
+    return min(difference, 1440 - difference) / 60
+
+class PhraseIndex:
+    """
+    Hash of word tuples -> values, scanned leftmost-longest over a text
+    ("grapefruit juice" wins over "grapefruit", "ginger ale" over "ale")
+    """
+
+    def __init__(self):
+        self._phrases: Dict[tuple, set] = {}
+        self.max_words = 1
+
+    def add(self, phrase: str, value):
+        words = terms_of(phrase)
+        if words:
+            self._phrases.setdefault(words, set()).add(value)
+            self.max_words = max(self.max_words, len(words))
+
+    def find(self, text: str) -> List[tuple]:
+        """(matched phrase, values) for each match in text"""
+        words = terms_of(text)
+        found, start = [], 0
+        while start < len(words):
+            for length in range(min(self.max_words, len(words) - start), 0, -1):
+                values = self._phrases.get(words[start:start + length])
+                if values is not None:
+                    found.append((" ".join(words[start:start + length]), values))
+                    start += length
+                    break
+            else:
+                start += 1
+        return found
+
+    def __len__(self):
+        return len(self._phrases)
+
+class InteractionRule:
+    __slots__ = ("ingredient", "food_class", "severity", "separate_hours", "effect", "advice")
+
+    def __init__(self, ingredient: str, food_class: str, severity: str, separate_hours: Optional[float], effect: str, advice: str):
+        self.ingredient = ingredient
+        self.food_class = food_class
+        self.severity = severity
+        self.separate_hours = separate_hours
+        self.effect = effect
+        self.advice = advice
+
+class MedicationProfile:
+    """A medication list compiled once: food class -> [(medication, dose minute, rule)]"""
+    __slots__ = ("by_class", "recognized", "unrecognized")
+
+    def __init__(self):
+        self.by_class: Dict[str, List[tuple]] = {}
+        self.recognized: List[dict] = []
+        self.unrecognized: List[str] = []
+
+class InteractionChecker:
+    """Compiled knowledge base; compile() a medication list, then check_meal() / check_day()"""
+
+    def __init__(
+        self,
+        medications_path: str = MEDICATIONS_DB_PATH,
+        food_classes_path: str = FOOD_CLASSES_DB_PATH,
+        interactions_path: str = INTERACTIONS_DB_PATH
+    ):
+        self.medications = PhraseIndex()
+        self.drug_classes: Dict[str, str] = {}
+        with open(medications_path, encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                ingredient = row["ingredient"]
+                self.drug_classes[ingredient] = row["drug_class"]
+                for name in [ingredient] + row["synonyms"].split(";"):
+                    self.medications.add(name, ingredient)
+
+        self.foods = PhraseIndex()
+        self._dish_classes: Dict[str, List[tuple]] = {}
+        food_classes = set()
+        with open(food_classes_path, encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                food_classes.add(row["food_class"])
+                for name in row["synonyms"].split(";"):
+                    self.foods.add(name, row["food_class"])
+
+        # ingredient -> food class -> rule; class-wide rules expand to each ingredient of the class
+        self.rules: Dict[str, Dict[str, InteractionRule]] = {}
+        with open(interactions_path, encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if row["severity"] not in SEVERITIES:
+                    raise ValueError(f"Unknown severity {row['severity']!r} for {row['drug']} / {row['food_class']}")
+                if row["food_class"] not in food_classes:
+                    raise ValueError(f"Unknown food class {row['food_class']!r} for {row['drug']}")
+                ingredients = [row["drug"]] if row["drug"] in self.drug_classes else \
+                    [name for name, drug_class in self.drug_classes.items() if drug_class == row["drug"]]
+                if not ingredients:
+                    raise ValueError(f"Unknown drug or drug class {row['drug']!r}")
+                separate_hours = float(row["separate_hours"]) if row["separate_hours"] else None
+                for ingredient in ingredients:
+                    rule = InteractionRule(ingredient, row["food_class"], row["severity"], separate_hours, row["effect"], row["advice"])
+                    # An ingredient's own rule beats its class's
+                    if row["drug"] == ingredient or row["food_class"] not in self.rules.get(ingredient, {}):
+                        self.rules.setdefault(ingredient, {})[row["food_class"]] = rule
+
+    def ingredients(self, medication_name: str) -> List[str]:
+        """Active ingredients named in a medication entry ("Lipitor 20mg" -> atorvastatin)"""
+        words = " ".join(word for word in _WORD.findall(medication_name.lower()) if not _DOSE.match(word))
+        found = []
+        for _, values in self.medications.find(words):
+            found.extend(sorted(value for value in values if value not in found))
+        return found
+
+    def food_classes(self, dish_name: str) -> List[tuple]:
+        """(matched term, food class) for each interacting food named in a dish"""
+        found = self._dish_classes.get(dish_name)
+        if found is None:
+            found = [
+                (term, food_class)
+                for term, classes in self.foods.find(dish_name)
+                for food_class in sorted(classes) if food_class != NO_CLASS
+            ]
+            if len(self._dish_classes) >= DISH_CACHE_SIZE:
+                self._dish_classes.clear()
+            self._dish_classes[dish_name] = found
+        return found
+
+    def compile(self, medications: List[dict], tz_offset_minutes: Optional[int] = None) -> MedicationProfile:
+        """
+        Profile for a medication list ({"name", "time"} like the Medicine
+        model); check_meal() then costs one lookup per food class found
+        """
+        profile = MedicationProfile()
+        for medication in medications:
+            ingredients = self.ingredients(medication["name"])
+            if not ingredients:
+                profile.unrecognized.append(medication["name"])
+                continue
+            profile.recognized.append({"name": medication["name"], "ingredients": ingredients})
+            dose_minute = minute_of_day(medication.get("time"), tz_offset_minutes)
+            for ingredient in ingredients:
+                for food_class, rule in self.rules.get(ingredient, {}).items():
+                    profile.by_class.setdefault(food_class, []).append((medication["name"], dose_minute, rule))
+        return profile
+
+    def check_meal(
+        self,
+        profile: MedicationProfile,
+        dishes: List[str],
+        eaten_at: Optional[str] = None,
+        tz_offset_minutes: Optional[int] = None
+    ) -> List[dict]:
+        """Alerts for one meal, most severe first"""
+        meal_minute = minute_of_day(eaten_at, tz_offset_minutes)
+        alerts, seen = [], set()
+        for dish in dishes:
+            for term, food_class in self.food_classes(dish):
+                for medication, dose_minute, rule in profile.by_class.get(food_class, ()):
+                    apart = None
+                    if meal_minute is not None and dose_minute is not None:
+                        apart = round(hours_apart(meal_minute, dose_minute), 2)
+                        if rule.separate_hours is not None and apart >= rule.separate_hours:
+                            continue
+                    key = (medication, rule.ingredient, food_class, dish)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    alerts.append({
+                        "medication": medication,
+                        "ingredient": rule.ingredient,
+                        "dish": dish,
+                        "matched": term,
+                        "food_class": food_class,
+                        "severity": rule.severity,
+                        "effect": rule.effect,
+                        "advice": rule.advice,
+                        "separate_hours": rule.separate_hours,
+                        "hours_from_dose": apart
+                    })
+        alerts.sort(key=lambda alert: SEVERITIES.index(alert["severity"]))
+        return alerts
+
+    def check_day(self, medications: List[dict], meals: List[dict], tz_offset_minutes: Optional[int] = None) -> dict:
+        """
+        Every meal of a day ({"dishes": [names], "eaten_at"}) against one
+        medication list, compiled once; "summary" has one line per
+        medication and food class with the meals it was found in
+        """
+        profile = self.compile(medications, tz_offset_minutes)
+        results, summary = [], {}
+        for index, meal in enumerate(meals):
+            alerts = self.check_meal(profile, meal["dishes"], meal.get("eaten_at"), tz_offset_minutes)
+            results.append({"alerts": alerts})
+            for alert in alerts:
+                line = summary.setdefault((alert["medication"], alert["food_class"]), {
+                    "medication": alert["medication"],
+                    "ingredient": alert["ingredient"],
+                    "food_class": alert["food_class"],
+                    "severity": alert["severity"],
+                    "advice": alert["advice"],
+                    "meals": []
+                })
+                if index not in line["meals"]:
+                    line["meals"].append(index)
+        return {
+            "results": results,
+            "summary": sorted(summary.values(), key=lambda line: SEVERITIES.index(line["severity"])),
+            "medications": profile.recognized,
+            "unrecognized_medications": profile.unrecognized
+        }
+
+    def stats(self) -> dict:
+        return {
+            "medication_names": len(self.medications),
+            "food_terms": len(self.foods),
+            "ingredients": len(self.drug_classes),
+            "rules": sum(len(rules) for rules in self.rules.values())
+        }
@@ -0,0 +1,330 @@
+"""
+Asynchronous job queue for photo analysis (POST /infer/jobs)
+Jobs live in a SQLite (WAL) table shared by every uvicorn worker on the
+host, so they survive restarts. Each worker process runs JOB_WORKERS
+asyncio workers that claim jobs atomically (interactive before batch,
+oldest first) under a lease: a job whose worker died is claimed again once
+its lease runs out. Waiting clients are woken in-process, and poll the
+table for jobs finished by another worker process
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from governor import UpstreamBusyError, PRIORITY_LOGGING, PRIORITY_BATCH, _class_setting
+
+JOBS_DB_PATH = os.environ.get(
+    "JOBS_DB_PATH",
+    os.path.join(os.path.dirname(__file__), ".cache", "jobs.sqlite3")
+)
+# Workers per process pulling jobs off the queue
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+# Queued jobs each priority may have before submissions get a 503
+JOB_QUEUE_DEPTH = _class_setting("JOB_QUEUE_DEPTH", "logging:256,batch:10000")
+# A running job whose worker hasn't finished it by then is claimed again
+JOB_LEASE_S = float(os.environ.get("JOB_LEASE_S", "300"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# How often idle workers and waiting clients look for changes made by other processes
+JOB_POLL_S = float(os.environ.get("JOB_POLL_S", "1"))
+# Finished jobs (and their results) are kept this long
+JOB_TTL_S = int(os.environ.get("JOB_TTL_S", str(24 * 3600)))
+# Batch jobs claimed together, so one packed Gemini call covers them
+JOB_BATCH_CLAIM = int(os.environ.get("JOB_BATCH_CLAIM", os.environ.get("BATCH_MAX_IMAGES_PER_PROMPT", "8")))
+
+# Claim order: interactive meal logging first, nightly re-analysis last
+PRIORITY_RANKS = {PRIORITY_LOGGING: 0, PRIORITY_BATCH: 1}
+STATUSES = ("queued", "running", "done", "failed")
+FINISHED = ("done", "failed")
+
+_COLUMNS = "id, priority, status, digest, meta, result, error, status_code, attempts, created_at, started_at, finished_at"
+
+class JobQueue:
+    """
+    SQLite-backed job table plus this process's workers
+    handler(jobs) gets the claimed jobs (dicts with id, priority, payload
+    and meta) and returns one result dict or exception per job
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[dict]], Awaitable[list]],
+        path: str = JOBS_DB_PATH,
+        workers: int = JOB_WORKERS,
+        queue_depth: Optional[Dict[str, float]] = None
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.queue_depth = queue_depth if queue_depth is not None else JOB_QUEUE_DEPTH
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._finished: Dict[str, asyncio.Event] = {}
+        self._purged_at = 0.0
+        self.processed = 0
+        self.failed = 0
+        self.requeued = 0
+        self.path = path
+        self._db = None
+
+    def open(self):
+        """Connect the queue table (in the worker, after any fork); start() does it too"""
+        if self._db is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=2000")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                priority TEXT NOT NULL,
+                rank INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                digest TEXT,
+                payload BLOB,
+                meta TEXT,
+                result TEXT,
+                error TEXT,
+                status_code INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_until REAL,
+                not_before REAL NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, rank, created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_digest ON jobs (digest, priority)")
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> list:
+        with self._lock:
+            return self._db.execute(sql, parameters).fetchall()
+
+    @staticmethod
+    def _job(row: tuple) -> dict:
+        job = dict(zip([column.strip() for column in _COLUMNS.split(",")], row))
+        job["meta"] = json.loads(job["meta"]) if job["meta"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def submit(self, payload: Optional[bytes], meta: dict, priority: str = PRIORITY_LOGGING,
+               digest: Optional[str] = None, result: Optional[dict] = None) -> dict:
+        """
+        Queue a job (or record it as done when result is already known)
+        A queued or running job for the same digest and priority is returned
+        instead of a new one
+        """
+        if priority not in PRIORITY_RANKS:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {', '.join(PRIORITY_RANKS)}")
+        if digest and result is None:
+            existing = self._execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE digest = ? AND priority = ? AND status IN ('queued', 'running') LIMIT 1",
+                (digest, priority)
+            )
+            if existing:
+                return dict(self._job(existing[0]), deduplicated=True)
+        if result is None:
+            depth = self.queue_depth.get(priority)
+            queued = self._execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND rank = ?", (PRIORITY_RANKS[priority],))[0][0]
+            if depth is not None and queued >= depth:
+                raise UpstreamBusyError(503, f"Job queue is full ({queued} {priority} jobs waiting)", retry_after=JOB_POLL_S * 5)
+
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        status = "done" if result is not None else "queued"
+        self._execute(
+            "INSERT INTO jobs (id, priority, rank, status, digest, payload, meta, result, created_at, finished_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, priority, PRIORITY_RANKS[priority], status, digest, None if result is not None else payload,
+             json.dumps(meta), json.dumps(result) if result is not None else None, now, now if result is not None else None)
+        )
+        if result is None and self._wake:
+            self._wake.set()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        rows = self._execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = self._job(rows[0])
+        if job["status"] == "queued":
+            job["queue_position"] = self._execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (rank < ? OR (rank = ? AND created_at < ?))",
+                (PRIORITY_RANKS[job["priority"]], PRIORITY_RANKS[job["priority"]], job["created_at"])
+            )[0][0]
+        return job
+
+    def claim(self, limit: int = 1, priority: Optional[str] = None) -> List[dict]:
+        """
+        Atomically take up to `limit` runnable jobs (queued, or running on an
+        expired lease with attempts left)
+        A job whose lease ran out JOB_MAX_ATTEMPTS times most likely kills
+        its worker, so it is failed instead of claimed again
+        """
+        now = time.time()
+        self._execute(
+            """
+            UPDATE jobs SET status = 'failed', payload = NULL, error = ?, status_code = 500, finished_at = ?, owner = NULL
+            WHERE status = 'running' AND lease_until < ? AND attempts >= ?
+            """,
+            (f"Analysis failed: worker lost the job {JOB_MAX_ATTEMPTS} times", now, now, JOB_MAX_ATTEMPTS)
+        )
+        rank_filter = "AND rank = ?" if priority else ""
+        rows = self._execute(
+            f"""
+            UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, started_at = ?, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM jobs
+                WHERE ((status = 'queued' AND not_before <= ?) OR (status = 'running' AND lease_until < ? AND attempts < ?)) {rank_filter}
+                ORDER BY rank, created_at LIMIT ?
+            )
+            RETURNING id, priority, payload, meta, attempts, rank, created_at
+            """,
+            (self.owner, now + JOB_LEASE_S, now, now, now, JOB_MAX_ATTEMPTS, *((PRIORITY_RANKS[priority],) if priority else ()), limit)
+        )
+        rows.sort(key=lambda row: (row[5], row[6]))
+        return [
+            {"id": row[0], "priority": row[1], "payload": row[2], "meta": json.loads(row[3]) if row[3] else {}, "attempts": row[4]}
+            for row in rows
+        ]
+
+    def _update_claimed(self, assignments: str, parameters: tuple, job: dict) -> bool:
+        """
+        Update a job this claim still holds (same owner and attempt); False
+        when its lease ran out and another claim took it, whose outcome stands
+        """
+        return bool(self._execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ? AND status = 'running' AND owner = ? AND attempts = ? RETURNING id",
+            (*parameters, job["id"], self.owner, job["attempts"])
+        ))
+
+    def finish(self, job: dict, outcome):
+        """Store a handler outcome: a result dict, or an exception (retried, requeued or failed)"""
+        now = time.time()
+        if isinstance(outcome, UpstreamBusyError):
+            # Shed by the governor: not the job's fault, try again after Retry-After
+            if self._update_claimed(
+                "status = 'queued', owner = NULL, attempts = attempts - 1, not_before = ?", (now + outcome.retry_after,), job
+            ):
+                self.requeued += 1
+            return
+        if isinstance(outcome, Exception) and not isinstance(outcome, HTTPException) and job["attempts"] < JOB_MAX_ATTEMPTS:
+            if self._update_claimed("status = 'queued', owner = NULL, not_before = ?", (now + JOB_POLL_S * 2 ** job["attempts"],), job):
+                self.requeued += 1
+            return
+
+        if isinstance(outcome, Exception):
+            status_code = outcome.status_code if isinstance(outcome, HTTPException) else 500
+            error = outcome.detail if isinstance(outcome, HTTPException) else f"Analysis failed: {str(outcome)}"
+            if not self._update_claimed(
+                "status = 'failed', payload = NULL, error = ?, status_code = ?, finished_at = ?, owner = NULL",
+                (error, status_code, now), job
+            ):
+                return
+            self.failed += 1
+        else:
+            if not self._update_claimed(
+                "status = 'done', payload = NULL, result = ?, finished_at = ?, owner = NULL", (json.dumps(outcome), now), job
+            ):
+                return
+            self.processed += 1
+        event = self._finished.get(job["id"])
+        if event:
+            event.set()
+
+    async def wait(self, job_id: str, timeout: float = JOB_POLL_S) -> Optional[dict]:
+        """The job once it finishes here, or its current state after `timeout` (another process may run it)"""
+        event = self._finished.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if event.is_set():
+                self._finished.pop(job_id, None)
+        return self.get(job_id)
+
+    def forget_waiter(self, job_id: str):
+        self._finished.pop(job_id, None)
+
+    def purge(self, now: Optional[float] = None) -> int:
+        """Drop finished jobs older than JOB_TTL_S"""
+        now = time.time() if now is None else now
+        self._purged_at = now
+        with self._lock:
+            return self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (now - JOB_TTL_S,)
+            ).rowcount
+
+    async def _work(self):
+        while True:
+            jobs = self.claim()
+            if jobs and jobs[0]["priority"] == PRIORITY_BATCH and JOB_BATCH_CLAIM > 1:
+                jobs += self.claim(JOB_BATCH_CLAIM - 1, priority=PRIORITY_BATCH)
+            if not jobs:
+                if time.time() - self._purged_at > 60:
+                    self.purge()
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), JOB_POLL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                outcomes = await self.handler(jobs)
+            except Exception as e:
+                outcomes = [e] * len(jobs)
+            for job, outcome in zip(jobs, outcomes):
+                self.finish(job, outcome)
+
+    def start(self):
+        """Start this process's workers (inside the running event loop)"""
+        self.open()
+        self._wake = asyncio.Event()
+        self.purge()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers and hand their unfinished jobs back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._execute(
+            "UPDATE jobs SET status = 'queued', owner = NULL, attempts = attempts - 1 WHERE status = 'running' AND owner = ?",
+            (self.owner,)
+        )
+
+    def counts(self) -> dict:
+        rows = self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(dict(rows))
+        return counts
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "jobs": self.counts(),
+            "processed": self.processed,
+            "failed": self.failed,
+            "requeued": self.requeued
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Load test for the async model-call layer
+Fires concurrent requests at every Gemini endpoint against a slow fake
+model and checks that they overlap instead of queueing one after another
+"""
+
+import sys
+import os
+import io
+import re
+import json
+import time
+import asyncio
+import itertools
+sys.path.append(os.path.dirname(__file__))
+
+from PIL import Image
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+import ml
+from ml import TextMealRequest, ChatRequest, SuggestRequest
+from text_cache import TextResponseCache
+
+UPSTREAM_LATENCY_S = 0.5
+CONCURRENCY = 10
+
+class SlowFakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+DISH = {"name": "Banana", "weight_g": 118, "kcal": 105, "protein_g": 1, "carbs_g": 27, "fat_g": 0, "confidence": 0.9}
+BATCH_PROMPT = re.compile(r"each of the following (\d+)")
+
+class SlowFakeModel:
+    """Stands in for genai.GenerativeModel with a fixed blocking delay"""
+
+    def generate_content(self, contents, **kwargs):
+        time.sleep(UPSTREAM_LATENCY_S)
+        prompt = contents if isinstance(contents, str) else contents[0]
+        batch = BATCH_PROMPT.search(prompt)
+        if batch:
+            items = [{"item": i, "dishes": [DISH]} for i in range(1, int(batch.group(1)) + 1)]
+            return SlowFakeResponse(json.dumps(items))
+        return SlowFakeResponse(json.dumps([DISH]))
+
+_request_ids = itertools.count()
+
+def make_upload() -> UploadFile:
+    """Build a distinct in-memory JPEG upload like the one /api/infer forwards"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (230, 200, next(_request_ids) % 256)).save(buffer, format="JPEG")
+    buffer.seek(0)
+    return UploadFile(file=buffer, headers=Headers({"content-type": "image/jpeg"}))
+
+async def run_endpoint(name, make_call):
+    """Run CONCURRENCY copies of one endpoint and report wall time"""
+    start = time.perf_counter()
+    await asyncio.gather(*(make_call() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+
+    serial_time = UPSTREAM_LATENCY_S * CONCURRENCY
+    overlapped = elapsed < serial_time / 2
+    status = "✅ overlapped" if overlapped else "❌ serialized"
+    print(f"{name:<16} {CONCURRENCY} requests in {elapsed:.2f}s "
+          f"(serial would be {serial_time:.1f}s) {status}")
+    return overlapped
+
+async def main():
+    ml.gemini_model = SlowFakeModel()
+    ml.gemini_vision_model = SlowFakeModel()
+    # Every /infer call must reach the fake upstream, and nothing is persisted
+    ml.image_cache.clear()
+    ml.image_cache.path = None
+    ml.text_cache = TextResponseCache(path=None)
+    ml.local_classifier = None
+    # Measure plain overlap: no micro-batching, and distinct bodies so single-flight can't merge them
+    ml.text_batcher.window_ms = 0
+    ml.image_batcher.window_ms = 0
+
+    def text_request():
+        return TextMealRequest(description=f"homemade vegetable lasagna #{next(_request_ids)}")
+
+    chat_request = ChatRequest(message="How much protein is in a banana?")
+    # No macro targets, so /suggest-meals goes to the (fake) upstream rather than the meal table
+    suggest_request = SuggestRequest(message="How much protein is in a banana?")
+
+    print(f"🚦 Async load test: {CONCURRENCY} concurrent requests, "
+          f"{UPSTREAM_LATENCY_S}s fake upstream latency\n")
+
+    results = [
+        await run_endpoint("/infer", lambda: ml.infer_nutrition(make_upload())),
+        await run_endpoint("/analyze-text", lambda: ml.analyze_text_meal(text_request())),
+        await run_endpoint("/quick-log", lambda: ml.quick_log_meal(text_request())),
+        await run_endpoint("/nutrition-chat", lambda: ml.nutrition_chat(chat_request)),
+        await run_endpoint("/suggest-meals", lambda: ml.suggest_meals(suggest_request)),
+    ]
+
+    ml.shutdown_executor()
+    return all(results)
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
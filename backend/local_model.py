@@ -0,0 +1,163 @@
+"""
+Local ONNX food classifier tier for /infer
+Runs the YOLOv8n-cls export on CPU and maps food classes to the bundled
+food table for portion and macros; Gemini only sees photos the local
+model is unsure about
+"""
+
+import os
+import io
+import csv
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+try:
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+LOCAL_MODEL_PATH = os.environ.get(
+    "LOCAL_MODEL_PATH",
+    os.path.join(os.path.dirname(__file__), "yolov8n-cls.onnx")
+)
+LOCAL_MODEL_LABELS = os.path.join(os.path.dirname(__file__), "data", "imagenet_food_labels.csv")
+# Below this top-1 probability the photo is escalated to Gemini
+LOCAL_MODEL_MIN_CONFIDENCE = float(os.environ.get("LOCAL_MODEL_MIN_CONFIDENCE", "0.6"))
+# Threads per ONNX session run (0 lets onnxruntime decide)
+LOCAL_MODEL_THREADS = int(os.environ.get("LOCAL_MODEL_THREADS", "0"))
+# Concurrent session runs; each one handles a whole batch
+LOCAL_MODEL_WORKERS = int(os.environ.get("LOCAL_MODEL_WORKERS", "2"))
+LOCAL_MODEL_BATCH_SIZE = int(os.environ.get("LOCAL_MODEL_BATCH_SIZE", "16"))
+
+class LocalFoodClassifier:
+    """ONNX image classifier whose food classes resolve to FoodIndex rows"""
+
+    def __init__(self, food_index, model_path: str = LOCAL_MODEL_PATH, labels_path: str = LOCAL_MODEL_LABELS):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if LOCAL_MODEL_THREADS:
+            options.intra_op_num_threads = LOCAL_MODEL_THREADS
+
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        size = model_input.shape[2]
+        self.input_size = size if isinstance(size, int) else 224
+        num_classes = self.session.get_outputs()[0].shape[-1]
+        num_classes = num_classes if isinstance(num_classes, int) else 1000
+
+        # class id -> food table row (-1 for anything that isn't food)
+        self.food_index = food_index
+        self.class_food = np.full(num_classes, -1, dtype=np.int32)
+        self.class_labels = {}
+        with open(labels_path, newline="") as f:
+            for row in csv.DictReader(f):
+                class_id = int(row["class_id"])
+                food_id = food_index.lookup(row["food"])
+                if class_id < num_classes and food_id is not None:
+                    self.class_food[class_id] = food_id
+                    self.class_labels[class_id] = row["label"]
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=LOCAL_MODEL_WORKERS,
+            thread_name_prefix="onnx"
+        )
+
+    def preprocess(self, encoded_images: List[bytes]) -> np.ndarray:
+        """Decode, center-crop and stack images into one NCHW float32 batch"""
+        size = self.input_size
+        frames = np.empty((len(encoded_images), size, size, 3), dtype=np.uint8)
+
+        for i, encoded in enumerate(encoded_images):
+            image = Image.open(io.BytesIO(encoded))
+            # JPEG draft mode decodes at a reduced scale, skipping most of the IDCT work
+            image.draft("RGB", (size, size))
+            frames[i] = np.asarray(ImageOps.fit(image.convert("RGB"), (size, size), Image.BILINEAR))
+
+        # One vectorized pass for the whole batch: scale to [0, 1] and NHWC -> NCHW
+        batch = frames.astype(np.float32)
+        batch *= 1.0 / 255.0
+        return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+    def predict(self, encoded_images: List[bytes]) -> List[dict]:
+        """Top-1 class, probability and food row for each image"""
+        if not encoded_images:
+            return []
+
+        probabilities = self.session.run(None, {self.input_name: self.preprocess(encoded_images)})[0]
+        probabilities = probabilities.reshape(len(encoded_images), -1)
+        # YOLOv8-cls already ends in softmax; other exports may emit logits
+        if not np.allclose(probabilities.sum(axis=1), 1.0, atol=1e-3):
+            shifted = np.exp(probabilities - probabilities.max(axis=1, keepdims=True))
+            probabilities = shifted / shifted.sum(axis=1, keepdims=True)
+
+        top_classes = probabilities.argmax(axis=1)
+        top_scores = probabilities[np.arange(len(top_classes)), top_classes]
+        food_ids = self.class_food[top_classes]
+
+        return [
+            {
+                "class_id": int(class_id),
+                "label": self.class_labels.get(int(class_id)),
+                "food_id": int(food_id) if food_id >= 0 else None,
+                "confidence": float(score)
+            }
+            for class_id, score, food_id in zip(top_classes, top_scores, food_ids)
+        ]
+
+    def dishes_for(self, prediction: dict) -> Optional[List[dict]]:
+        """Dishes for a confident food prediction, None if it should go to Gemini"""
+        if prediction["food_id"] is None or prediction["confidence"] < LOCAL_MODEL_MIN_CONFIDENCE:
+            return None
+        return [self.food_index.dish(prediction["food_id"], confidence=prediction["confidence"])]
+
+    async def classify_async(self, encoded_image: bytes) -> dict:
+        """Classify one image on the inference pool"""
+        loop = asyncio.get_running_loop()
+        predictions = await loop.run_in_executor(self._executor, self.predict, [encoded_image])
+        return predictions[0]
+
+    async def classify_batch_async(self, encoded_images: List[bytes]) -> List[dict]:
+        """Classify many images, LOCAL_MODEL_BATCH_SIZE per session run, spread over the pool"""
+        loop = asyncio.get_running_loop()
+        chunks = [
+            encoded_images[i:i + LOCAL_MODEL_BATCH_SIZE]
+            for i in range(0, len(encoded_images), LOCAL_MODEL_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, functools.partial(self.predict, chunk))
+            for chunk in chunks
+        ))
+        return [prediction for chunk in results for prediction in chunk]
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def load_local_classifier(food_index) -> Optional[LocalFoodClassifier]:
+    """Create the classifier once at startup, or None when the tier is unavailable"""
+    if not ONNX_AVAILABLE:
+        print("⚠️ onnxruntime not installed - local food model disabled")
+        return None
+    if food_index is None:
+        return None
+    if not os.path.exists(LOCAL_MODEL_PATH):
+        print(f"⚠️ {os.path.basename(LOCAL_MODEL_PATH)} not found - local food model disabled (see download_models.py)")
+        return None
+
+    try:
+        classifier = LocalFoodClassifier(food_index)
+        print(f"✅ Local food model loaded: {os.path.basename(LOCAL_MODEL_PATH)}")
+        return classifier
+    except Exception as e:
+        print(f"⚠️ Failed to load local food model: {e}")
+        return None
@@ -0,0 +1,266 @@
+"""
+Local meal suggestions for /suggest-meals
+"What fits my remaining 650 kcal and 40 g protein" is a search over a
+bundled meal table: every single meal and every main-plus-snacks
+combination is pre-summed into one NumPy array at load time, so a request
+is one vectorized distance computation, a dietary mask and a top-k
+"""
+
+import os
+import re
+import csv
+from itertools import combinations
+from typing import Dict, List, Optional
+
+import numpy as np
+
+MEALS_DB_PATH = os.environ.get(
+    "MEALS_DB_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "meals.csv")
+)
+# Snacks that may accompany one main meal in a suggestion
+MEAL_MAX_SNACKS = int(os.environ.get("MEAL_MAX_SNACKS", "2"))
+
+MACROS = ("kcal", "protein_g", "carbs_g", "fat_g")
+# How much a miss on each macro counts; calories matter most
+MACRO_WEIGHTS = np.array([1.0, 0.8, 0.4, 0.4], dtype=np.float32)
+# Misses are relative to the target, but never to less than this
+MACRO_FLOORS = np.array([150.0, 10.0, 15.0, 8.0], dtype=np.float32)
+# Going over a target is worse than staying under it
+OVERSHOOT_PENALTY = 1.5
+# Per extra item, so a single meal wins a near tie
+EXTRA_ITEM_PENALTY = 0.02
+
+MEAL_TYPES = ("breakfast", "lunch", "dinner", "snack")
+SNACK = MEAL_TYPES.index("snack")
+
+CONTENTS = ("meat", "pork", "fish", "shellfish", "dairy", "egg", "gluten", "nuts", "soy", "sesame")
+
+# Diets and exclusions a request can name, as the contents they rule out
+DIETS = {
+    "vegetarian": {"meat", "pork", "fish", "shellfish"},
+    "vegan": {"meat", "pork", "fish", "shellfish", "dairy", "egg"},
+    "pescatarian": {"meat", "pork"},
+    "halal": {"pork"},
+    "kosher": {"pork", "shellfish"},
+    "gluten_free": {"gluten"},
+    "dairy_free": {"dairy"},
+    "nut_free": {"nuts"},
+    "egg_free": {"egg"},
+    "soy_free": {"soy"},
+    **{content: {content} for content in CONTENTS}
+}
+
+_DIET_PATTERNS = [
+    (re.compile(r"\bvegan\b"), "vegan"),
+    (re.compile(r"\bvegetarian\b"), "vegetarian"),
+    (re.compile(r"\bpescatarian\b|\bpescetarian\b"), "pescatarian"),
+    (re.compile(r"\bhalal\b"), "halal"),
+    (re.compile(r"\bkosher\b"), "kosher"),
+    (re.compile(r"gluten[- ]free|\bceliac\b|\bcoeliac\b"), "gluten_free"),
+    (re.compile(r"dairy[- ]free|lactose"), "dairy_free"),
+    (re.compile(r"(?:pea)?nut[- ]free|(?:pea)?nut allerg|allerg\w* to (?:pea)?nuts?\b|tree nuts?"), "nut_free"),
+    (re.compile(r"allerg\w* to eggs?\b|egg[- ]free"), "egg_free"),
+    (re.compile(r"allerg\w* to (?:soy|soya)\b|soy[- ]free"), "soy_free"),
+    (re.compile(r"allerg\w* to (?:shellfish|shrimp|prawns?)\b|shellfish[- ]free"), "shellfish"),
+    (re.compile(r"allerg\w* to (?:fish|seafood)\b"), "fish"),
+    (re.compile(r"allerg\w* to sesame\b"), "sesame")
+]
+_AVOID = re.compile(r"\b(?:no|without|avoid(?:ing)?|skip(?:ping)?|not eating|don't eat|hate)\s+(\w+)")
+_AVOID_WORDS = {
+    "meat": "meat", "beef": "meat", "chicken": "meat", "lamb": "meat", "turkey": "meat",
+    "pork": "pork", "bacon": "pork", "ham": "pork",
+    "fish": "fish", "seafood": "fish", "salmon": "fish", "tuna": "fish",
+    "shellfish": "shellfish", "shrimp": "shellfish", "prawns": "shellfish",
+    "dairy": "dairy", "milk": "dairy", "cheese": "dairy", "lactose": "dairy",
+    "egg": "egg", "eggs": "egg",
+    "gluten": "gluten", "wheat": "gluten", "bread": "gluten",
+    "nuts": "nuts", "nut": "nuts", "peanuts": "nuts", "peanut": "nuts",
+    "soy": "soy", "tofu": "soy", "sesame": "sesame"
+}
+
+# "650", "1,200" or "1200.5"
+_AMOUNT = r"(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?"
+_KCAL = re.compile(rf"(?<![\d,.])({_AMOUNT})\s*(?:k?cals?|kilocalories|calories)\b")
+_MACRO_AFTER = re.compile(r"(\d{1,3}(?:\.\d+)?)\s*(?:g|grams?)?\s*(?:of\s+)?(protein|carbs?|carbohydrates?|fat)\b")
+_MACRO_BEFORE = re.compile(r"\b(protein|carbs?|carbohydrates?|fat)\s*(?:of|:|=|left|remaining)?\s*(\d{1,3}(?:\.\d+)?)\s*(?:g|grams?)?\b")
+# Figures that are already eaten rather than left ("I ate 500 calories at breakfast")
+_CONSUMED = re.compile(r"\b(?:ate|eaten|had|consumed|burned|burnt|logged|so far)\b")
+_REMAINING = re.compile(r"^\s*(?:left|remaining|to go)\b")
+_CLAUSE_START = re.compile(r".*(?:[.,;!?]|\b(?:and|but|so)\b)", re.DOTALL)
+_MEAL_TYPE = re.compile(r"\b(breakfast|lunch|dinner|supper|snack)\b")
+# The meal a request asks about ("..., what about dinner?", "ideas for lunch")
+_ASKED_MEAL_TYPE = re.compile(r"\b(?:for|about|next)\s+(?:my\s+|the\s+|a\s+)?(breakfast|lunch|dinner|supper|snack)\b")
+_MACRO_NAMES = {"protein": "protein_g", "carb": "carbs_g", "carbs": "carbs_g", "carbohydrate": "carbs_g",
+                "carbohydrates": "carbs_g", "fat": "fat_g"}
+
+def _consumed(text: str, start: int, end: int) -> bool:
+    """Whether the figure at text[start:end] is what was already eaten, not what is left"""
+    if _REMAINING.match(text, end):
+        return False
+    clause = text[:start]
+    opened = _CLAUSE_START.match(clause)
+    return bool(_CONSUMED.search(clause[opened.end() if opened else 0:]))
+
+def _amount(value: str) -> float:
+    return float(value.replace(",", ""))
+
+def parse_targets(text: str) -> Dict[str, float]:
+    """
+    Remaining-macro targets stated in free text ("650 kcal", "1,200 calories
+    left", "40g protein", "carbs: 60"); figures already eaten are skipped
+    """
+    text = text.lower()
+    targets = {}
+    for kcal in _KCAL.finditer(text):
+        if not _consumed(text, kcal.start(), kcal.end()):
+            targets["kcal"] = _amount(kcal.group(1))
+            break
+    for match in _MACRO_AFTER.finditer(text):
+        if not _consumed(text, match.start(), match.end()):
+            targets.setdefault(_MACRO_NAMES[match.group(2)], float(match.group(1)))
+    for match in _MACRO_BEFORE.finditer(text):
+        if not _consumed(text, match.start(), match.end()):
+            targets.setdefault(_MACRO_NAMES[match.group(1)], float(match.group(2)))
+    return targets
+
+def parse_exclusions(text: str) -> set:
+    """Diets, allergies and "no X" phrases in free text, as names accepted by DIETS"""
+    text = text.lower()
+    found = {name for pattern, name in _DIET_PATTERNS if pattern.search(text)}
+    for match in _AVOID.finditer(text):
+        content = _AVOID_WORDS.get(match.group(1))
+        if content:
+            found.add(content)
+    return found
+
+def parse_meal_type(text: str) -> Optional[str]:
+    """The meal asked for ("for lunch", "what about dinner"), else the last one mentioned"""
+    text = text.lower()
+    asked = _ASKED_MEAL_TYPE.findall(text)
+    mentioned = asked or _MEAL_TYPE.findall(text)
+    if not mentioned:
+        return None
+    return "dinner" if mentioned[-1] == "supper" else mentioned[-1]
+
+def normalize_diet(name: str) -> str:
+    return name.strip().lower().replace("-", "_").replace(" ", "_")
+
+class MealPlanner:
+    """
+    Meal table plus every candidate suggestion (a meal alone, one main meal
+    with up to MEAL_MAX_SNACKS snacks, or snacks together) pre-summed
+    Row j of `candidate_macros` is the kcal/protein/carbs/fat of
+    `candidate_items[j]` (meal ids, -1 padded)
+    """
+
+    def __init__(self, path: str = MEALS_DB_PATH, max_snacks: int = MEAL_MAX_SNACKS):
+        self.names, self.descriptions = [], []
+        macros, types, contents = [], [], []
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                self.names.append(row["name"])
+                self.descriptions.append(row["description"])
+                macros.append([float(row[column]) for column in MACROS])
+                types.append(MEAL_TYPES.index(row["meal_type"]))
+                mask = 0
+                for content in filter(None, row["contains"].split(";")):
+                    mask |= 1 << CONTENTS.index(content.strip())
+                contents.append(mask)
+
+        self.macros = np.array(macros, dtype=np.float32)
+        self.meal_types = np.array(types, dtype=np.int8)
+        self.contents = np.array(contents, dtype=np.uint16)
+
+        mains = [i for i, meal_type in enumerate(types) if meal_type != SNACK]
+        snacks = [i for i, meal_type in enumerate(types) if meal_type == SNACK]
+        groups = [(i,) for i in range(len(self.names))]
+        for extra in range(1, max_snacks + 1):
+            groups += [(main, *combo) for main in mains for combo in combinations(snacks, extra)]
+        groups += [combo for size in range(2, max_snacks + 2) for combo in combinations(snacks, size)]
+
+        width = max_snacks + 1
+        items = np.full((len(groups), width), -1, dtype=np.int16)
+        for row, group in enumerate(groups):
+            items[row, :len(group)] = group
+        present = items >= 0
+        safe = np.where(present, items, 0)
+
+        self.candidate_items = items
+        self.candidate_sizes = present.sum(axis=1).astype(np.int8)
+        self.candidate_macros = (self.macros[safe] * present[..., None]).sum(axis=1)
+        # Union of contents and of meal types (as bits) over each candidate's items
+        self.candidate_contents = np.bitwise_or.reduce(np.where(present, self.contents[safe], 0), axis=1).astype(np.uint16)
+        self.candidate_types = np.bitwise_or.reduce(np.where(present, 1 << self.meal_types[safe].astype(np.int16), 0), axis=1).astype(np.int16)
+
+        print(f"✅ Meal planner loaded: {len(self.names)} meals, {len(groups)} candidate combinations")
+
+    def __len__(self):
+        return len(self.names)
+
+    def exclusion_mask(self, exclude) -> int:
+        """Content bits ruled out by diet / allergy names; unknown names raise ValueError"""
+        mask = 0
+        for name in exclude or ():
+            diet = DIETS.get(normalize_diet(name))
+            if diet is None:
+                raise ValueError(f"Unknown dietary exclusion: {name}")
+            for content in diet:
+                mask |= 1 << CONTENTS.index(content)
+        return mask
+
+    def scores(self, targets: Dict[str, float]) -> np.ndarray:
+        """Weighted relative distance of every candidate to the targets (lower is better)"""
+        target = np.array([targets.get(macro, 0.0) for macro in MACROS], dtype=np.float32)
+        weights = MACRO_WEIGHTS * np.array([macro in targets for macro in MACROS], dtype=np.float32)
+        if not weights.any():
+            raise ValueError("No macro targets given")
+        error = (self.candidate_macros - target) / np.maximum(target, MACRO_FLOORS)
+        error = np.where(error > 0, error * OVERSHOOT_PENALTY, error)
+        distance = np.sqrt((error * error) @ weights / weights.sum())
+        return distance + EXTRA_ITEM_PENALTY * (self.candidate_sizes - 1)
+
+    def suggest(self, targets: Dict[str, float], exclude=(), meal_type: Optional[str] = None, count: int = 5) -> List[dict]:
+        """
+        Best-fitting suggestions, each with its own meals (no meal repeats across suggestions)
+        meal_type limits them to that type of meal plus snacks
+        """
+        distance = self.scores(targets)
+        allowed = (self.candidate_contents & self.exclusion_mask(exclude)) == 0
+        if meal_type:
+            wanted = MEAL_TYPES.index(meal_type)
+            allowed &= (self.candidate_types & ~((1 << wanted) | (1 << SNACK))) == 0
+            allowed &= (self.candidate_types & (1 << wanted)) != 0
+
+        candidates = np.flatnonzero(allowed)
+        if not len(candidates):
+            return []
+        # Enough of the best to fill `count` even after skipping repeats
+        shortlist = min(len(candidates), count * 40)
+        best = candidates[np.argpartition(distance[candidates], shortlist - 1)[:shortlist]]
+        best = best[np.argsort(distance[best], kind="stable")]
+
+        suggestions, used = [], set()
+        for row in best:
+            items = [int(i) for i in self.candidate_items[row] if i >= 0]
+            if used.intersection(items):
+                continue
+            used.update(items)
+            suggestions.append(self._suggestion(items, row, float(distance[row])))
+            if len(suggestions) == count:
+                break
+        return suggestions
+
+    def _suggestion(self, items: List[int], row: int, distance: float) -> dict:
+        kcal, protein, carbs, fat = self.candidate_macros[row].tolist()
+        return {
+            "name": " + ".join(self.names[i] for i in items),
+            "description": "; ".join(self.descriptions[i] for i in items),
+            "estimated_kcal": int(round(kcal)),
+            "protein_g": int(round(protein)),
+            "carbs_g": int(round(carbs)),
+            "fat_g": int(round(fat)),
+            "items": [self.names[i] for i in items],
+            # 100 = exactly on target
+            "fit": round(max(0.0, 1.0 - distance) * 100, 1)
+        }
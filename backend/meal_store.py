@@ -0,0 +1,498 @@
+"""
+Memory-mapped columnar meal store, the on-disk history behind the analytics
+Each user's meals live in fixed-width column files: epoch seconds (int64),
+kcal and macros (float32), a dictionary-encoded name (uint32 code into
+names.txt) and a hashed row id (int64). The files are mapped read-only, so a
+time range is a searchsorted slice of the page cache, not a copy
+Rows are append-only. In-order rows extend the sorted region; rows older
+than it go to a short unsorted tail, which compaction merges back into a new
+generation of files once it reaches MEAL_STORE_COMPACT_ROWS
+meta.json is the commit point (row counts, generation, sync high-water
+mark) and is replaced atomically; writers from several workers serialize on
+a lock file, readers pick up their commits via refresh()
+MealSync pulls Meal rows from the Prisma MySQL database after the
+high-water mark (createdAt, id)
+"""
+
+import os
+import re
+import json
+import hashlib
+import calendar
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, unquote
+
+import numpy as np
+
+from analytics import NUTRIENTS, DAY_S, bin_days, hash_ids
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process lock (Windows): give each worker its own MEAL_STORE_DIR
+    fcntl = None
+
+try:
+    import pymysql
+    MYSQL_AVAILABLE = True
+    SYNC_ERRORS = (pymysql.MySQLError, OSError)
+except ImportError:
+    MYSQL_AVAILABLE = False
+    SYNC_ERRORS = (OSError,)
+
+MEAL_STORE_DIR = os.environ.get(
+    "MEAL_STORE_DIR",
+    os.path.join(os.path.dirname(__file__), ".cache", "meal_store")
+)
+# Late (out-of-order) rows kept in the unsorted tail before compaction
+MEAL_STORE_COMPACT_ROWS = int(os.environ.get("MEAL_STORE_COMPACT_ROWS", "16384"))
+# The Prisma database (the frontend's DATABASE_URL); empty disables MySQL sync
+DATABASE_URL = os.environ.get("DATABASE_URL", "")
+# Meal has no user column, so synced rows go to this analytics user
+MEAL_SYNC_USER = os.environ.get("MEAL_SYNC_USER", "demo")
+MEAL_SYNC_BATCH_ROWS = int(os.environ.get("MEAL_SYNC_BATCH_ROWS", "5000"))
+# Seconds between background syncs (0: only on POST /analytics/sync)
+MEAL_SYNC_INTERVAL_S = float(os.environ.get("MEAL_SYNC_INTERVAL_S", "300"))
+
+# Column file -> (dtype, values per row)
+COLUMNS = {
+    "timestamps": (np.int64, 1),
+    "values": (np.float32, len(NUTRIENTS)),
+    "names": (np.uint32, 1),
+    "ids": (np.int64, 1)
+}
+# Row id hash of rows that came without one
+NO_ID = 0
+
+# Changed rows remembered for refresh(); past this it reports None (everything) instead
+CHANGED_ROWS_LIMIT = 65536
+
+_NO_ROWS = np.empty(0, dtype=np.int64)
+_UNSAFE = re.compile(r"[^A-Za-z0-9_-]+")
+
+def _empty_meta() -> dict:
+    return {
+        "generation": 0,
+        "rows": 0,
+        "sorted_rows": 0,
+        "names": 0,
+        "names_bytes": 0,
+        "compactions": 0,
+        "high_water": None
+    }
+
+def _contains(known: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Membership of values in the sorted array known"""
+    if not len(known):
+        return np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(known, values), len(known) - 1)
+    return known[positions] == values
+
+def _insert_sorted(known: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """known with values merged in, still sorted and unique (one copy, no re-sort of known)"""
+    values = np.unique(values)
+    values = values[~_contains(known, values)]
+    return np.insert(known, np.searchsorted(known, values), values)
+
+class MealStore:
+    """One user's column files; extend() / day_sums() like analytics.MealHistory, plus range() and compaction"""
+
+    def __init__(self, path: str, compact_rows: int = MEAL_STORE_COMPACT_ROWS):
+        self.path = path
+        self.compact_rows = compact_rows
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        # (meta, mapped columns), swapped as one so readers see a consistent pair
+        self._view = (_empty_meta(), {column: self._empty(column, 0) for column in COLUMNS})
+        self._meta_stamp = None
+        self._dictionary: List[str] = []
+        self._codes: Dict[str, int] = {}
+        # Sorted unique row id hashes, built on the first extend() with ids
+        self._ids: Optional[np.ndarray] = None
+        # Timestamps of rows added since the last refresh() (None: unknown, a compaction moved them)
+        self._changed: Optional[np.ndarray] = _NO_ROWS
+        self.late_rows = 0
+        self._reload()
+
+    def __len__(self):
+        return self._view[0]["rows"]
+
+    @property
+    def high_water(self) -> Optional[dict]:
+        return self._view[0]["high_water"]
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _column_file(self, column: str, generation: int) -> str:
+        return self._file(f"{column}.{generation}.bin")
+
+    @staticmethod
+    def _empty(column: str, rows: int) -> np.ndarray:
+        dtype, width = COLUMNS[column]
+        return np.zeros((rows, width) if width > 1 else rows, dtype=dtype)
+
+    def _map(self, column: str, generation: int, rows: int) -> np.ndarray:
+        if rows == 0:
+            return self._empty(column, 0)
+        dtype, width = COLUMNS[column]
+        return np.memmap(
+            self._column_file(column, generation), dtype=dtype, mode="r",
+            shape=(rows, width) if width > 1 else (rows,)
+        )
+
+    def refresh(self) -> Optional[np.ndarray]:
+        """
+        Pick up commits from other workers; returns the timestamps of every
+        row added since the last call (here or there), or None when another
+        worker's compaction hid which ones
+        """
+        with self._lock:
+            self._note(self._reload())
+            changed, self._changed = self._changed, _NO_ROWS
+            return changed
+
+    def _note(self, added: Optional[np.ndarray]):
+        if added is None or self._changed is None or len(self._changed) + len(added) > CHANGED_ROWS_LIMIT:
+            self._changed = None
+        elif len(added):
+            self._changed = np.concatenate([self._changed, added])
+
+    def _reload(self) -> Optional[np.ndarray]:
+        """Load meta.json if another worker replaced it; returns the timestamps of the rows it added"""
+        for _ in range(3):
+            try:
+                stat = os.stat(self._file("meta.json"))
+                stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                if stamp == self._meta_stamp:
+                    return _NO_ROWS
+                with open(self._file("meta.json"), encoding="utf-8") as f:
+                    meta = json.load(f)
+                added = self._load(meta)
+                self._meta_stamp = stamp
+                return added
+            except FileNotFoundError:
+                if not os.path.exists(self._file("meta.json")):
+                    return _NO_ROWS
+                # Compacted again between reading meta and mapping its files
+                continue
+        return _NO_ROWS
+
+    def _load(self, meta: dict) -> Optional[np.ndarray]:
+        old_meta, _ = self._view
+        columns = {column: self._map(column, meta["generation"], meta["rows"]) for column in COLUMNS}
+        if meta["names_bytes"] > old_meta["names_bytes"]:
+            with open(self._file("names.txt"), "rb") as f:
+                f.seek(old_meta["names_bytes"])
+                chunk = f.read(meta["names_bytes"] - old_meta["names_bytes"])
+            for name in chunk.decode("utf-8").split("\n")[:-1]:
+                self._codes[name] = len(self._dictionary)
+                self._dictionary.append(name)
+        self._view = (meta, columns)
+
+        if meta["generation"] != old_meta["generation"]:
+            self._ids = None
+            return None if old_meta["rows"] else columns["timestamps"][:meta["rows"]]
+        added = slice(old_meta["rows"], meta["rows"])
+        if self._ids is not None:
+            ids = columns["ids"][added]
+            self._ids = _insert_sorted(self._ids, ids[ids != NO_ID])
+        return columns["timestamps"][added]
+
+    def _known_ids(self) -> np.ndarray:
+        if self._ids is None:
+            ids = np.unique(self._view[1]["ids"])
+            self._ids = ids[ids != NO_ID]
+        return self._ids
+
+    @contextmanager
+    def _writing(self):
+        """Thread lock plus the cross-worker lock file, with other workers' commits loaded"""
+        with self._lock, open(self._file("store.lock"), "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._note(self._reload())
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _commit(self, meta: dict):
+        temporary = self._file("meta.json.tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temporary, self._file("meta.json"))
+        stat = os.stat(self._file("meta.json"))
+        self._load(meta)
+        self._meta_stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _encode(self, names: Optional[List[str]], count: int, meta: dict) -> np.ndarray:
+        """Dictionary codes for names, appending new ones to names.txt"""
+        names = names if names is not None else [""] * count
+        codes = np.empty(count, dtype=np.uint32)
+        new_names = []
+        pending = {}
+        for i, name in enumerate(names):
+            name = (name or "").replace("\n", " ").strip()
+            code = self._codes.get(name, pending.get(name))
+            if code is None:
+                code = pending[name] = len(self._dictionary) + len(new_names)
+                new_names.append(name)
+            codes[i] = code
+        if new_names:
+            chunk = "".join(name + "\n" for name in new_names).encode("utf-8")
+            with open(self._file("names.txt"), "ab") as f:
+                f.truncate(meta["names_bytes"])
+                f.write(chunk)
+            meta["names"] += len(new_names)
+            meta["names_bytes"] += len(chunk)
+        return codes
+
+    def _write_rows(self, generation: int, start: int, columns: Dict[str, np.ndarray]):
+        """Write rows at `start` of each column file, cutting off anything a crashed write left after them"""
+        for column, array in columns.items():
+            path = self._column_file(column, generation)
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.seek(start * array[:1].nbytes if len(array) else 0)
+                f.write(np.ascontiguousarray(array).tobytes())
+                f.truncate()
+
+    def extend(self, timestamps: np.ndarray, values: np.ndarray, ids: Optional[np.ndarray] = None,
+               names: Optional[List[str]] = None, high_water: Optional[dict] = None) -> np.ndarray:
+        """
+        Append rows (skipping ids already stored); returns the timestamps
+        actually added. high_water is committed together with the rows
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float32).reshape(len(timestamps), len(NUTRIENTS))
+        with self._writing():
+            meta = dict(self._view[0])
+            if ids is not None and len(ids):
+                ids = np.asarray(ids, dtype=np.int64)
+                unique, first = np.unique(ids, return_index=True)
+                keep = np.sort(first[~_contains(self._known_ids(), unique)])
+                timestamps, values, ids = timestamps[keep], values[keep], ids[keep]
+                names = [names[i] for i in keep.tolist()] if names is not None else None
+            else:
+                ids = np.full(len(timestamps), NO_ID, dtype=np.int64)
+            if high_water is not None:
+                meta["high_water"] = high_water
+            if not len(timestamps):
+                if high_water is not None:
+                    self._commit(meta)
+                return timestamps
+
+            codes = self._encode(names, len(timestamps), meta)
+            order = np.argsort(timestamps, kind="stable")
+            timestamps, values, codes, ids = timestamps[order], values[order], codes[order], ids[order]
+            rows = meta["rows"]
+            stored = self._view[1]["timestamps"]
+            in_order = meta["sorted_rows"] == rows and (rows == 0 or timestamps[0] >= stored[rows - 1])
+            self._write_rows(meta["generation"], rows, {
+                "timestamps": timestamps, "values": values, "names": codes, "ids": ids
+            })
+            meta["rows"] = rows + len(timestamps)
+            if in_order:
+                meta["sorted_rows"] = meta["rows"]
+            else:
+                self.late_rows += len(timestamps)
+            self._commit(meta)
+            self._note(timestamps)
+            if meta["rows"] - meta["sorted_rows"] >= self.compact_rows:
+                self._compact()
+        return timestamps
+
+    def compact(self):
+        """Merge the unsorted tail into the sorted region"""
+        with self._writing():
+            self._compact()
+
+    def _compact(self):
+        meta, columns = self._view
+        rows, sorted_rows = meta["rows"], meta["sorted_rows"]
+        if rows == sorted_rows:
+            return
+        timestamps = columns["timestamps"]
+        # Merge, not re-sort: each tail row lands after the sorted rows not later than it
+        tail = sorted_rows + np.argsort(timestamps[sorted_rows:rows], kind="stable")
+        positions = np.searchsorted(timestamps[:sorted_rows], timestamps[tail], side="right") + np.arange(len(tail))
+        order = np.empty(rows, dtype=np.int64)
+        from_tail = np.zeros(rows, dtype=bool)
+        from_tail[positions] = True
+        order[positions] = tail
+        order[~from_tail] = np.arange(sorted_rows)
+
+        generation = meta["generation"] + 1
+        for column in COLUMNS:
+            columns[column][order].tofile(self._column_file(column, generation))
+        self._commit(dict(meta, generation=generation, sorted_rows=rows, compactions=meta["compactions"] + 1))
+        for column in COLUMNS:
+            try:
+                # Mappings of the old files (here or in other workers) stay valid after unlink
+                os.remove(self._column_file(column, meta["generation"]))
+            except FileNotFoundError:
+                pass
+
+    def range(self, start_s: int, end_s: int) -> dict:
+        """
+        Rows with start_s <= timestamp < end_s, sorted; the arrays are
+        views of the mapped files (no copy) unless tail rows fall in range
+        """
+        meta, columns = self._view
+        sorted_rows, rows = meta["sorted_rows"], meta["rows"]
+        start, end = np.searchsorted(columns["timestamps"][:sorted_rows], [start_s, end_s])
+        found = {column: columns[column][start:end] for column in COLUMNS}
+        if rows > sorted_rows:
+            tail_timestamps = columns["timestamps"][sorted_rows:rows]
+            late = sorted_rows + np.flatnonzero((tail_timestamps >= start_s) & (tail_timestamps < end_s))
+            if len(late):
+                found = {column: np.concatenate([found[column], columns[column][late]]) for column in COLUMNS}
+                order = np.argsort(found["timestamps"], kind="stable")
+                found = {column: array[order] for column, array in found.items()}
+        return found
+
+    def decode(self, codes: np.ndarray) -> List[str]:
+        """Food names of name-column codes"""
+        dictionary = self._dictionary
+        return [dictionary[code] for code in np.asarray(codes).tolist()]
+
+    def day_sums(self, first_day: int, last_day: int, offset_s: int) -> np.ndarray:
+        """(days, 1 + NUTRIENTS) meal counts and sums for local days first_day..last_day"""
+        meta, columns = self._view
+        sorted_rows, rows = meta["sorted_rows"], meta["rows"]
+        start_s, end_s = first_day * DAY_S - offset_s, (last_day + 1) * DAY_S - offset_s
+        timestamps, values = columns["timestamps"], columns["values"]
+        days = last_day - first_day + 1
+        start, end = np.searchsorted(timestamps[:sorted_rows], [start_s, end_s])
+        sums = bin_days(timestamps[start:end], values[start:end], first_day, days, offset_s)
+        if rows > sorted_rows:
+            tail_timestamps = timestamps[sorted_rows:rows]
+            late = (tail_timestamps >= start_s) & (tail_timestamps < end_s)
+            sums += bin_days(tail_timestamps[late], values[sorted_rows:rows][late], first_day, days, offset_s)
+        return sums
+
+    def stats(self) -> dict:
+        meta, columns = self._view
+        return {
+            "rows": meta["rows"],
+            "tail_rows": meta["rows"] - meta["sorted_rows"],
+            "names": meta["names"],
+            "generation": meta["generation"],
+            "compactions": meta["compactions"],
+            "late_rows": self.late_rows,
+            "bytes": sum(array.nbytes for array in columns.values()) + meta["names_bytes"]
+        }
+
+class MealStores:
+    """A MealStore directory per user under root, one open instance each per process"""
+
+    def __init__(self, root: str = MEAL_STORE_DIR, compact_rows: int = MEAL_STORE_COMPACT_ROWS):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.compact_rows = compact_rows
+        self._open: "weakref.WeakValueDictionary[str, MealStore]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def directory(self, user_id: str) -> str:
+        # Readable prefix plus a hash, so distinct ids never share a directory
+        digest = hashlib.blake2b(user_id.encode(), digest_size=6).hexdigest()
+        return os.path.join(self.root, f"{_UNSAFE.sub('_', user_id)[:40]}-{digest}")
+
+    def open(self, user_id: str) -> MealStore:
+        with self._lock:
+            store = self._open.get(user_id)
+            if store is None:
+                store = self._open[user_id] = MealStore(self.directory(user_id), self.compact_rows)
+            return store
+
+    def stats(self) -> dict:
+        with self._lock:
+            stores = list(self._open.values())
+        return {
+            "open_stores": len(stores),
+            "rows": sum(len(store) for store in stores),
+            "tail_rows": sum(store.stats()["tail_rows"] for store in stores),
+            "compactions": sum(store.stats()["compactions"] for store in stores)
+        }
+
+# Keyset pagination on (createdAt, id), Prisma's Meal table
+SYNC_QUERY = (
+    "SELECT id, name, kcal, protein_g, carbs_g, fat_g, createdAt FROM `Meal` "
+    "WHERE createdAt > %s OR (createdAt = %s AND id > %s) "
+    "ORDER BY createdAt, id LIMIT %s"
+)
+
+class MealSync:
+    """
+    Incremental copy of the MySQL Meal table into a MealStore, resuming
+    after the (createdAt, id) high-water mark committed with the last batch
+    Only catches rows created after the mark; Meal has no updatedAt, so
+    edits to old rows are not seen
+    """
+
+    def __init__(self, store: MealStore, database_url: str = DATABASE_URL, batch_rows: int = MEAL_SYNC_BATCH_ROWS):
+        url = urlsplit(database_url)
+        if url.scheme != "mysql":
+            raise ValueError(f"DATABASE_URL must be a mysql:// URL, got {url.scheme or 'none'}")
+        self.store = store
+        self.batch_rows = batch_rows
+        self._connect_args = {
+            "host": url.hostname or "localhost",
+            "port": url.port or 3306,
+            "user": unquote(url.username or ""),
+            "password": unquote(url.password or ""),
+            "database": url.path.lstrip("/"),
+            "charset": "utf8mb4"
+        }
+        self.runs = 0
+        self.rows_added = 0
+        self.errors = 0
+        self.last_error = None
+
+    def sync(self) -> int:
+        """Copy every row past the high-water mark; returns how many were new"""
+        if not MYSQL_AVAILABLE:
+            raise RuntimeError("pymysql is not installed")
+        added = 0
+        try:
+            connection = pymysql.connect(**self._connect_args)
+            try:
+                with connection.cursor() as cursor:
+                    while True:
+                        mark = self.store.high_water or {"createdAt": "1970-01-01 00:00:00.000", "id": ""}
+                        cursor.execute(SYNC_QUERY, (mark["createdAt"], mark["createdAt"], mark["id"], self.batch_rows))
+                        rows = cursor.fetchall()
+                        if not rows:
+                            break
+                        added += len(self.store.extend(
+                            np.array([calendar.timegm(row[6].timetuple()) for row in rows], dtype=np.int64),
+                            np.array([row[2:6] for row in rows], dtype=np.float32),
+                            hash_ids([row[0] for row in rows]),
+                            [row[1] for row in rows],
+                            high_water={"createdAt": rows[-1][6].isoformat(sep=" ", timespec="milliseconds"), "id": rows[-1][0]}
+                        ))
+                        if len(rows) < self.batch_rows:
+                            break
+            finally:
+                connection.close()
+        except SYNC_ERRORS as e:
+            self.errors += 1
+            self.last_error = str(e)
+            raise
+        finally:
+            self.runs += 1
+            self.rows_added += added
+        return added
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "rows_added": self.rows_added,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "high_water": self.store.high_water
+        }
@@ -0,0 +1,207 @@
+"""
+Prometheus metrics for the API
+Small hand-rolled counters, gauges and histograms rendered in the
+Prometheus text exposition format; recording a sample is a dict lookup and
+a few additions, so instrumentation costs microseconds per request
+"""
+
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Tuple
+
+# Request and upstream latencies (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Local stages: decode, parse, local model
+STAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+# Prompt sizes (tokens)
+TOKEN_BUCKETS = (100, 200, 400, 600, 800, 1000, 1500, 2000, 4000, 8000, 16000)
+
+_registry = []
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), function: Callable = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, object] = {}
+        # Optional function() -> {labels: value}, read at scrape time instead of _values
+        self.function = function
+        _registry.append(self)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list:
+        values = self._values
+        if self.function is not None:
+            try:
+                values = self.function()
+            except Exception as e:
+                print(f"⚠️ Metric {self.name} unavailable: {e}")
+                values = {}
+        lines = self._header()
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    """Monotonic count per label set"""
+    kind = "counter"
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(_Metric):
+    """Current value per label set"""
+    kind = "gauge"
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: Tuple = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value: float, labels: Tuple = ()):
+        self._values[labels] = value
+
+class Histogram(_Metric):
+    """Bucketed observations per label set (stored non-cumulative, rendered cumulative)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels: Tuple = ()):
+        series = self._values.get(labels)
+        if series is None:
+            # one slot per bucket plus +Inf, then sum
+            series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, labels: Tuple = ()):
+        return _Timer(self, labels)
+
+    def render(self) -> list:
+        lines = self._header()
+        bounds = [*map(_format_value, self.buckets), "+Inf"]
+        for labels, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+class _Timer:
+    """Context manager that observes the elapsed time of its block"""
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: Tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, self.labels)
+
+def render() -> str:
+    """All registered metrics in Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+REQUEST_LATENCY = Histogram(
+    "intake_request_duration_seconds", "HTTP request latency by endpoint",
+    ("method", "endpoint")
+)
+REQUESTS = Counter(
+    "intake_requests_total", "HTTP requests by endpoint and status code",
+    ("method", "endpoint", "status")
+)
+REQUESTS_IN_FLIGHT = Gauge("intake_requests_in_flight", "HTTP requests currently being served")
+STAGE_LATENCY = Histogram(
+    "intake_stage_duration_seconds", "Time spent per processing stage (decode, local_model, parse, meal_search, interaction_check, analytics)",
+    ("stage",), buckets=STAGE_BUCKETS
+)
+UPSTREAM_LATENCY = Histogram(
+    "intake_upstream_duration_seconds", "Gemini call latency (streams: until the last chunk)",
+    ("priority",)
+)
+UPSTREAM_ERRORS = Counter(
+    "intake_upstream_errors_total", "Failed Gemini calls by kind (error, timeout, rate_limited)",
+    ("kind",)
+)
+UPSTREAM_TOKENS = Counter(
+    "intake_upstream_tokens_total", "Gemini tokens reported by usage metadata",
+    ("direction",)
+)
+PROMPT_TOKENS = Histogram(
+    "intake_prompt_tokens", "Estimated prompt tokens per chat call, after context compaction",
+    ("endpoint",), buckets=TOKEN_BUCKETS
+)
+PARSE_FAILURES = Counter(
+    "intake_parse_failures_total", "Model answers that yielded no usable dishes",
+    ("endpoint",)
+)
+FALLBACK_DISHES = Counter(
+    "intake_fallback_dishes_total", "\"Unknown Food\" placeholder answers returned",
+    ("endpoint",)
+)
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency and status per route template
+    (so /infer/jobs/{id} is one series, not one per id) and the in-flight count
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+        REQUESTS_IN_FLIGHT.inc()
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            REQUEST_LATENCY.observe(time.perf_counter() - started, (method, endpoint))
+            REQUESTS.inc((method, endpoint, str(status[0])))
@@ -3,50 +3,100 @@ Gemini-powered Food Analysis & Nutrition Tracking API
 Production-ready backend with Google Gemini AI
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+# Load environment variables from .env file before any module reads its settings
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+    print("✅ Loaded environment from .env file")
+except ImportError:
+    print("⚠️ python-dotenv not installed, using system environment variables")
+
+from fastapi import FastAPI, UploadFile, File, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional, List
-import uvicorn
+from typing import Callable, Dict, Optional, List
+from contextlib import asynccontextmanager
+from importlib.util import find_spec
 import os
 import io
 import json
 import base64
 import re
+import asyncio
 
-# Load environment variables from .env file
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-    print("✅ Loaded environment from .env file")
-except ImportError:
-    print("⚠️ python-dotenv not installed, using system environment variables")
+from upstream import generate_content_async, stream_content_async, shutdown_executor
+from governor import governor, UpstreamBusyError, PRIORITY_LOGGING, PRIORITY_CHAT, PRIORITY_BATCH
+from metrics import (
+    MetricsMiddleware, Counter, Gauge, render as render_metrics,
+    STAGE_LATENCY, PROMPT_TOKENS, PARSE_FAILURES, FALLBACK_DISHES
+)
+from text_cache import TextResponseCache
+from chat_context import ContextManager, count_tokens
+from singleflight import SingleFlight, content_key
+from shared_state import open_shared_state
+from dish_stream import (
+    DishStreamParser, parse_dishes, validate_dish, validate_dishes, DISH_DEFAULTS,
+    DISH_LIST_CONFIG, SINGLE_DISH_CONFIG, BATCH_DISH_CONFIG
+)
+from batching import (
+    MicroBatcher, pack_items, parse_batch_response, estimate_tokens,
+    BATCH_MAX_ITEMS, BATCH_MAX_PROMPT_TOKENS, BATCH_MAX_ITEMS_PER_PROMPT,
+    BATCH_MAX_IMAGES_PER_PROMPT, IMAGE_TOKENS
+)
+# Light modules: Pillow and numpy are only imported when first used
+from image_pipeline import ImageRejectedError, UploadLimitMiddleware, IMAGE_MAX_BYTES, preprocess_image_async, scan_upload_async
+from image_pipeline import shutdown_executor as shutdown_image_executor
+from image_cache import PerceptualHashCache
+from jobs import JobQueue, PRIORITY_RANKS as JOB_PRIORITIES
 
-# Google Gemini AI
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
+def installed(module: str) -> bool:
+    """Whether a module can be imported, without importing it"""
+    try:
+        return find_spec(module) is not None
+    except (ImportError, ValueError):
+        return False
+
+# google.generativeai, Pillow, numpy and onnxruntime are heavy; they are
+# imported by the startup hook (or the first request), not here
+GEMINI_AVAILABLE = installed("google.generativeai")
+if not GEMINI_AVAILABLE:
     print("⚠️ Google Generative AI not installed. Run: pip install google-generativeai")
-    GEMINI_AVAILABLE = False
 
-try:
-    from PIL import Image
-    PIL_AVAILABLE = True
-except ImportError:
+PIL_AVAILABLE = installed("PIL")
+if not PIL_AVAILABLE:
     print("⚠️ Pillow not available")
-    PIL_AVAILABLE = False
 
-try:
-    import numpy as np
-    NUMPY_AVAILABLE = True
-except ImportError:
-    NUMPY_AVAILABLE = False
+NUMPY_AVAILABLE = installed("numpy")
+
+# Send a one-token probe at startup so the first real request doesn't pay
+# for connection setup (costs one API call per worker start)
+GEMINI_WARMUP = os.environ.get("GEMINI_WARMUP", "0").lower() in ("1", "true", "yes")
+GEMINI_WARMUP_TIMEOUT_S = float(os.environ.get("GEMINI_WARMUP_TIMEOUT_S", "5"))
+# Let Gemini write the descriptions of locally chosen /suggest-meals results;
+# off by default, so a suggestion costs no API call unless a request asks (phrase)
+SUGGEST_PHRASE_WITH_GEMINI = os.environ.get("SUGGEST_PHRASE_WITH_GEMINI", "0").lower() in ("1", "true", "yes")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load models and caches before serving; release pools on exit"""
+    await startup()
+    job_queue.start()
+    sync_task = asyncio.create_task(sync_meals_periodically()) if meal_sync else None
+    yield
+    if sync_task:
+        sync_task.cancel()
+    await job_queue.stop()
+    release_upstream_pool()
 
 app = FastAPI(
     title="Intake Tracker API",
     description="AI-powered food recognition and nutrition tracking with Google Gemini",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -57,6 +107,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Room for multipart boundaries and part headers on top of the image bytes
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Oversized uploads are refused before the multipart parser spools them
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={
+        "/infer": IMAGE_MAX_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/infer/stream": IMAGE_MAX_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/infer/jobs": IMAGE_MAX_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/infer/batch": BATCH_MAX_ITEMS * (IMAGE_MAX_BYTES + MULTIPART_OVERHEAD_BYTES)
+    }
+)
+
+# Outermost, so latency covers CORS and error handling too
+app.add_middleware(MetricsMiddleware)
+
 # Configure Gemini
 gemini_model = None
 gemini_vision_model = None
@@ -74,6 +141,7 @@ def initialize_gemini():
         return False
     
     try:
+        import google.generativeai as genai
         genai.configure(api_key=api_key)
         
         # Text model for nutrition advice and meal logging
@@ -88,8 +156,213 @@ def initialize_gemini():
         print(f"⚠️ Failed to initialize Gemini: {e}")
         return False
 
-# Initialize on startup
-initialize_gemini()
+# Near-duplicate photo cache for /infer (entries are loaded at startup; exact hashes are shared across workers)
+image_cache = PerceptualHashCache() if PIL_AVAILABLE else None
+
+# Offline nutrition table that answers simple /quick-log entries (loaded at startup)
+food_index = None
+
+# Local ONNX classifier tier for /infer (needs onnxruntime and yolov8n-cls.onnx)
+local_classifier = None
+
+# Bundled meal table that answers macro-targeted /suggest-meals requests (loaded at startup)
+meal_planner = None
+
+# Compiled symptom/topic lexicon for the chat endpoints (loaded at startup)
+symptom_detector = None
+
+# Drug-food interaction knowledge base, compiled into hash indexes (loaded at startup)
+interaction_checker = None
+
+# Shared (cross-worker) cache for /analyze-text and /quick-log answers (its SQLite tier is opened at startup)
+text_cache = TextResponseCache()
+
+# Host-wide caches, quota buckets and single-flight leases shared by all workers (opened at startup)
+shared_state = None
+
+# Answers to context-free /nutrition-chat questions, matched by meaning (created at startup)
+chat_cache = None
+
+# Columnar meal histories and closed-day rollups for /analytics/report (created at startup)
+analytics_engine = None
+
+# Memory-mapped per-user meal stores behind the analytics histories, and the MySQL sync into them
+meal_stores = None
+meal_sync = None
+
+def load_local_models():
+    """
+    Symptom lexicon, interaction knowledge base, food and meal tables and the
+    ONNX classifier (imports numpy, Pillow, onnxruntime)
+    """
+    global food_index, local_classifier, meal_planner, symptom_detector, interaction_checker
+    
+    try:
+        from symptom_detector import SymptomDetector
+        symptom_detector = SymptomDetector()
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Failed to load symptom lexicon: {e}")
+    
+    try:
+        from interactions import InteractionChecker
+        interaction_checker = InteractionChecker()
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Failed to load interaction knowledge base: {e}")
+    
+    if not NUMPY_AVAILABLE:
+        return
+    try:
+        from meal_planner import MealPlanner
+        meal_planner = MealPlanner()
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Failed to load meal table: {e}")
+    
+    try:
+        from food_index import FoodIndex
+        food_index = FoodIndex()
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Failed to load food index: {e}")
+        return
+    
+    if PIL_AVAILABLE:
+        from local_model import load_local_classifier
+        local_classifier = load_local_classifier(food_index)
+
+def load_caches():
+    """
+    Caches and stores, opened here rather than at import so each worker
+    connects its own SQLite files after uvicorn forks it
+    """
+    global chat_cache, analytics_engine, meal_stores, meal_sync
+    
+    share_state(open_shared_state())
+    text_cache.open()
+    if NUMPY_AVAILABLE:
+        from semantic_cache import SemanticChatCache
+        from analytics import AnalyticsEngine
+        chat_cache = SemanticChatCache(shared=shared_state)
+        load_meal_stores()
+        analytics_engine = AnalyticsEngine(history_factory=meal_stores.open if meal_stores else None)
+    if image_cache:
+        image_cache.load()
+    text_cache.purge_expired()
+    if shared_state:
+        shared_state.purge_expired()
+
+def share_state(state):
+    """Point the governor, caches and single-flight at the host's shared state (None: per worker)"""
+    global shared_state
+    shared_state = state
+    governor.share(state)
+    inflight.shared = state
+    if image_cache:
+        image_cache.shared = state
+    if chat_cache:
+        chat_cache.shared = state
+
+def load_meal_stores():
+    """Open the meal store directory and, with DATABASE_URL set, the MySQL sync into it"""
+    global meal_stores, meal_sync
+    from meal_store import MealStores, MealSync, MEAL_STORE_DIR, MEAL_SYNC_USER, DATABASE_URL, MYSQL_AVAILABLE
+    
+    if not MEAL_STORE_DIR:
+        return
+    try:
+        meal_stores = MealStores()
+    except OSError as e:
+        print(f"⚠️ Meal store unavailable, keeping analytics histories in memory: {e}")
+        return
+    if not DATABASE_URL:
+        return
+    if not MYSQL_AVAILABLE:
+        print("⚠️ pymysql not installed - MySQL meal sync disabled. Run: pip install pymysql")
+        return
+    try:
+        meal_sync = MealSync(meal_stores.open(MEAL_SYNC_USER))
+        print(f"✅ MySQL meal sync into analytics user {MEAL_SYNC_USER!r}")
+    except (OSError, ValueError) as e:
+        print(f"⚠️ MySQL meal sync disabled: {e}")
+
+async def sync_meals_periodically():
+    """Pull new Meal rows from MySQL every MEAL_SYNC_INTERVAL_S"""
+    from meal_store import MEAL_SYNC_INTERVAL_S, SYNC_ERRORS
+    
+    if MEAL_SYNC_INTERVAL_S <= 0:
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            added = await loop.run_in_executor(None, meal_sync.sync)
+            if added:
+                print(f"✅ Synced {added} meals from MySQL")
+        except SYNC_ERRORS as e:
+            print(f"⚠️ MySQL meal sync failed: {e}")
+        await asyncio.sleep(MEAL_SYNC_INTERVAL_S)
+
+def warm_image_pipeline():
+    """Run a tiny upload through preprocessing so Pillow and numpy are loaded"""
+    from PIL import Image
+    from image_pipeline import preprocess_image
+    
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buffer, format="JPEG")
+    preprocess_image(buffer.getvalue())
+
+async def warm_up():
+    """Open the Gemini connection and load the image stack before the first request"""
+    loop = asyncio.get_running_loop()
+    tasks = []
+    if PIL_AVAILABLE:
+        tasks.append(loop.run_in_executor(None, warm_image_pipeline))
+    if gemini_model:
+        tasks.append(generate_content_async(gemini_model, "Reply with OK", generation_config={"max_output_tokens": 1}))
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks), GEMINI_WARMUP_TIMEOUT_S)
+    except Exception as e:
+        print(f"⚠️ Warm-up incomplete: {e}")
+
+startup_timings = {"import_ms": None, "startup_ms": None, "warmup_ms": None, "ready_ms": None}
+
+async def startup(warm: bool = GEMINI_WARMUP):
+    """
+    Model and cache setup, run by the lifespan hook before the worker serves
+    The blocking loaders run side by side on threads
+    """
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        loop.run_in_executor(None, initialize_gemini),
+        loop.run_in_executor(None, load_local_models),
+        loop.run_in_executor(None, load_caches)
+    )
+    startup_timings["startup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    
+    if warm:
+        warm_started = time.perf_counter()
+        await warm_up()
+        startup_timings["warmup_ms"] = round((time.perf_counter() - warm_started) * 1000, 1)
+    
+    startup_timings["ready_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+    print(
+        f"✅ Ready in {startup_timings['ready_ms']}ms "
+        f"(import {startup_timings['import_ms']}ms, startup {startup_timings['startup_ms']}ms"
+        + (f", warm-up {startup_timings['warmup_ms']}ms)" if warm else ")")
+    )
+
+def release_upstream_pool():
+    """Stop the shared Gemini, image and ONNX thread pools when the worker exits"""
+    shutdown_executor()
+    if local_classifier:
+        local_classifier.close()
+    if PIL_AVAILABLE:
+        shutdown_image_executor()
+        image_cache.save()
+    text_cache.close()
+    job_queue.close()
+    if shared_state:
+        state = shared_state
+        share_state(None)
+        state.close()
 
 # Pydantic models
 class TextMealRequest(BaseModel):
@@ -99,6 +372,21 @@ class TextMealRequest(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     context: Optional[str] = None
+    # Keys the rolling context summary; without it the conversation's first line does
+    conversation_id: Optional[str] = None
+
+class SuggestRequest(ChatRequest):
+    # Remaining macros; anything not given is read from the message or context
+    kcal: Optional[float] = None
+    protein_g: Optional[float] = None
+    carbs_g: Optional[float] = None
+    fat_g: Optional[float] = None
+    # Diets or allergies ("vegetarian", "gluten_free", "nuts", ...)
+    exclude: Optional[List[str]] = None
+    meal_type: Optional[str] = None
+    count: int = 5
+    # Have Gemini write the descriptions of locally chosen meals (default SUGGEST_PHRASE_WITH_GEMINI)
+    phrase: Optional[bool] = None
 
 class NutritionInfo(BaseModel):
     name: str
@@ -111,21 +399,8 @@ class NutritionInfo(BaseModel):
 
 def parse_nutrition_response(response_text: str) -> List[dict]:
     """Parse Gemini's response to extract nutrition information"""
-    try:
-        # Try to extract JSON from the response
-        json_match = re.search(r'\[[\s\S]*?\]', response_text)
-        if json_match:
-            return json.loads(json_match.group())
-        
-        # Try to find a single JSON object
-        obj_match = re.search(r'\{[\s\S]*?\}', response_text)
-        if obj_match:
-            return [json.loads(obj_match.group())]
-            
-    except json.JSONDecodeError:
-        pass
-    
-    return []
+    with STAGE_LATENCY.time(("parse",)):
+        return parse_dishes(response_text)
 
 @app.get("/")
 async def root():
@@ -134,37 +409,11 @@ async def root():
         "status": "healthy",
         "service": "Intake Tracker API",
         "version": "2.0.0",
-        "gemini_available": gemini_model is not None
+        "gemini_available": gemini_model is not None,
+        "startup": startup_timings
     }
 
-@app.post("/infer")
-async def infer_nutrition(file: UploadFile = File(...)):
-    """
-    AI-powered food recognition using Google Gemini Vision
-    Analyzes food images and returns detailed nutrition information
-    """
-    
-    if not file.content_type or not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="Please upload a valid image file")
-    
-    if not gemini_vision_model:
-        raise HTTPException(
-            status_code=503, 
-            detail="Gemini AI service not configured. Please set GEMINI_API_KEY environment variable."
-        )
-    
-    try:
-        # Read and process image
-        image_bytes = await file.read()
-        
-        if not PIL_AVAILABLE:
-            raise HTTPException(status_code=500, detail="Image processing not available")
-        
-        # Open image with PIL
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Prepare the prompt for Gemini Vision
-        prompt = """Analyze this food image and provide detailed nutrition information.
+FOOD_IMAGE_PROMPT = """Analyze this food image and provide detailed nutrition information.
 
 IMPORTANT: You must respond ONLY with a valid JSON array, no other text.
 
@@ -185,42 +434,179 @@ Example response format:
 If you cannot identify the food clearly, still provide your best estimate with a lower confidence score.
 Respond ONLY with the JSON array, nothing else."""
 
-        # Generate response using Gemini Vision
-        response = gemini_vision_model.generate_content([prompt, image])
-        
-        if not response.text:
-            raise HTTPException(status_code=422, detail="Could not analyze the food image")
-        
-        # Parse the response
-        dishes = parse_nutrition_response(response.text)
-        
-        if not dishes:
-            # If parsing failed, create a fallback response
-            dishes = [{
-                "name": "Unknown Food",
-                "weight_g": 150,
-                "kcal": 200,
-                "protein_g": 10,
-                "carbs_g": 20,
-                "fat_g": 8,
-                "confidence": 0.5
-            }]
+FOOD_IMAGE_BATCH_PROMPT = """Analyze each of the following {count} food images and provide detailed nutrition information.
+Each image is preceded by its number.
+
+IMPORTANT: You must respond ONLY with a valid JSON array, no other text.
+
+Return one object per image with:
+- item: The image number
+- dishes: An array with one entry per food item visible in that image, each with
+  name, weight_g (realistic estimated grams), kcal, protein_g, carbs_g, fat_g
+  and confidence (0.0 to 1.0)
+
+Example response format:
+[
+  {{"item": 1, "dishes": [{{"name": "Grilled Chicken Breast", "weight_g": 150, "kcal": 248, "protein_g": 46, "carbs_g": 0, "fat_g": 5, "confidence": 0.95}}]}},
+  {{"item": 2, "dishes": [{{"name": "Banana", "weight_g": 118, "kcal": 105, "protein_g": 1, "carbs_g": 27, "fat_g": 0, "confidence": 0.9}}]}}
+]
+
+If you cannot identify the food clearly, still provide your best estimate with a lower confidence score.
+Respond ONLY with the JSON array, nothing else."""
+
+FALLBACK_DISH = {
+    "name": "Unknown Food",
+    "weight_g": 150,
+    "kcal": 200,
+    "protein_g": 10,
+    "carbs_g": 20,
+    "fat_g": 8,
+    "confidence": 0.5
+}
+
+async def infer_upstream(images: List[dict], priority: str = PRIORITY_LOGGING) -> list:
+    """
+    Analyze one or more preprocessed images with as few Gemini calls as possible
+    Returns, per image, the parsed dishes ([] when the answer was unusable)
+    or the exception that image's request should raise
+    """
+    results = [None] * len(images)
+
+    async def run_group(group: List[int]):
+        try:
+            if len(group) == 1:
+                response = await generate_content_async(
+                    gemini_vision_model,
+                    [FOOD_IMAGE_PROMPT, images[group[0]]],
+                    priority=priority,
+                    generation_config=DISH_LIST_CONFIG
+                )
+                if not response.text:
+                    raise HTTPException(status_code=422, detail="Could not analyze the food image")
+                results[group[0]] = parse_nutrition_response(response.text)
+                return
+
+            contents = [FOOD_IMAGE_BATCH_PROMPT.format(count=len(group))]
+            for number, index in enumerate(group, 1):
+                contents.extend([f"Image {number}:", images[index]])
+            response = await generate_content_async(
+                gemini_vision_model,
+                contents,
+                priority=priority,
+                generation_config=BATCH_DISH_CONFIG
+            )
+            with STAGE_LATENCY.time(("parse",)):
+                parsed = parse_batch_response(response.text or "", len(group))
+            for index, dishes in zip(group, parsed):
+                results[index] = dishes or []
+        except Exception as e:
+            for index in group:
+                results[index] = e
+
+    groups = pack_items(
+        [IMAGE_TOKENS] * len(images),
+        BATCH_MAX_PROMPT_TOKENS,
+        BATCH_MAX_IMAGES_PER_PROMPT
+    )
+    await asyncio.gather(*(run_group(group) for group in groups))
+    return results
+
+# Concurrent single /infer requests that reach Gemini share one call
+image_batcher = MicroBatcher(infer_upstream, max_items=BATCH_MAX_IMAGES_PER_PROMPT)
+
+# Identical requests already in flight (in any worker, with shared state) are awaited instead of repeated
+inflight = SingleFlight()
+
+async def read_upload(file: UploadFile) -> str:
+    """
+    Check an upload's size and format in chunks, without loading it
+    Returns its sha256; file.file is rewound for prepare_image
+    """
+    try:
+        size, image_format, digest = await scan_upload_async(file.file, file.size)
+    except ImageRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return digest
+
+async def prepare_image(image) -> tuple:
+    """Orient, downscale and re-encode an upload (bytes or file object) before anything goes upstream"""
+    try:
+        encoded_image, mime_type, preprocessing = await preprocess_image_async(image)
+    except ImageRejectedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    STAGE_LATENCY.observe(preprocessing["elapsed_ms"] / 1000, ("decode",))
+    return encoded_image, mime_type, preprocessing
+
+async def image_shortcut(encoded_image: bytes, image_hash: int) -> Optional[tuple]:
+    """(dishes, source) from the hash cache or a confident local prediction, else None"""
+    cached_dishes = image_cache.get(image_hash)
+    if cached_dishes is not None:
+        return cached_dishes, "cache"
+    
+    if local_classifier:
+        with STAGE_LATENCY.time(("local_model",)):
+            prediction = await local_classifier.classify_async(encoded_image)
+        local_dishes = local_classifier.dishes_for(prediction)
+        if local_dishes:
+            return validate_dishes(local_dishes), "local_model"
+    return None
+
+async def analyze_image(image) -> dict:
+    """Preprocess, look up and (if needed) analyze one uploaded image"""
+    encoded_image, mime_type, preprocessing = await prepare_image(image)
+    image_hash = int(preprocessing["phash"], 16)
+    
+    shortcut = await image_shortcut(encoded_image, image_hash)
+    if shortcut:
+        dishes, source = shortcut
+        return {"dishes": dishes, "preprocessing": preprocessing, "cached": source == "cache", "source": source}
+    
+    if not gemini_vision_model:
+        raise HTTPException(
+            status_code=503, 
+            detail="Gemini AI service not configured. Please set GEMINI_API_KEY environment variable."
+        )
+    
+    # Generate response using Gemini Vision
+    image = {"mime_type": mime_type, "data": encoded_image}
+    dishes = await image_batcher.submit(image)
+    cacheable = bool(dishes)
+    
+    if not dishes:
+        # If parsing failed, create a fallback response
+        PARSE_FAILURES.inc(("infer",))
+        FALLBACK_DISHES.inc(("infer",))
+        dishes = [FALLBACK_DISH]
+    
+    processed_dishes = validate_dishes(dishes)
+    
+    # Never cache the "Unknown Food" fallback
+    if cacheable:
+        image_cache.put(image_hash, processed_dishes)
+    
+    return {"dishes": processed_dishes, "preprocessing": preprocessing, "cached": False, "source": "gemini"}
+
+@app.post("/infer")
+async def infer_nutrition(file: UploadFile = File(...)):
+    """
+    AI-powered food recognition using Google Gemini Vision
+    Analyzes food images and returns detailed nutrition information
+    Confident local ONNX predictions are returned without calling Gemini;
+    the "source" field reports cache, local_model or gemini
+    """
+    
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="Please upload a valid image file")
+    
+    try:
+        if not PIL_AVAILABLE:
+            raise HTTPException(status_code=500, detail="Image processing not available")
         
-        # Ensure all required fields are present and convert to proper types
-        processed_dishes = []
-        for dish in dishes:
-            processed_dish = {
-                "name": str(dish.get("name", "Unknown Food")),
-                "weight_g": int(dish.get("weight_g", 150)),
-                "kcal": int(dish.get("kcal", 200)),
-                "protein_g": int(dish.get("protein_g", 10)),
-                "carbs_g": int(dish.get("carbs_g", 20)),
-                "fat_g": int(dish.get("fat_g", 8)),
-                "confidence": round(float(dish.get("confidence", 0.8)) * 100, 1)
-            }
-            processed_dishes.append(processed_dish)
+        # The upload is decoded straight from the multipart spool file, never copied into memory
+        digest = await read_upload(file)
         
-        return {"dishes": processed_dishes}
+        # Duplicate uploads of the same bytes share one analysis (same key as content_key)
+        return await inflight.do(f"infer:{digest}", lambda: analyze_image(file.file))
         
     except HTTPException:
         raise
@@ -228,23 +614,315 @@ Respond ONLY with the JSON array, nothing else."""
         print(f"Inference error: {e}")
         raise HTTPException(status_code=500, detail=f"Food analysis failed: {str(e)}")
 
-@app.post("/analyze-text")
-async def analyze_text_meal(request: TextMealRequest):
+def sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+async def finished_dish_stream(dishes: List[dict], started: float, source: str):
+    """Dish events for an answer that was already known (cache or local model)"""
+    for dish in dishes:
+        yield sse_event("dish", dish)
+    total_ms = round((time.perf_counter() - started) * 1000, 1)
+    yield sse_event("done", {"count": len(dishes), "first_dish_ms": total_ms, "total_ms": total_ms, "source": source})
+
+async def dish_event_stream(endpoint: str, model, contents, started: float, store: Callable, fallback: Optional[dict] = None):
     """
-    Analyze a meal described in natural language text using Gemini AI
-    Example: "I had a bowl of rice with grilled chicken and vegetables"
+    Server-sent events for a dish list as Gemini writes it:
+    one "dish" per object as soon as its closing brace arrives, then "done"
+    with the time to the first dish and the total time, or "error"
+    store(dishes) receives the complete validated list for caching
     """
+    parser = DishStreamParser()
+    dishes = []
+    first_dish_ms = None
+    try:
+        async for text in stream_content_async(model, contents, generation_config=DISH_LIST_CONFIG):
+            for dish in parser.feed(text):
+                dish = validate_dish(dish)
+                if first_dish_ms is None:
+                    first_dish_ms = round((time.perf_counter() - started) * 1000, 1)
+                dishes.append(dish)
+                yield sse_event("dish", dish)
+    except UpstreamBusyError as e:
+        yield sse_event("error", {"detail": e.detail, "status_code": e.status_code, "retry_after": e.retry_after})
+        return
+    except Exception as e:
+        print(f"Dish stream error: {e}")
+        yield sse_event("error", {"detail": f"Food analysis failed: {str(e)}", "status_code": 500})
+        return
     
-    if not gemini_model:
-        raise HTTPException(
-            status_code=503,
-            detail="Gemini AI service not configured. Please set GEMINI_API_KEY environment variable."
+    if dishes:
+        store(dishes)
+    elif fallback:
+        # Same "Unknown Food" answer /infer gives; never cached
+        PARSE_FAILURES.inc((endpoint,))
+        FALLBACK_DISHES.inc((endpoint,))
+        first_dish_ms = round((time.perf_counter() - started) * 1000, 1)
+        dishes = [validate_dish(fallback)]
+        yield sse_event("dish", dishes[0])
+    else:
+        PARSE_FAILURES.inc((endpoint,))
+        yield sse_event("error", {"detail": "Could not parse nutrition information", "status_code": 422})
+        return
+    
+    total_ms = round((time.perf_counter() - started) * 1000, 1)
+    yield sse_event("done", {"count": len(dishes), "first_dish_ms": first_dish_ms, "total_ms": total_ms, "source": "gemini"})
+
+@app.post("/infer/stream")
+async def infer_nutrition_stream(file: UploadFile = File(...)):
+    """
+    Streaming variant of /infer (text/event-stream)
+    Sends each dish as soon as Gemini finishes describing it; cache and
+    local model answers are sent at once
+    """
+    
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="Please upload a valid image file")
+    
+    if not PIL_AVAILABLE:
+        raise HTTPException(status_code=500, detail="Image processing not available")
+    
+    started = time.perf_counter()
+    await read_upload(file)
+    encoded_image, mime_type, preprocessing = await prepare_image(file.file)
+    image_hash = int(preprocessing["phash"], 16)
+    
+    shortcut = await image_shortcut(encoded_image, image_hash)
+    if shortcut:
+        dishes, source = shortcut
+        events = finished_dish_stream(dishes, started, source)
+    elif not gemini_vision_model:
+        raise HTTPException(status_code=503, detail="Gemini AI service not configured.")
+    else:
+        events = dish_event_stream(
+            "infer-stream",
+            gemini_vision_model,
+            [FOOD_IMAGE_PROMPT, {"mime_type": mime_type, "data": encoded_image}],
+            started,
+            store=lambda dishes: image_cache.put(image_hash, dishes),
+            fallback=FALLBACK_DISH
         )
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+def batch_error(error: Exception) -> dict:
+    """Per-item error entry for the /batch endpoints"""
+    if isinstance(error, HTTPException):
+        return {"error": error.detail, "status_code": error.status_code}
+    return {"error": f"Analysis failed: {str(error)}", "status_code": 500}
+
+@app.post("/infer/batch")
+async def infer_nutrition_batch(files: List[UploadFile] = File(...)):
+    """
+    Analyze many food images in one request
+    Images are packed into as few Gemini calls as token limits allow; each
+    entry of "results" holds that image's dishes or its own error
+    """
+    
+    if len(files) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} images per batch")
+    
+    if not PIL_AVAILABLE:
+        raise HTTPException(status_code=500, detail="Image processing not available")
+    
+    results = [None] * len(files)
+    
+    async def prepare(file: UploadFile):
+        if not file.content_type or not file.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail="Please upload a valid image file")
+        try:
+            await scan_upload_async(file.file, file.size)
+            prepared_image = await preprocess_image_async(file.file)
+        except ImageRejectedError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        STAGE_LATENCY.observe(prepared_image[2]["elapsed_ms"] / 1000, ("decode",))
+        return prepared_image
+    
+    prepared = await asyncio.gather(*(prepare(file) for file in files), return_exceptions=True)
+    
+    pending = []
+    for index, item in enumerate(prepared):
+        if isinstance(item, Exception):
+            results[index] = batch_error(item)
+            continue
+        encoded_image, mime_type, preprocessing = item
+        cached_dishes = image_cache.get(int(preprocessing["phash"], 16))
+        if cached_dishes is not None:
+            results[index] = {"dishes": cached_dishes, "cached": True, "source": "cache"}
+        else:
+            pending.append(index)
+    
+    if local_classifier and pending:
+        with STAGE_LATENCY.time(("local_model",)):
+            predictions = await local_classifier.classify_batch_async([prepared[index][0] for index in pending])
+        still_pending = []
+        for index, prediction in zip(pending, predictions):
+            local_dishes = local_classifier.dishes_for(prediction)
+            if local_dishes:
+                results[index] = {"dishes": validate_dishes(local_dishes), "cached": False, "source": "local_model"}
+            else:
+                still_pending.append(index)
+        pending = still_pending
+    
+    if pending and not gemini_vision_model:
+        for index in pending:
+            results[index] = {"error": "Gemini AI service not configured.", "status_code": 503}
+        pending = []
+    
+    if pending:
+        images = [{"mime_type": prepared[index][1], "data": prepared[index][0]} for index in pending]
+        upstream = await infer_upstream(images, priority=PRIORITY_BATCH)
+        for index, dishes in zip(pending, upstream):
+            if isinstance(dishes, Exception):
+                results[index] = batch_error(dishes)
+            elif not dishes:
+                PARSE_FAILURES.inc(("infer",))
+                results[index] = {"error": "Could not analyze the food image", "status_code": 422}
+            else:
+                processed_dishes = validate_dishes(dishes)
+                image_cache.put(int(prepared[index][2]["phash"], 16), processed_dishes)
+                results[index] = {"dishes": processed_dishes, "cached": False, "source": "gemini"}
     
+    return {"results": results}
+
+async def run_infer_jobs(jobs: List[dict]) -> list:
+    """
+    Job queue handler: Gemini analysis of claimed jobs' preprocessed images
+    Interactive jobs share calls with concurrent /infer requests; batch jobs
+    (claimed together) are packed into as few calls as the budget allows
+    """
+    if not gemini_vision_model:
+        return [HTTPException(status_code=503, detail="Gemini AI service not configured.")] * len(jobs)
+    
+    images = [{"mime_type": job["meta"]["mime_type"], "data": job["payload"]} for job in jobs]
+    if jobs[0]["priority"] == PRIORITY_BATCH:
+        upstream = await infer_upstream(images, priority=PRIORITY_BATCH)
+    else:
+        upstream = await asyncio.gather(*(image_batcher.submit(image) for image in images), return_exceptions=True)
+    
+    outcomes = []
+    for job, dishes in zip(jobs, upstream):
+        if isinstance(dishes, Exception):
+            outcomes.append(dishes)
+            continue
+        if dishes:
+            dishes = validate_dishes(dishes)
+            image_cache.put(int(job["meta"]["preprocessing"]["phash"], 16), dishes)
+        else:
+            # Same "Unknown Food" answer /infer gives; never cached
+            PARSE_FAILURES.inc(("infer",))
+            FALLBACK_DISHES.inc(("infer",))
+            dishes = validate_dishes([FALLBACK_DISH])
+        outcomes.append({"dishes": dishes, "preprocessing": job["meta"]["preprocessing"], "cached": False, "source": "gemini"})
+    return outcomes
+
+# Persistent photo analysis jobs; workers start with the app
+job_queue = JobQueue(run_infer_jobs)
+
+def job_response(job: dict) -> dict:
+    """Public view of a job row"""
+    response = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "priority": job["priority"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
+    if job["status"] == "queued":
+        response["queue_position"] = job.get("queue_position")
+    if job.get("deduplicated"):
+        response["deduplicated"] = True
+    if job["status"] == "done":
+        response["result"] = job["result"]
+    elif job["status"] == "failed":
+        response["error"] = job["error"]
+        response["status_code"] = job["status_code"]
+    return response
+
+@app.post("/infer/jobs", status_code=202)
+async def submit_infer_job(file: UploadFile = File(...), priority: str = PRIORITY_LOGGING, fresh: bool = False):
+    """
+    Queue a food photo for analysis and return its job id at once
+    Poll GET /infer/jobs/{job_id} or follow /infer/jobs/{job_id}/events for
+    the result. priority=batch (bulk re-analysis) only runs while no
+    interactive job waits and goes upstream at batch priority; fresh skips
+    the hash cache and the local model
+    """
+    
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="Please upload a valid image file")
+    if priority not in JOB_PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(JOB_PRIORITIES)}")
+    if not PIL_AVAILABLE:
+        raise HTTPException(status_code=500, detail="Image processing not available")
+    
+    # Checked and downscaled now: a bad upload fails here, and the queue only holds the small re-encoded image
+    digest = await read_upload(file)
+    encoded_image, mime_type, preprocessing = await prepare_image(file.file)
+    meta = {"mime_type": mime_type, "preprocessing": preprocessing}
+    
+    shortcut = None if fresh else await image_shortcut(encoded_image, int(preprocessing["phash"], 16))
+    if shortcut:
+        dishes, source = shortcut
+        result = {"dishes": dishes, "preprocessing": preprocessing, "cached": source == "cache", "source": source}
+        return job_response(job_queue.submit(None, meta, priority, digest, result=result))
+    
+    if not gemini_vision_model:
+        raise HTTPException(status_code=503, detail="Gemini AI service not configured.")
+    return job_response(job_queue.submit(encoded_image, meta, priority, digest))
+
+@app.get("/infer/jobs/{job_id}")
+async def get_infer_job(job_id: str):
+    """A job's status, its queue position while queued, and its result or error once finished"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job_response(job)
+
+async def job_event_stream(job: dict):
+    """
+    Server-sent events for a job: "status" whenever its status or queue
+    position changes, then one "dish" per food item and "done", or "error"
+    """
     try:
-        weight_hint = f"\nThe user mentioned the total weight is approximately {request.weight_g}g." if request.weight_g else ""
-        
-        prompt = f"""Analyze this meal description and provide detailed nutrition information.
+        seen = None
+        while True:
+            state = (job["status"], job.get("queue_position"))
+            if state != seen:
+                seen = state
+                yield sse_event("status", {"job_id": job["id"], "status": job["status"], "queue_position": job.get("queue_position")})
+            if job["status"] == "done":
+                for dish in job["result"]["dishes"]:
+                    yield sse_event("dish", dish)
+                yield sse_event("done", {
+                    "count": len(job["result"]["dishes"]),
+                    "total_ms": round((job["finished_at"] - job["created_at"]) * 1000, 1),
+                    "source": job["result"]["source"]
+                })
+                return
+            if job["status"] == "failed":
+                yield sse_event("error", {"detail": job["error"], "status_code": job["status_code"]})
+                return
+            job = await job_queue.wait(job["id"]) or {**job, "status": "failed", "error": "Job expired", "status_code": 404}
+    finally:
+        job_queue.forget_waiter(job["id"])
+
+@app.get("/infer/jobs/{job_id}/events")
+async def infer_job_events(job_id: str):
+    """Follow a job as server-sent events until it finishes"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return StreamingResponse(job_event_stream(job), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def build_text_meal_prompt(request: TextMealRequest) -> str:
+    """Prompt for analyzing a single meal description"""
+    weight_hint = f"\nThe user mentioned the total weight is approximately {request.weight_g}g." if request.weight_g else ""
+    
+    return f"""Analyze this meal description and provide detailed nutrition information.
 
 Meal description: "{request.description}"{weight_hint}
 
@@ -268,35 +946,117 @@ Example response format:
 Be specific with portion sizes based on common serving sizes.
 Respond ONLY with the JSON array, nothing else."""
 
-        response = gemini_model.generate_content(prompt)
-        
-        if not response.text:
-            raise HTTPException(status_code=422, detail="Could not analyze the meal description")
-        
-        # Parse the response
-        dishes = parse_nutrition_response(response.text)
-        
-        if not dishes:
-            raise HTTPException(
-                status_code=422, 
-                detail="Could not parse nutrition information from the description"
-            )
-        
-        # Process and validate dishes
-        processed_dishes = []
-        for dish in dishes:
-            processed_dish = {
-                "name": str(dish.get("name", "Unknown Food")),
-                "weight_g": int(dish.get("weight_g", 150)),
-                "kcal": int(dish.get("kcal", 200)),
-                "protein_g": int(dish.get("protein_g", 10)),
-                "carbs_g": int(dish.get("carbs_g", 20)),
-                "fat_g": int(dish.get("fat_g", 8)),
-                "confidence": round(float(dish.get("confidence", 0.8)) * 100, 1)
-            }
-            processed_dishes.append(processed_dish)
+def build_text_meal_batch_prompt(requests: List[TextMealRequest]) -> str:
+    """Prompt that analyzes several numbered meal descriptions at once"""
+    meals = "\n".join(
+        f'{number}. "{request.description}"'
+        + (f" (approximately {request.weight_g}g total)" if request.weight_g else "")
+        for number, request in enumerate(requests, 1)
+    )
+    
+    return f"""Analyze each of the following {len(requests)} meal descriptions and provide detailed nutrition information.
+
+{meals}
+
+IMPORTANT: You must respond ONLY with a valid JSON array, no other text.
+
+Return one object per meal with:
+- item: The meal number
+- dishes: An array with one entry per food item mentioned in that meal, each with
+  name, weight_g (realistic estimated grams), kcal, protein_g, carbs_g, fat_g
+  and confidence (0.0 to 1.0)
+
+Example response format:
+[
+  {{"item": 1, "dishes": [{{"name": "White Rice", "weight_g": 200, "kcal": 260, "protein_g": 5, "carbs_g": 56, "fat_g": 1, "confidence": 0.9}}]}},
+  {{"item": 2, "dishes": [{{"name": "Banana", "weight_g": 118, "kcal": 105, "protein_g": 1, "carbs_g": 27, "fat_g": 0, "confidence": 0.9}}]}}
+]
+
+Be specific with portion sizes based on common serving sizes.
+Respond ONLY with the JSON array, nothing else."""
+
+async def analyze_text_upstream(requests: List[TextMealRequest], priority: str = PRIORITY_LOGGING) -> list:
+    """
+    Analyze one or more meal descriptions with as few Gemini calls as the token budget allows
+    Returns, per request, its processed dishes or the exception it should raise
+    """
+    results = [None] * len(requests)
+
+    async def run_group(group: List[int]):
+        try:
+            if len(group) == 1:
+                response = await generate_content_async(
+                    gemini_model,
+                    build_text_meal_prompt(requests[group[0]]),
+                    priority=priority,
+                    generation_config=DISH_LIST_CONFIG
+                )
+                if not response.text:
+                    raise HTTPException(status_code=422, detail="Could not analyze the meal description")
+                parsed = [parse_nutrition_response(response.text)]
+            else:
+                batch = [requests[index] for index in group]
+                response = await generate_content_async(
+                    gemini_model,
+                    build_text_meal_batch_prompt(batch),
+                    priority=priority,
+                    generation_config=BATCH_DISH_CONFIG
+                )
+                with STAGE_LATENCY.time(("parse",)):
+                    parsed = parse_batch_response(response.text or "", len(group))
+        except Exception as e:
+            for index in group:
+                results[index] = e
+            return
+
+        for index, dishes in zip(group, parsed):
+            if not dishes:
+                PARSE_FAILURES.inc(("analyze-text",))
+                results[index] = HTTPException(
+                    status_code=422, 
+                    detail="Could not parse nutrition information from the description"
+                )
+                continue
+            results[index] = validate_dishes(dishes)
+
+    groups = pack_items(
+        [estimate_tokens(request.description) + 20 for request in requests],
+        BATCH_MAX_PROMPT_TOKENS,
+        BATCH_MAX_ITEMS_PER_PROMPT
+    )
+    await asyncio.gather(*(run_group(group) for group in groups))
+    return results
+
+# Concurrent single /analyze-text requests share one Gemini call
+text_batcher = MicroBatcher(analyze_text_upstream)
+
+@app.post("/analyze-text")
+async def analyze_text_meal(request: TextMealRequest):
+    """
+    Analyze a meal described in natural language text using Gemini AI
+    Example: "I had a bowl of rice with grilled chicken and vegetables"
+    Cached answers are served even while Gemini is unavailable
+    """
+    
+    cached = text_cache.get("analyze-text", request.description, request.weight_g)
+    if cached is not None:
+        return {**cached, "cached": True}
+    
+    if not gemini_model:
+        raise HTTPException(
+            status_code=503,
+            detail="Gemini AI service not configured. Please set GEMINI_API_KEY environment variable."
+        )
+    
+    try:
+        processed_dishes = await inflight.do(
+            content_key("analyze-text", request.model_dump_json()),
+            lambda: text_batcher.submit(request)
+        )
         
-        return {"dishes": processed_dishes}
+        result = {"dishes": processed_dishes}
+        text_cache.put("analyze-text", request.description, request.weight_g, result)
+        return {**result, "cached": False}
         
     except HTTPException:
         raise
@@ -304,25 +1064,89 @@ Respond ONLY with the JSON array, nothing else."""
         print(f"Text analysis error: {e}")
         raise HTTPException(status_code=500, detail=f"Meal analysis failed: {str(e)}")
 
-@app.post("/nutrition-chat")
-async def nutrition_chat(request: ChatRequest):
+@app.post("/analyze-text/stream")
+async def analyze_text_meal_stream(request: TextMealRequest):
     """
-    Chat with AI about nutrition, diet, and health questions
-    Powered by Google Gemini
+    Streaming variant of /analyze-text (text/event-stream)
+    Sends each dish as soon as Gemini finishes describing it
     """
     
-    if not gemini_model:
+    started = time.perf_counter()
+    cached = text_cache.get("analyze-text", request.description, request.weight_g)
+    if cached is not None:
+        events = finished_dish_stream(cached["dishes"], started, "cache")
+    else:
+        if not gemini_model:
+            raise HTTPException(
+                status_code=503,
+                detail="Gemini AI service not configured. Please set GEMINI_API_KEY environment variable."
+            )
+        events = dish_event_stream(
+            "analyze-text-stream",
+            gemini_model,
+            build_text_meal_prompt(request),
+            started,
+            store=lambda dishes: text_cache.put("analyze-text", request.description, request.weight_g, {"dishes": dishes})
+        )
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+class TextMealBatchRequest(BaseModel):
+    items: List[TextMealRequest]
+
+@app.post("/analyze-text/batch")
+async def analyze_text_meal_batch(request: TextMealBatchRequest):
+    """
+    Analyze many meal descriptions in one request (history imports, nightly re-analysis)
+    Descriptions are packed into as few Gemini calls as token limits allow; each
+    entry of "results" holds that item's dishes or its own error
+    """
+    
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} items per batch")
+    
+    results = [None] * len(request.items)
+    pending = []
+    for index, item in enumerate(request.items):
+        cached = text_cache.get("analyze-text", item.description, item.weight_g)
+        if cached is not None:
+            results[index] = {**cached, "cached": True}
+        else:
+            pending.append(index)
+    
+    if pending and not gemini_model:
         raise HTTPException(
             status_code=503,
             detail="Gemini AI service not configured. Please set GEMINI_API_KEY environment variable."
         )
     
-    try:
-        context_info = ""
-        if request.context:
-            context_info = f"\n\nUser's current nutrition context:\n{request.context}"
-        
-        prompt = f"""You are a helpful and knowledgeable nutrition and health assistant. 
+    if pending:
+        upstream = await analyze_text_upstream([request.items[index] for index in pending], priority=PRIORITY_BATCH)
+        for index, dishes in zip(pending, upstream):
+            if isinstance(dishes, Exception):
+                results[index] = batch_error(dishes)
+                continue
+            item = request.items[index]
+            result = {"dishes": dishes}
+            text_cache.put("analyze-text", item.description, item.weight_g, result)
+            results[index] = {**result, "cached": False}
+    
+    return {"results": results}
+
+@app.get("/batch/stats")
+async def batch_stats():
+    """
+    Request coalescing counters: single requests merged by the micro-batching
+    window, and duplicate in-flight requests served by single-flight
+    """
+    return {
+        "analyze_text": text_batcher.stats(),
+        "infer": image_batcher.stats(),
+        "single_flight": inflight.stats(),
+        "jobs": job_queue.stats()
+    }
+
+# Fixed instructions first, so every chat prompt starts with the same prefix
+CHAT_INSTRUCTIONS = """You are a helpful and knowledgeable nutrition and health assistant. 
 Provide accurate, science-based information about nutrition, diet, and wellness.
 Do not cross more than 75 words in your message, do not use any markdown. 
 
@@ -333,53 +1157,239 @@ Guidelines:
 4. Always recommend consulting healthcare professionals for medical concerns
 5. Be encouraging and supportive about healthy eating habits
 6. If asked about specific foods, include calorie and macro information when relevant
-{context_info}
+"""
+
+CONTEXT_SUMMARY_PROMPT = """Summarize this nutrition-tracking conversation context for a nutrition assistant.
+Keep every concrete fact: calorie and macro targets, amounts eaten, diets, allergies,
+conditions, medications and stated preferences. Plain sentences, no markdown,
+at most {max_words} words.
+{previous}
+Context to summarize:
+{text}"""
+
+async def summarize_context(previous: Optional[str], new_text: str, max_tokens: int) -> str:
+    """Model-written rolling summary of aged chat context (background, lowest priority)"""
+    if not gemini_model:
+        return ""
+    prompt = CONTEXT_SUMMARY_PROMPT.format(
+        max_words=max(20, int(max_tokens * 0.7)),
+        previous=f"\nSummary so far:\n{previous}\n" if previous else "",
+        text=new_text
+    )
+    response = await generate_content_async(
+        gemini_model, prompt, priority=PRIORITY_BATCH,
+        generation_config={"max_output_tokens": max_tokens}
+    )
+    return response.text
+
+# Keeps each endpoint's share of ChatRequest.context under its token budget
+chat_context = ContextManager(summarize=summarize_context)
+
+def context_block(endpoint: str, request: ChatRequest, heading: str) -> str:
+    """Budgeted context for a prompt: the conversation summary, then recent context verbatim"""
+    compacted = chat_context.compact(endpoint, request.context, request.conversation_id)
+    block = ""
+    if compacted.summary:
+        block += f"\n\nSummary of earlier context:\n{compacted.summary}"
+    if compacted.recent:
+        block += f"\n\n{heading}:\n{compacted.recent}"
+    return block
+
+def build_chat_prompt(request: ChatRequest) -> str:
+    """Prompt for the nutrition assistant"""
+    context_info = context_block("chat", request, "User's current nutrition context")
+    prompt = f"""{CHAT_INSTRUCTIONS}{context_info}
 
 User question: {request.message}
 
 Provide a helpful, informative response:"""
+    PROMPT_TOKENS.observe(count_tokens(prompt), ("chat",))
+    return prompt
+
+def detect_message(message: str) -> dict:
+    """Symptoms (and negated ones), topics and urgency of a chat message, in one pass"""
+    if symptom_detector is None:
+        return {"symptoms": [], "negated_symptoms": [], "topics": [], "urgency": "low"}
+    return symptom_detector.detect(message)
+
+def detection_fields(detection: dict) -> dict:
+    """Response fields for a detect_message() result"""
+    return {
+        "urgency": detection["urgency"],
+        "detected_symptoms": detection["symptoms"],
+        "detected_topics": detection["topics"]
+    }
 
-        response = gemini_model.generate_content(prompt)
+def cached_chat_answer(request: ChatRequest, detection: dict) -> tuple:
+    """
+    (cacheable, cached answer or None) for a chat request
+    Only questions without context are cached (the answer depends on nothing
+    else), and never urgent ones
+    """
+    if chat_cache is None or (request.context or "").strip() or detection["urgency"] == "high":
+        return False, None
+    return True, chat_cache.get(request.message)
+
+@app.post("/nutrition-chat")
+async def nutrition_chat(request: ChatRequest):
+    """
+    Chat with AI about nutrition, diet, and health questions
+    Powered by Google Gemini
+    Context-free questions are answered from the semantic cache when an
+    earlier question meant the same thing ("cached": true)
+    """
+    
+    detection = detect_message(request.message)
+    cacheable, cached = cached_chat_answer(request, detection)
+    if cached is not None:
+        return {
+            "response": cached["response"],
+            "confidence": 0.9,
+            **detection_fields(detection),
+            "cached": True,
+            "similarity": cached["similarity"]
+        }
+    
+    if not gemini_model:
+        raise HTTPException(
+            status_code=503,
+            detail="Gemini AI service not configured. Please set GEMINI_API_KEY environment variable."
+        )
+    
+    try:
+        response = await generate_content_async(gemini_model, build_chat_prompt(request), priority=PRIORITY_CHAT)
         
         if not response.text:
             return {
                 "response": "I'm having trouble processing your question right now. Please try again.",
                 "confidence": 0.5,
-                "urgency": "low"
+                **detection_fields(detection)
             }
         
-        # Determine urgency based on content
-        urgency = "low"
-        urgent_keywords = ["emergency", "severe pain", "difficulty breathing", "chest pain", "allergic reaction"]
-        moderate_keywords = ["concerned", "worried", "persistent", "recurring", "unusual"]
-        
-        message_lower = request.message.lower()
-        if any(keyword in message_lower for keyword in urgent_keywords):
-            urgency = "high"
-        elif any(keyword in message_lower for keyword in moderate_keywords):
-            urgency = "moderate"
+        if cacheable:
+            chat_cache.put(request.message, {"response": response.text})
         
         return {
             "response": response.text,
             "confidence": 0.9,
-            "urgency": urgency
+            **detection_fields(detection),
+            "cached": False
         }
         
+    except UpstreamBusyError:
+        # Let the client back off (Retry-After) instead of showing a canned answer
+        raise
     except Exception as e:
         print(f"Chat error: {e}")
         return {
             "response": "I'm experiencing technical difficulties. Please try again or consult a healthcare professional for urgent concerns.",
             "confidence": 0.5,
-            "urgency": "low"
+            **detection_fields(detection)
         }
 
+async def chat_event_stream(request: ChatRequest):
+    """
+    Server-sent events for a chat answer:
+    "meta" (urgency and detected symptoms/topics, sent before Gemini is called),
+    then one "token" per chunk, then "done" with time-to-first-token and total
+    time, or "error"
+    """
+    started = time.perf_counter()
+    detection = detect_message(request.message)
+    yield sse_event("meta", {**detection_fields(detection), "confidence": 0.9})
+    
+    cacheable, cached = cached_chat_answer(request, detection)
+    if cached is not None:
+        yield sse_event("token", {"text": cached["response"]})
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        yield sse_event("done", {"ttft_ms": total_ms, "total_ms": total_ms, "cached": True})
+        return
+    
+    if not gemini_model:
+        yield sse_event("error", {"detail": "Gemini AI service not configured."})
+        return
+    
+    first_token_ms = None
+    parts = []
+    try:
+        async for text in stream_content_async(gemini_model, build_chat_prompt(request), priority=PRIORITY_CHAT):
+            if first_token_ms is None:
+                first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+            parts.append(text)
+            yield sse_event("token", {"text": text})
+    except UpstreamBusyError as e:
+        yield sse_event("error", {"detail": e.detail, "status_code": e.status_code, "retry_after": e.retry_after})
+        return
+    except Exception as e:
+        print(f"Chat stream error: {e}")
+        yield sse_event("error", {
+            "detail": "I'm experiencing technical difficulties. Please try again or consult a healthcare professional for urgent concerns."
+        })
+        return
+    
+    if cacheable and parts:
+        chat_cache.put(request.message, {"response": "".join(parts)})
+    
+    total_ms = round((time.perf_counter() - started) * 1000, 1)
+    yield sse_event("done", {"ttft_ms": first_token_ms, "total_ms": total_ms, "cached": False})
+
+@app.post("/nutrition-chat/stream")
+async def nutrition_chat_stream(request: ChatRequest):
+    """
+    Streaming variant of /nutrition-chat (text/event-stream)
+    Forwards tokens as Gemini produces them instead of waiting for the full answer
+    """
+    return StreamingResponse(chat_event_stream(request), media_type="text/event-stream", headers=SSE_HEADERS)
+
+async def quick_log_upstream(request: TextMealRequest) -> dict:
+    """Ask Gemini for a single-food estimate and cache the answer"""
+    weight_hint = f" (approximately {request.weight_g}g)" if request.weight_g else ""
+    
+    prompt = f"""Quickly estimate the nutrition for: "{request.description}"{weight_hint}
+
+Respond with ONLY a single JSON object (not an array):
+{{"name": "Food Name", "weight_g": 150, "kcal": 200, "protein_g": 10, "carbs_g": 20, "fat_g": 8, "confidence": 0.9}}
+
+Use realistic serving sizes and accurate nutrition data."""
+
+    response = await generate_content_async(gemini_model, prompt, generation_config=SINGLE_DISH_CONFIG)
+    
+    if not response.text:
+        raise HTTPException(status_code=422, detail="Could not analyze the food")
+    
+    # Parse single object response
+    dishes = parse_nutrition_response(response.text)
+    
+    if not dishes:
+        PARSE_FAILURES.inc(("quick-log",))
+        raise HTTPException(status_code=422, detail="Could not parse nutrition information")
+    
+    result = validate_dish(dishes[0], {
+        **DISH_DEFAULTS,
+        "name": request.description.title(),
+        "weight_g": request.weight_g or 150,
+        "confidence": 0.85
+    })
+    text_cache.put("quick-log", request.description, request.weight_g, result)
+    return result
+
 @app.post("/quick-log")
 async def quick_log_meal(request: TextMealRequest):
     """
     Quick meal logging with natural language
-    Optimized for fast, single-food entries
+    Optimized for fast, single-food entries: answered from the local food
+    index when the match is confident, otherwise by Gemini
+    The "source" field reports which path served the request
     """
     
+    local = food_index.estimate(request.description, request.weight_g) if food_index else None
+    if local and local["confidence"] >= food_index.min_confidence:
+        return {**validate_dish(local), "cached": False, "source": "local_index"}
+    
+    cached = text_cache.get("quick-log", request.description, request.weight_g)
+    if cached is not None:
+        return {**cached, "cached": True, "source": "cache"}
+    
     if not gemini_model:
         raise HTTPException(
             status_code=503,
@@ -387,36 +1397,12 @@ async def quick_log_meal(request: TextMealRequest):
         )
     
     try:
-        weight_hint = f" (approximately {request.weight_g}g)" if request.weight_g else ""
-        
-        prompt = f"""Quickly estimate the nutrition for: "{request.description}"{weight_hint}
-
-Respond with ONLY a single JSON object (not an array):
-{{"name": "Food Name", "weight_g": 150, "kcal": 200, "protein_g": 10, "carbs_g": 20, "fat_g": 8, "confidence": 0.9}}
-
-Use realistic serving sizes and accurate nutrition data."""
-
-        response = gemini_model.generate_content(prompt)
-        
-        if not response.text:
-            raise HTTPException(status_code=422, detail="Could not analyze the food")
-        
-        # Parse single object response
-        dishes = parse_nutrition_response(response.text)
-        
-        if not dishes:
-            raise HTTPException(status_code=422, detail="Could not parse nutrition information")
-        
-        dish = dishes[0]
-        return {
-            "name": str(dish.get("name", request.description.title())),
-            "weight_g": int(dish.get("weight_g", request.weight_g or 150)),
-            "kcal": int(dish.get("kcal", 200)),
-            "protein_g": int(dish.get("protein_g", 10)),
-            "carbs_g": int(dish.get("carbs_g", 20)),
-            "fat_g": int(dish.get("fat_g", 8)),
-            "confidence": round(float(dish.get("confidence", 0.85)) * 100, 1)
-        }
+        # Identical bodies already in flight share that Gemini call
+        result = await inflight.do(
+            content_key("quick-log", request.model_dump_json()),
+            lambda: quick_log_upstream(request)
+        )
+        return {**result, "cached": False, "source": "gemini"}
         
     except HTTPException:
         raise
@@ -424,12 +1410,81 @@ Use realistic serving sizes and accurate nutrition data."""
         print(f"Quick log error: {e}")
         raise HTTPException(status_code=500, detail=f"Quick log failed: {str(e)}")
 
+# Fixed part of the /suggest-meals prompt, ahead of anything per-request
+SUGGEST_INSTRUCTIONS = """Based on the user's nutritional needs and preferences, suggest 3-5 meal ideas.
+
+Provide meal suggestions in this JSON format:
+[
+  {"name": "Meal Name", "description": "Brief description", "estimated_kcal": 400, "protein_g": 30, "carbs_g": 40, "fat_g": 15}
+]
+
+Focus on balanced, healthy options that match the user's needs."""
+
+def suggestion_query(request: SuggestRequest) -> tuple:
+    """(targets, exclusions, meal_type) from the request fields, then the message, then the context"""
+    from meal_planner import MACROS, normalize_diet, parse_targets, parse_exclusions, parse_meal_type
+    
+    text = request.message + "\n" + (request.context or "")
+    targets = {macro: float(getattr(request, macro)) for macro in MACROS if getattr(request, macro) is not None}
+    if not targets:
+        targets = parse_targets(request.message) or parse_targets(request.context or "")
+    exclusions = {normalize_diet(name) for name in request.exclude or ()} | parse_exclusions(text)
+    meal_type = request.meal_type.lower() if request.meal_type else parse_meal_type(request.message)
+    return targets, exclusions, meal_type
+
+PHRASE_PROMPT = """Write one short, appetizing sentence describing each of these meal suggestions
+for someone tracking their nutrition. Do not change the meals or mention numbers.
+Respond ONLY with a JSON array of strings, one per suggestion, in the same order.
+
+{meals}"""
+
+async def phrase_suggestions(suggestions: List[dict]) -> List[dict]:
+    """Gemini-written descriptions for locally chosen suggestions; the macros stay local"""
+    meals = "\n".join(f"{i + 1}. {s['name']} ({s['description']})" for i, s in enumerate(suggestions))
+    try:
+        response = await generate_content_async(gemini_model, PHRASE_PROMPT.format(meals=meals), priority=PRIORITY_CHAT)
+        phrases = json.loads(re.search(r'\[[\s\S]*\]', response.text).group())
+    except UpstreamBusyError:
+        return suggestions
+    except Exception as e:
+        print(f"Suggestion phrasing error: {e}")
+        return suggestions
+    if len(phrases) != len(suggestions):
+        return suggestions
+    return [{**s, "description": str(phrase)} for s, phrase in zip(suggestions, phrases)]
+
 @app.post("/suggest-meals")
-async def suggest_meals(request: ChatRequest):
+async def suggest_meals(request: SuggestRequest):
     """
     Get personalized meal suggestions based on remaining macros
+    Requests with macro targets (fields or text like "650 kcal, 40g protein")
+    are answered from the local meal table in milliseconds; Gemini only
+    writes free-form ideas when there are no targets, and optionally
+    phrases the local results
+    The "source" field reports local or gemini
     """
     
+    if meal_planner:
+        targets, exclusions, meal_type = suggestion_query(request)
+        if meal_type and meal_type not in ("breakfast", "lunch", "dinner", "snack"):
+            raise HTTPException(status_code=400, detail=f"Unknown meal type: {meal_type}")
+        if targets:
+            try:
+                with STAGE_LATENCY.time(("meal_search",)):
+                    suggestions = meal_planner.suggest(targets, exclusions, meal_type, max(1, min(request.count, 10)))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            
+            phrase = SUGGEST_PHRASE_WITH_GEMINI if request.phrase is None else request.phrase
+            if phrase and gemini_model and suggestions:
+                suggestions = await phrase_suggestions(suggestions)
+            return {
+                "suggestions": suggestions,
+                "targets": targets,
+                "excluded": sorted(exclusions),
+                "source": "local"
+            }
+    
     if not gemini_model:
         raise HTTPException(
             status_code=503,
@@ -437,39 +1492,303 @@ async def suggest_meals(request: ChatRequest):
         )
     
     try:
-        prompt = f"""Based on the user's nutritional needs and preferences, suggest 3-5 meal ideas.
+        prompt = f"""{SUGGEST_INSTRUCTIONS}{context_block("suggest", request, "Additional context")}
 
 User request: {request.message}
 
-{f"Additional context: {request.context}" if request.context else ""}
-
-Provide meal suggestions in this JSON format:
-[
-  {{"name": "Meal Name", "description": "Brief description", "estimated_kcal": 400, "protein_g": 30, "carbs_g": 40, "fat_g": 15}}
-]
-
-Focus on balanced, healthy options that match the user's needs.
 Respond ONLY with the JSON array."""
+        PROMPT_TOKENS.observe(count_tokens(prompt), ("suggest",))
 
-        response = gemini_model.generate_content(prompt)
+        response = await generate_content_async(gemini_model, prompt, priority=PRIORITY_CHAT)
         
         if not response.text:
-            return {"suggestions": []}
+            return {"suggestions": [], "source": "gemini"}
         
         # Parse suggestions
         try:
             json_match = re.search(r'\[[\s\S]*?\]', response.text)
             if json_match:
                 suggestions = json.loads(json_match.group())
-                return {"suggestions": suggestions}
+                return {"suggestions": suggestions, "source": "gemini"}
         except json.JSONDecodeError:
             pass
         
-        return {"suggestions": []}
+        return {"suggestions": [], "source": "gemini"}
         
+    except UpstreamBusyError:
+        raise
     except Exception as e:
         print(f"Suggestion error: {e}")
-        return {"suggestions": []}
+        return {"suggestions": [], "source": "gemini"}
+
+class MedicationItem(BaseModel):
+    # Fields of the Medicine model; only the name is required
+    name: str
+    dosage: Optional[str] = None
+    # Dose time "HH:MM", for rules that only need the meal kept apart from the dose
+    time: Optional[str] = None
+
+class DishItem(BaseModel):
+    # Any dish from /infer or /analyze-text; only the name is used
+    name: str
+
+class InteractionCheckRequest(BaseModel):
+    medications: List[MedicationItem]
+    dishes: List[DishItem]
+    # "HH:MM" or a naive ISO timestamp is local clock time; a timestamp with
+    # "Z" or an offset (Prisma createdAt) needs tz_offset_minutes, else its
+    # time counts as unknown and timing rules always alert
+    eaten_at: Optional[str] = None
+    # Minutes the user's local time is ahead of UTC, as for /analytics/report
+    tz_offset_minutes: Optional[int] = None
+
+class DayMeal(BaseModel):
+    # A Meal row (name only) or a full analysis with dishes
+    name: Optional[str] = None
+    dishes: List[DishItem] = []
+    eaten_at: Optional[str] = None
+
+class InteractionDayRequest(BaseModel):
+    medications: List[MedicationItem]
+    meals: List[DayMeal]
+    tz_offset_minutes: Optional[int] = None
+
+def require_interaction_checker():
+    if not interaction_checker:
+        raise HTTPException(status_code=503, detail="Interaction knowledge base not loaded.")
+
+def meal_dish_names(meal: DayMeal) -> List[str]:
+    return [dish.name for dish in meal.dishes] or ([meal.name] if meal.name else [])
+
+@app.post("/interactions/check")
+async def check_interactions(request: InteractionCheckRequest):
+    """
+    Contraindication alerts for one meal against the user's active medications
+    Answered locally from the compiled knowledge base in microseconds;
+    "unrecognized_medications" lists entries that could not be checked
+    """
+    
+    require_interaction_checker()
+    started = time.perf_counter()
+    with STAGE_LATENCY.time(("interaction_check",)):
+        profile = interaction_checker.compile(
+            [medication.model_dump() for medication in request.medications], request.tz_offset_minutes
+        )
+        alerts = interaction_checker.check_meal(
+            profile, [dish.name for dish in request.dishes], request.eaten_at, request.tz_offset_minutes
+        )
+    return {
+        "alerts": alerts,
+        "medications": profile.recognized,
+        "unrecognized_medications": profile.unrecognized,
+        "elapsed_us": round((time.perf_counter() - started) * 1e6, 1)
+    }
+
+@app.post("/interactions/check/day")
+async def check_interactions_day(request: InteractionDayRequest):
+    """
+    Every meal of a day against one medication list, compiled once
+    Each entry of "results" holds that meal's alerts; "summary" has one line
+    per medication and food class with the meals it was found in
+    """
+    
+    require_interaction_checker()
+    if len(request.meals) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} meals per batch")
+    
+    started = time.perf_counter()
+    with STAGE_LATENCY.time(("interaction_check",)):
+        result = interaction_checker.check_day(
+            [medication.model_dump() for medication in request.medications],
+            [{"dishes": meal_dish_names(meal), "eaten_at": meal.eaten_at} for meal in request.meals],
+            request.tz_offset_minutes
+        )
+    return {**result, "elapsed_us": round((time.perf_counter() - started) * 1e6, 1)}
+
+# Longest range a report may cover
+ANALYTICS_MAX_DAYS = 3660
+
+class MealRow(BaseModel):
+    # A Meal row as /api/meal returns it
+    id: Optional[str] = None
+    name: Optional[str] = None
+    kcal: float = 0
+    protein_g: float = 0
+    carbs_g: float = 0
+    fat_g: float = 0
+    createdAt: str
+
+class MedicineRow(BaseModel):
+    # A medicine as /api/medicine returns it, with its intake timestamps
+    name: str
+    time: Optional[str] = None
+    takenAt: List[str] = []
+
+class AnalyticsRequest(BaseModel):
+    # Whose history this is; the X-User-Id header set by the authenticating
+    # API takes its place, and one of the two is required
+    user_id: Optional[str] = None
+    # Rows to add to the user's history first; ids already seen are skipped,
+    # so the client can resend its list
+    meals: List[MealRow] = []
+    medicines: List[MedicineRow] = []
+    # Daily targets by nutrient (kcal, protein_g, carbs_g, fat_g)
+    goals: Dict[str, float] = {}
+    period: str = "day"
+    days: int = 30
+    tz_offset_minutes: int = 0
+    rolling_days: int = 7
+
+def build_report(request: AnalyticsRequest) -> dict:
+    analytics_engine.add_meal_rows(request.user_id, [meal.model_dump() for meal in request.meals])
+    return analytics_engine.report(
+        request.user_id,
+        days=request.days,
+        period=request.period,
+        goals=request.goals,
+        medicines=[medicine.model_dump() for medicine in request.medicines],
+        tz_offset_minutes=request.tz_offset_minutes,
+        rolling_days=request.rolling_days
+    )
+
+@app.post("/analytics/report")
+async def analytics_report(request: AnalyticsRequest, x_user_id: Optional[str] = Header(None)):
+    """
+    Daily / weekly / monthly rollups of the user's meal history for the
+    last `days` days: totals, per-day averages, macro energy ratios,
+    rolling averages (daily rows), goal adherence and medication adherence
+    Closed days are memoized per user, so a repeated report only rescans today
+    """
+    
+    if x_user_id and request.user_id and request.user_id != x_user_id:
+        raise HTTPException(status_code=403, detail="user_id doesn't match the authenticated user.")
+    request.user_id = x_user_id or request.user_id
+    if not request.user_id:
+        raise HTTPException(status_code=400, detail="user_id (or the X-User-Id header) is required.")
+    if not analytics_engine:
+        raise HTTPException(status_code=503, detail="Analytics need numpy.")
+    if not 1 <= request.days <= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {ANALYTICS_MAX_DAYS}")
+    
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        with STAGE_LATENCY.time(("analytics",)):
+            report = await loop.run_in_executor(None, build_report, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return report
+
+@app.post("/analytics/sync")
+async def analytics_sync():
+    """Pull Meal rows added in MySQL since the last sync into the meal store now"""
+    from meal_store import SYNC_ERRORS
+    
+    if not meal_sync:
+        raise HTTPException(status_code=503, detail="MySQL meal sync is not configured (DATABASE_URL, pymysql).")
+    loop = asyncio.get_running_loop()
+    try:
+        added = await loop.run_in_executor(None, meal_sync.sync)
+    except SYNC_ERRORS as e:
+        raise HTTPException(status_code=503, detail=f"MySQL meal sync failed: {e}")
+    return {"added": added, **meal_sync.stats()}
+
+@app.get("/upstream/stats")
+async def upstream_stats():
+    """Gemini admission control: in-flight calls, queue depth, wait times, quota left"""
+    return governor.stats()
+
+def cache_lookups() -> dict:
+    """Lookup outcomes of both response caches, for /metrics"""
+    image = image_cache.stats() if image_cache else {}
+    text = text_cache.stats()
+    chat = chat_cache.stats() if chat_cache else {}
+    return {
+        ("image", "hit"): image.get("hits", 0),
+        ("image", "shared_hit"): image.get("shared_hits", 0),
+        ("image", "miss"): image.get("misses", 0),
+        ("text", "memory_hit"): text["memory_hits"],
+        ("text", "disk_hit"): text["disk_hits"],
+        ("text", "miss"): text["misses"],
+        ("chat", "hit"): chat.get("hits", 0),
+        ("chat", "near_hit"): chat.get("near_hits", 0),
+        ("chat", "shared_hit"): chat.get("shared_hits", 0),
+        ("chat", "miss"): chat.get("misses", 0)
+    }
+
+Counter("intake_cache_lookups_total", "Response cache lookups by result (near_hit and shared_hit are part of hit)", ("cache", "result"), function=cache_lookups)
+Counter(
+    "intake_cache_evictions_total", "Entries dropped for space or age", ("cache",),
+    function=lambda: {
+        ("image",): image_cache.evictions if image_cache else 0,
+        ("chat",): chat_cache.evictions if chat_cache else 0
+    }
+)
+Gauge(
+    "intake_cache_entries", "Entries held in memory", ("cache",),
+    function=lambda: {
+        ("image",): image_cache.stats()["entries"] if image_cache else 0,
+        ("chat",): len(chat_cache) if chat_cache else 0
+    }
+)
+Counter(
+    "intake_upstream_calls_saved_total", "Upstream calls avoided by request coalescing", ("mechanism",),
+    function=lambda: {
+        ("single_flight",): inflight.deduplicated,
+        ("shared_single_flight",): inflight.shared_deduplicated,
+        ("micro_batch",): text_batcher.stats()["upstream_calls_saved"] + image_batcher.stats()["upstream_calls_saved"]
+    }
+)
+Counter(
+    "intake_upstream_rejected_total", "Gemini calls refused by the governor", ("reason",),
+    function=lambda: {(reason,): count for reason, count in governor.rejected.items()}
+)
+Gauge(
+    "intake_upstream_in_flight", "Gemini calls in progress", ("priority",),
+    function=lambda: {(name,): cls.active for name, cls in governor.classes.items()}
+)
+Gauge(
+    "intake_upstream_queue_depth", "Gemini calls waiting for admission", ("priority",),
+    function=lambda: {(name,): len(cls.waiters) for name, cls in governor.classes.items()}
+)
+
+Gauge(
+    "intake_jobs", "Photo analysis jobs in the queue table by status", ("status",),
+    function=lambda: {(status,): count for status, count in job_queue.counts().items()}
+)
+
+Gauge(
+    "intake_startup_seconds", "Worker start-up phases (import, startup, warmup, ready)", ("phase",),
+    function=lambda: {(phase[:-3],): ms / 1000 for phase, ms in startup_timings.items() if ms is not None}
+)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics (text exposition format)"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the response caches"""
+    return {
+        "image": image_cache.stats() if image_cache else None,
+        "text": text_cache.stats(),
+        "chat": chat_cache.stats() if chat_cache else None,
+        "chat_context": chat_context.stats(),
+        "analytics": analytics_engine.stats() if analytics_engine else None,
+        "meal_store": {**meal_stores.stats(), "sync": meal_sync.stats() if meal_sync else None} if meal_stores else None,
+        "shared": shared_state.stats() if shared_state else None
+    }
+
+@app.delete("/cache/text")
+async def invalidate_text_cache(description: Optional[str] = None, endpoint: Optional[str] = None):
+    """
+    Invalidate cached text answers
+    Pass a description and/or endpoint ("analyze-text", "quick-log") to narrow it down
+    """
+    removed = text_cache.invalidate(description=description, endpoint=endpoint)
+    return {"removed": removed}
 
 # Legacy endpoint for backward compatibility
 @app.post("/medical-chat")
@@ -477,9 +1796,24 @@ async def medical_chat(request: dict):
     """Legacy medical chat endpoint - redirects to nutrition-chat"""
     chat_request = ChatRequest(
         message=request.get("message", ""),
-        context=request.get("context")
+        context=request.get("context"),
+        conversation_id=request.get("conversation_id")
     )
     return await nutrition_chat(chat_request)
 
+@app.post("/medical-chat/stream")
+async def medical_chat_stream(request: dict):
+    """Legacy medical chat endpoint, streaming - same events as /nutrition-chat/stream"""
+    chat_request = ChatRequest(
+        message=request.get("message", ""),
+        context=request.get("context"),
+        conversation_id=request.get("conversation_id")
+    )
+    return await nutrition_chat_stream(chat_request)
+
+startup_timings["import_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+print(f"✅ ml imported in {startup_timings['import_ms']}ms")
+
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
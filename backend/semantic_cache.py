@@ -0,0 +1,322 @@
+"""
+Semantic answer cache for context-free /nutrition-chat questions
+FAQs arrive in many wordings ("how much protein in an egg", "protein in
+eggs?"); questions are embedded with a hashed word + character n-gram
+TF-IDF vectorizer and matched against earlier ones by cosine similarity
+in an in-memory matrix, so a rephrased question reuses the answer
+With shared state, exact repeats are also answered from the host-wide store
+and every answer is written there; similarity search stays per worker
+"""
+
+import os
+import re
+import time
+import zlib
+from typing import Optional
+
+import numpy as np
+
+CHAT_CACHE_SIZE = int(os.environ.get("CHAT_CACHE_SIZE", "1024"))
+CHAT_CACHE_TTL = int(os.environ.get("CHAT_CACHE_TTL", str(7 * 24 * 3600)))
+# Cosine similarity a cached question needs to answer a new one
+CHAT_CACHE_MIN_SIMILARITY = float(os.environ.get("CHAT_CACHE_MIN_SIMILARITY", "0.8"))
+# Nearest questions checked against the guard before giving up
+CHAT_CACHE_CANDIDATES = 5
+# Hashed feature space; the index is CHAT_CACHE_SIZE x CHAT_CACHE_DIMS float32
+CHAT_CACHE_DIMS = int(os.environ.get("CHAT_CACHE_DIMS", "4096"))
+
+_WORD = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+_NEGATION = re.compile(r"\b(?:not|no|never|without|isn't|aren't|doesn't|don't|shouldn't|can't)\b|n't\b")
+_STOPWORDS = frozenset(
+    "a an the is are was be in on of to for and or do does did can i my me it "
+    "how what much many there any some this that with about should would could "
+    "please tell know you your have has get which food foods ok okay".split()
+)
+# Trigram Dice two content words need to count as the same word despite a typo
+_TERM_SIMILARITY = 0.7
+# Character n-grams count less than whole words but catch typos and plurals;
+# bigrams less too, so "iron sources" still matches "sources of iron"
+_CHAR_WEIGHT = 0.3
+_BIGRAM_WEIGHT = 0.5
+# Words that decide what a question is about: they are folded to one
+# spelling and two questions only match if they name the same ones
+# ("protein in eggs" is not "calories in eggs", "good" is not "bad")
+_KEY_TERMS = {
+    "protein": "protein", "calorie": "calorie", "kcal": "calorie", "carb": "carb", "carbohydrate": "carb",
+    "fat": "fat", "fiber": "fiber", "fibre": "fiber", "sugar": "sugar", "salt": "salt", "sodium": "salt",
+    "iron": "iron", "calcium": "calcium", "vitamin": "vitamin", "potassium": "potassium", "magnesium": "magnesium",
+    "cholesterol": "cholesterol", "caffeine": "caffeine", "alcohol": "alcohol",
+    "good": "good", "healthy": "good", "bad": "bad", "unhealthy": "bad", "harmful": "bad",
+    "before": "before", "after": "after", "gain": "gain", "lose": "lose", "losing": "lose", "loss": "lose"
+}
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("es") and word[-3] in "sxz":
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def question_terms(question: str) -> list:
+    """Stemmed content words of a question, in order"""
+    terms = []
+    for word in _WORD.findall(question.lower()):
+        if word not in _STOPWORDS:
+            stem = _stem(word)
+            terms.append(_KEY_TERMS.get(stem, stem))
+    return terms
+
+def question_guard(question: str) -> tuple:
+    """
+    What two questions must share exactly besides being similar: the numbers
+    they mention, whether they are negated and their key terms
+    ("200g" vs "100g", "good" vs "not good", "protein" vs "calories")
+    """
+    text = question.lower()
+    numbers = tuple(sorted(re.findall(r"\d+(?:\.\d+)?", text)))
+    keys = frozenset(_KEY_TERMS[term] for term in map(_stem, _WORD.findall(text)) if term in _KEY_TERMS)
+    return numbers, bool(_NEGATION.search(text)), keys
+
+def _trigrams(term: str) -> set:
+    padded = f"<{term}>"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _same_term(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    first, second = _trigrams(a), _trigrams(b)
+    return 2.0 * len(first & second) / (len(first) + len(second)) >= _TERM_SIMILARITY
+
+def terms_agree(first: list, second: list) -> bool:
+    """
+    Whether two questions use the same content words, up to order and typos
+    A near-hit may only differ in wording, never in what it asks about:
+    "sushi" is not "eggs", "my dog" is not "my child", "before bed" is not
+    "before a workout"
+    """
+    return all(any(_same_term(a, b) for b in second) for a in first) and \
+        all(any(_same_term(b, a) for a in first) for b in second)
+
+def _feature(text: str, dims: int) -> tuple:
+    """Hashed (index, sign) of a feature string"""
+    value = zlib.crc32(text.encode())
+    return value % dims, 1.0 if value & 0x80000000 else -1.0
+
+class HashedTfidfVectorizer:
+    """
+    Word unigrams, word bigrams and in-word character 3-grams hashed (with
+    a sign bit, so collisions cancel instead of adding up) into `dims` buckets
+    Term frequencies are sublinear; IDF weights come from the cache's own
+    document frequencies and are applied at query time
+    """
+
+    def __init__(self, dims: int = CHAT_CACHE_DIMS):
+        self.dims = dims
+
+    def transform(self, question: str) -> np.ndarray:
+        vector = np.zeros(self.dims, dtype=np.float32)
+        terms = question_terms(question)
+        features = {}
+        for term in terms:
+            features[("w", term)] = features.get(("w", term), 0.0) + 1.0
+            padded = f"<{term}>"
+            for i in range(len(padded) - 2):
+                gram = ("c", padded[i:i + 3])
+                features[gram] = features.get(gram, 0.0) + _CHAR_WEIGHT
+        for first, second in zip(terms, terms[1:]):
+            features[("b", first + " " + second)] = features.get(("b", first + " " + second), 0.0) + _BIGRAM_WEIGHT
+
+        for (kind, text), count in features.items():
+            index, sign = _feature(kind + ":" + text, self.dims)
+            vector[index] += sign * (1.0 + np.log(count) if count >= 1 else count)
+        return vector
+
+class SemanticChatCache:
+    """
+    LRU + TTL cache of chat answers with a nearest-neighbour lookup
+    Row i of `_vectors` embeds `_questions[i]`; free and expired rows are reused
+    A question only has a few dozen non-zero buckets, so a lookup reads just
+    those columns of the (column-major) matrix instead of all of it
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CHAT_CACHE_SIZE,
+        ttl_seconds: int = CHAT_CACHE_TTL,
+        min_similarity: float = CHAT_CACHE_MIN_SIMILARITY,
+        dims: int = CHAT_CACHE_DIMS,
+        shared=None
+    ):
+        self.max_entries = max_entries
+        self.shared = shared
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self.vectorizer = HashedTfidfVectorizer(dims)
+        self._vectors = np.zeros((max_entries, dims), dtype=np.float32, order="F")
+        # (bucket indices, values) of each row, for document frequencies and norms
+        self._features = [None] * max_entries
+        self._document_frequency = np.zeros(dims, dtype=np.float32)
+        self._stored_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._used = np.zeros(max_entries, dtype=bool)
+        self._questions = [None] * max_entries
+        self._guards = [None] * max_entries
+        self._answers = [None] * max_entries
+        # Normalized question -> row, for the exact-repeat fast path
+        self._exact = {}
+        # IDF^2 weights and weighted row norms, recomputed after the rows change
+        self._weights = None
+        self._norms = None
+        self.hits = 0
+        self.near_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return int(self._used.sum())
+
+    @staticmethod
+    def _normalize(question: str) -> tuple:
+        """Exact-match key: the content words plus the guard, so "Protein in eggs?" repeats "protein in an egg" """
+        return " ".join(question_terms(question)), question_guard(question)
+
+    @staticmethod
+    def _shared_key(key: tuple) -> str:
+        terms, (numbers, negated, keys) = key
+        return f"{terms}|{','.join(numbers)}|{int(negated)}|{','.join(sorted(keys))}"
+
+    def _weighting(self) -> tuple:
+        if self._weights is None:
+            documents = self._used.sum()
+            idf = np.log((1.0 + documents) / (1.0 + self._document_frequency)) + 1.0
+            self._weights = idf * idf
+            rows = np.flatnonzero(self._used)
+            norms = np.zeros(self.max_entries, dtype=np.float32)
+            if len(rows):
+                lengths = [len(self._features[row][0]) for row in rows]
+                columns = np.concatenate([self._features[row][0] for row in rows])
+                values = np.concatenate([self._features[row][1] for row in rows])
+                norms[rows] = np.sqrt(np.add.reduceat(values * values * self._weights[columns], np.cumsum([0] + lengths[:-1])))
+            self._norms = norms
+        return self._weights, self._norms
+
+    def get(self, question: str) -> Optional[dict]:
+        """Cached answer for this question or a close rewording, else None"""
+        now = time.time()
+        row = self._exact.get(self._normalize(question))
+        similarity = 1.0
+
+        if row is None and self._used.any():
+            query = self.vectorizer.transform(question)
+            columns = np.flatnonzero(query)
+            if len(columns):
+                weights, row_norms = self._weighting()
+                # cosine of the IDF-weighted vectors, all rows at once, over the query's buckets only
+                weighted = query[columns] * weights[columns]
+                dots = self._vectors[:, columns] @ weighted
+                norms = row_norms * np.sqrt(float(query[columns] @ weighted))
+                scores = np.where(self._used & (norms > 0), dots / np.maximum(norms, 1e-12), -1.0)
+                top = min(CHAT_CACHE_CANDIDATES, len(scores))
+                nearest = np.argpartition(-scores, top - 1)[:top]
+                guard = question_guard(question)
+                terms = question_terms(question)
+                for candidate in nearest[np.argsort(-scores[nearest])]:
+                    if scores[candidate] < self.min_similarity:
+                        break
+                    if self._guards[candidate] == guard and terms_agree(terms, self._questions[candidate][0].split()):
+                        row, similarity = int(candidate), float(scores[candidate])
+                        break
+
+        if row is not None:
+            if now - self._stored_at[row] <= self.ttl_seconds:
+                self._last_used[row] = now
+                self.hits += 1
+                if similarity < 1.0:
+                    self.near_hits += 1
+                return {**self._answers[row], "similarity": round(similarity, 3)}
+            self._evict(row)
+
+        if self.shared:
+            key = self._normalize(question)
+            answer = self.shared.get("chat", self._shared_key(key)) if key[0] else None
+            if answer is not None:
+                self._store(question, key, answer)
+                self.hits += 1
+                self.shared_hits += 1
+                return {**answer, "similarity": 1.0}
+
+        self.misses += 1
+        return None
+
+    def put(self, question: str, answer: dict):
+        key = self._normalize(question)
+        if not key[0]:
+            return
+        if self.shared:
+            self.shared.put("chat", self._shared_key(key), answer, self.ttl_seconds)
+        self._store(question, key, answer)
+
+    def _store(self, question: str, key: tuple, answer: dict):
+        row = self._exact.get(key)
+        if row is not None:
+            self._evict(row, count=False)
+        row = self._free_row()
+        vector = self.vectorizer.transform(question)
+        columns = np.flatnonzero(vector)
+
+        now = time.time()
+        self._vectors[row] = vector
+        self._features[row] = (columns, vector[columns])
+        self._document_frequency[columns] += 1
+        self._stored_at[row] = now
+        self._last_used[row] = now
+        self._used[row] = True
+        self._questions[row] = key
+        self._guards[row] = question_guard(question)
+        self._answers[row] = answer
+        self._exact[key] = row
+        self._weights = None
+
+    def _free_row(self) -> int:
+        """An unused row, else an expired one, else the least recently used"""
+        free = np.flatnonzero(~self._used)
+        if len(free):
+            return int(free[0])
+        expired = np.flatnonzero(time.time() - self._stored_at > self.ttl_seconds)
+        row = int(expired[0]) if len(expired) else int(np.argmin(self._last_used))
+        self._evict(row)
+        return row
+
+    def _evict(self, row: int, count: bool = True):
+        if not self._used[row]:
+            return
+        columns = self._features[row][0]
+        self._document_frequency[columns] -= 1
+        self._used[row] = False
+        self._vectors[row, columns] = 0.0
+        self._features[row] = None
+        self._exact.pop(self._questions[row], None)
+        self._questions[row] = self._guards[row] = self._answers[row] = None
+        self._weights = None
+        if count:
+            self.evictions += 1
+
+    def clear(self):
+        for row in np.flatnonzero(self._used):
+            self._evict(int(row), count=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,244 @@
+"""
+Host-wide state shared by every uvicorn worker, without an external service
+One SQLite (WAL) file holds three kinds of state:
+- cache entries by namespace, read through a small in-process tier that
+  trusts its copy for SHARED_MEMORY_TTL_S, so a hot key costs a dict lookup
+  and an answer one worker paid for is a hit in the others (and after a
+  restart)
+- token buckets, so a requests/tokens-per-minute quota holds for the host
+- leases, so identical requests in different workers share one upstream call
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+SHARED_STATE_PATH = os.environ.get(
+    "SHARED_STATE_PATH",
+    os.path.join(os.path.dirname(__file__), ".cache", "shared_state.sqlite3")
+)
+# Entries each worker keeps in memory in front of the shared table
+SHARED_MEMORY_ENTRIES = int(os.environ.get("SHARED_MEMORY_ENTRIES", "4096"))
+# How long a worker trusts its in-memory copy, which bounds how late a change by another worker is seen
+SHARED_MEMORY_TTL_S = float(os.environ.get("SHARED_MEMORY_TTL_S", "5"))
+
+class SharedState:
+    """Cache entries, token buckets and leases in one SQLite file every worker opens"""
+
+    def __init__(
+        self,
+        path: str = SHARED_STATE_PATH,
+        memory_entries: int = SHARED_MEMORY_ENTRIES,
+        memory_ttl_s: float = SHARED_MEMORY_TTL_S
+    ):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.memory_ttl_s = memory_ttl_s
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # (namespace, key) -> (read_at, expires_at, value), oldest first
+        self._memory: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # namespace -> [memory hits, shared hits, misses]
+        self._lookups = {}
+        self.leases_won = 0
+        self.leases_lost = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=2000")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self._db.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+
+    def get(self, namespace: str, key: str, memory: bool = True):
+        """Value stored by any worker, or None; memory=False always reads the table"""
+        now = time.time()
+        with self._lock:
+            counts = self._lookups.setdefault(namespace, [0, 0, 0])
+            if memory:
+                cached = self._memory.get((namespace, key))
+                if cached is not None and now - cached[0] <= self.memory_ttl_s and now < cached[1]:
+                    self._memory.move_to_end((namespace, key))
+                    counts[0] += 1
+                    return cached[2]
+            row = self._db.execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, now)
+            ).fetchone()
+            if row is None:
+                self._memory.pop((namespace, key), None)
+                counts[2] += 1
+                return None
+            value = json.loads(row[0])
+            self._remember(namespace, key, now, row[1], value)
+            counts[1] += 1
+            return value
+
+    def put(self, namespace: str, key: str, value, ttl_s: float):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), now + ttl_s)
+            )
+            self._remember(namespace, key, now, now + ttl_s, value)
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            self._memory.pop((namespace, key), None)
+
+    def _remember(self, namespace: str, key: str, now: float, expires_at: float, value):
+        self._memory[(namespace, key)] = (now, expires_at, value)
+        self._memory.move_to_end((namespace, key))
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def bucket_level(self, name: str, per_minute: float) -> float:
+        """Units left in a host-wide token bucket (full when never used)"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT level, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return float(per_minute)
+        return min(per_minute, row[0] + (now - row[1]) * per_minute / 60.0)
+
+    def bucket_take(self, takes: List[tuple]) -> bool:
+        """
+        Take (name, amount, per_minute) from each bucket, all or nothing
+        Check and subtraction are one statement per bucket inside one write
+        transaction, so workers racing for the last units can't all win
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for name, amount, per_minute in takes:
+                    values = {"name": name, "limit": per_minute, "amount": amount, "now": now}
+                    self._db.execute("INSERT OR IGNORE INTO buckets (name, level, updated) VALUES (:name, :limit, :now)", values)
+                    taken = self._db.execute(
+                        """
+                        UPDATE buckets SET level = MIN(:limit, level + (:now - updated) * :limit / 60.0) - :amount, updated = :now
+                        WHERE name = :name AND MIN(:limit, level + (:now - updated) * :limit / 60.0) >= :amount
+                        RETURNING level
+                        """,
+                        values
+                    ).fetchone()
+                    if taken is None:
+                        self._db.execute("ROLLBACK")
+                        return False
+                self._db.execute("COMMIT")
+                return True
+            except sqlite3.Error:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def bucket_adjust(self, name: str, amount: float, per_minute: float):
+        """Take (or refund, when negative) units from a host-wide bucket; the level may go below zero"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                """
+                INSERT INTO buckets (name, level, updated) VALUES (:name, MIN(:limit, :limit - :amount), :now)
+                ON CONFLICT (name) DO UPDATE SET
+                    level = MIN(:limit, MIN(:limit, level + (:now - updated) * :limit / 60.0) - :amount),
+                    updated = :now
+                """,
+                {"name": name, "limit": per_minute, "amount": amount, "now": now}
+            )
+
+    def acquire(self, key: str, ttl_s: float) -> bool:
+        """Take a lease on key unless another worker holds an unexpired one"""
+        now = time.time()
+        with self._lock:
+            won = self._db.execute(
+                """
+                INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leases.expires_at <= ?
+                """,
+                (key, self.owner, now + ttl_s, now)
+            ).rowcount == 1
+        if won:
+            self.leases_won += 1
+        else:
+            self.leases_lost += 1
+        return won
+
+    def held(self, key: str) -> bool:
+        """Whether any worker holds an unexpired lease on key"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM leases WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone() is not None
+
+    def release(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner))
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            removed = self._db.execute("DELETE FROM entries WHERE expires_at <= ?", (now,)).rowcount
+            self._db.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = dict(self._db.execute("SELECT namespace, COUNT(*) FROM entries GROUP BY namespace").fetchall())
+            lookups = {namespace: list(counts) for namespace, counts in self._lookups.items()}
+
+        def namespace_stats(namespace: str, counts: list) -> dict:
+            memory_hits, shared_hits, misses = counts
+            total = memory_hits + shared_hits + misses
+            return {
+                "entries": entries.get(namespace, 0),
+                "memory_hits": memory_hits,
+                "shared_hits": shared_hits,
+                "misses": misses,
+                "hit_rate": round((memory_hits + shared_hits) / total, 4) if total else 0.0
+            }
+
+        return {
+            "path": self.path,
+            "entries": sum(entries.values()),
+            "memory_entries": len(self._memory),
+            "namespaces": {
+                namespace: namespace_stats(namespace, lookups.get(namespace, [0, 0, 0]))
+                for namespace in sorted(set(entries) | set(lookups))
+            },
+            "leases_won": self.leases_won,
+            "leases_lost": self.leases_lost
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def open_shared_state(path: str = SHARED_STATE_PATH) -> Optional[SharedState]:
+    """
+    The host's shared state, or None (per-worker state only) when disabled
+    or unavailable; call it in each worker after the fork, not at import
+    """
+    if not path:
+        return None
+    try:
+        return SharedState(path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠️ Shared state unavailable, keeping state per worker: {e}")
+        return None
@@ -0,0 +1,97 @@
+"""
+Single-flight deduplication of identical in-flight requests
+Concurrent copies of the same request (app retries, several open tabs)
+await one shared upstream call instead of each issuing their own
+With shared state the dedup spans worker processes: the first worker takes
+a lease on the key and publishes the result, the others poll for it
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+from typing import Awaitable, Callable
+
+# Longest one call may hold a key for other workers (they run it themselves after that)
+SINGLE_FLIGHT_LEASE_S = float(os.environ.get("SINGLE_FLIGHT_LEASE_S", "60"))
+# How long a finished call's result stays readable by workers that were waiting on it
+SINGLE_FLIGHT_RESULT_TTL_S = float(os.environ.get("SINGLE_FLIGHT_RESULT_TTL_S", "10"))
+# Waiters poll for the result starting at the first interval, doubling up to the second
+SINGLE_FLIGHT_POLL_S = 0.05
+SINGLE_FLIGHT_MAX_POLL_S = 1.0
+
+def content_key(namespace: str, payload) -> str:
+    """Stable hash of a request body (str or bytes) within an endpoint namespace"""
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return f"{namespace}:{hashlib.sha256(payload).hexdigest()}"
+
+class SingleFlight:
+    """Maps request keys to the task currently computing their result"""
+
+    def __init__(self, shared=None):
+        self._inflight = {}
+        self.shared = shared
+        self.calls = 0
+        self.deduplicated = 0
+        self.shared_deduplicated = 0
+
+    async def do(self, key: str, call: Callable[[], Awaitable]):
+        """
+        Run call() unless an identical request is already in flight, in which
+        case wait for that one; every waiter gets the same result or exception
+        The work runs as its own task, so a caller that disconnects does not
+        cancel it for the others
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._shared_call(key, call) if self.shared else call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.calls += 1
+        else:
+            self.deduplicated += 1
+        return await asyncio.shield(task)
+
+    async def _shared_call(self, key: str, call: Callable[[], Awaitable]):
+        """
+        Run call() under a host-wide lease, or wait for the worker holding it
+        Only JSON results are shared; when the holder fails (or its result
+        can't be shared) the lease lapses and waiters run call() themselves
+        """
+        # SQLite calls go to a thread so a busy database never stalls the event loop
+        shared = self.shared
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + SINGLE_FLIGHT_LEASE_S
+        poll_s = SINGLE_FLIGHT_POLL_S
+        while not await loop.run_in_executor(None, shared.acquire, key, SINGLE_FLIGHT_LEASE_S):
+            await asyncio.sleep(poll_s)
+            poll_s = min(poll_s * 2, SINGLE_FLIGHT_MAX_POLL_S)
+            result = await loop.run_in_executor(None, lambda: shared.get("flight", key, memory=False))
+            if result is not None:
+                self.shared_deduplicated += 1
+                return result
+            if time.monotonic() > deadline:
+                return await call()
+
+        try:
+            result = await call()
+            try:
+                await loop.run_in_executor(None, shared.put, "flight", key, result, SINGLE_FLIGHT_RESULT_TTL_S)
+            except (TypeError, ValueError):
+                pass
+            return result
+        finally:
+            await loop.run_in_executor(None, shared.release, key)
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.calls,
+            "upstream_calls_saved": self.deduplicated + self.shared_deduplicated,
+            "saved_across_workers": self.shared_deduplicated
+        }
@@ -0,0 +1,258 @@
+"""
+Symptom and topic detection for the chat endpoints
+Every term of the bundled lexicon (symptoms with their urgency, topics,
+urgency cues, severity words and negation cues) is compiled into one
+Aho-Corasick automaton over words, so a message is scanned once in time
+linear in its length however many terms the lexicon has
+Overlapping matches resolve leftmost-longest ("chest pain" wins over
+"pain", "no appetite" over "no"); a symptom in the list directly after a
+negation cue ("no nausea or vomiting") is reported as negated and does not
+raise the urgency, except that a negated high-urgency term still counts as
+high ("never had chest pain like this" is not a reason to relax)
+"""
+
+import os
+import re
+import csv
+from typing import Dict, List, Optional
+
+SYMPTOM_LEXICON_PATH = os.environ.get(
+    "SYMPTOM_LEXICON_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "symptoms.csv")
+)
+# Words after a severity word that it still applies to
+NEGATION_WINDOW = 5
+
+URGENCY_LEVELS = ("low", "moderate", "high")
+KINDS = ("symptom", "topic", "cue", "modifier", "negation")
+
+NEGATION_CUES = (
+    "no", "not", "never", "without", "none", "neither", "nor", "denies", "deny",
+    "dont", "doesnt", "didnt", "havent", "hasnt", "hadnt", "isnt", "arent", "wasnt", "werent",
+    "no longer", "free of", "absence of", "ruled out"
+)
+# Phrases that contain a negation cue without negating anything; as longer
+# matches they shadow the cue
+PSEUDO_NEGATIONS = ("not sure", "not certain", "no idea", "not only", "not just", "no doubt")
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?|[.!?;,:()]")
+# Words that end a clause like punctuation does: contrasts, "and now ...",
+# and verbs that start a new statement ("had no dinner and passed out")
+_SCOPE_BREAKS = frozenset((
+    "but", "however", "although", "though", "except", "yet", "and", "now", "then",
+    "am", "is", "are", "was", "were", "had", "has", "have", "got", "get", "gets", "getting",
+    "feel", "feels", "felt", "feeling", "started", "starting", "passed", "went", "came", "ate", "took"
+))
+_PUNCTUATION = frozenset(".!?;,:()")
+# The only words a negated symptom list may contain besides the symptoms
+# themselves ("no nausea, vomiting or any signs of fever")
+_LIST_WORDS = frozenset((",", "or", "nor", "any", "a", "an", "more", "other", "further", "signs", "sign", "of", "symptoms"))
+# Cues that take a verb before the symptom ("dont have a fever", "not feeling dizzy")
+_AUXILIARY_CUES = frozenset(("not", "dont", "doesnt", "didnt", "havent", "hasnt", "hadnt", "isnt", "arent", "wasnt", "werent"))
+_NEGATED_VERBS = frozenset((
+    "have", "has", "had", "having", "get", "got", "getting", "feel", "feels", "felt", "feeling",
+    "notice", "noticed", "noticing", "experience", "experienced", "experiencing"
+))
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words with apostrophes dropped ("can't" -> "cant"), plus clause punctuation"""
+    return [token.replace("'", "") for token in _TOKEN.findall(text.lower().replace("’", "'"))]
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher over token sequences
+    add() patterns, then build() once; find() yields (start, end, value)
+    for every occurrence of every pattern, end exclusive
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[tuple] = [()]
+        self.patterns = 0
+
+    def add(self, tokens: List[str], value):
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][token] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] += ((len(tokens), value),)
+        self.patterns += 1
+
+    def build(self):
+        """Failure links breadth-first; each state also reports the matches of its suffixes"""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for token, child in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] += self._output[self._fail[child]]
+                queue.append(child)
+
+    def find(self, tokens: List[str]):
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for end, token in enumerate(tokens, 1):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            for length, value in output[state]:
+                yield end - length, end, value
+
+    def __len__(self):
+        return len(self._goto)
+
+class LexiconEntry:
+    __slots__ = ("name", "kind", "urgency")
+
+    def __init__(self, name: str, kind: str, urgency: Optional[str]):
+        self.name = name
+        self.kind = kind
+        self.urgency = urgency
+
+def load_lexicon(path: str = SYMPTOM_LEXICON_PATH) -> List[tuple]:
+    """(name, kind, urgency, [terms]) rows of a lexicon CSV; the name is a term too"""
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["kind"] not in KINDS:
+                raise ValueError(f"Unknown lexicon kind {row['kind']!r} for {row['name']!r}")
+            urgency = row["urgency"] or None
+            if urgency is not None and urgency not in URGENCY_LEVELS:
+                raise ValueError(f"Unknown urgency {urgency!r} for {row['name']!r}")
+            synonyms = [term.strip() for term in row["synonyms"].split(";") if term.strip()]
+            rows.append((row["name"], row["kind"], urgency, [row["name"]] + synonyms))
+    return rows
+
+class SymptomDetector:
+    """
+    Compiled lexicon; detect(message) -> symptoms, negated symptoms, topics
+    and urgency ("high" / "moderate" / "low")
+    A severity word ("severe", "sudden") before a symptom in the same clause
+    raises that symptom one urgency level
+    """
+
+    def __init__(self, path: str = SYMPTOM_LEXICON_PATH, rows: Optional[List[tuple]] = None):
+        self.entries: List[LexiconEntry] = []
+        self.matcher = AhoCorasick()
+        self._seen = set()
+        for name, kind, urgency, terms in rows if rows is not None else load_lexicon(path):
+            self._add(LexiconEntry(name, kind, urgency), terms)
+        self._add(LexiconEntry("negation", "negation", None), NEGATION_CUES)
+        self._add(LexiconEntry("pseudo negation", "pseudo", None), PSEUDO_NEGATIONS)
+        self.matcher.build()
+        self.terms = len(self._seen)
+
+    def _add(self, entry: LexiconEntry, terms):
+        self.entries.append(entry)
+        for term in terms:
+            tokens = tokenize(term)
+            key = " ".join(tokens)
+            # First spelling wins; a term listed twice would be reported twice
+            if tokens and key not in self._seen:
+                self._seen.add(key)
+                self.matcher.add(tokens, entry)
+
+    def _matches(self, tokens: List[str]) -> List[tuple]:
+        """Leftmost-longest non-overlapping (start, end, entry)"""
+        found = sorted(self.matcher.find(tokens), key=lambda match: (match[0], -match[1]))
+        kept, covered = [], 0
+        for start, end, entry in found:
+            if start >= covered:
+                kept.append((start, end, entry))
+                covered = end
+        return kept
+
+    def detect(self, message: str) -> dict:
+        tokens = tokenize(message)
+        # Clause number of each token; negation and severity do not cross clauses
+        clauses, clause = [], 0
+        for token in tokens:
+            if token in _PUNCTUATION or token in _SCOPE_BREAKS:
+                clause += 1
+            clauses.append(clause)
+
+        symptoms, negated, topics = [], [], []
+        level = 0
+        last_modifier = None
+        # (cue, end of the negated list so far) while a negation is open
+        negation = None
+        for start, end, entry in self._matches(tokens):
+            kind = entry.kind
+            if kind == "negation":
+                negation = (tokens[start:end], end)
+                continue
+            in_list = negation is not None and self._in_list(tokens, negation, start)
+            if kind == "modifier":
+                last_modifier = end
+                negation = (negation[0], end) if in_list else None
+                continue
+            if kind == "topic":
+                if entry.name not in topics:
+                    topics.append(entry.name)
+                negation = None
+                continue
+            if kind not in ("symptom", "cue"):
+                continue
+
+            entry_level = URGENCY_LEVELS.index(entry.urgency or "low")
+            if in_list:
+                negation = (negation[0], end)
+                if kind == "symptom" and entry.name not in negated and entry.name not in symptoms:
+                    negated.append(entry.name)
+                # A negation never talks a high-urgency term down
+                if entry.urgency == "high":
+                    level = max(level, entry_level)
+                continue
+            negation = None
+            if kind == "symptom":
+                if entry.name in negated:
+                    negated.remove(entry.name)
+                if entry.name not in symptoms:
+                    symptoms.append(entry.name)
+                if self._applies(last_modifier, start, clauses):
+                    entry_level = min(entry_level + 1, len(URGENCY_LEVELS) - 1)
+            level = max(level, entry_level)
+
+        return {
+            "symptoms": symptoms,
+            "negated_symptoms": negated,
+            "topics": topics,
+            "urgency": URGENCY_LEVELS[level]
+        }
+
+    @staticmethod
+    def _in_list(tokens: List[str], negation: tuple, start: int) -> bool:
+        """Whether only list words separate the open negated list from a match starting at start"""
+        cue, list_end = negation
+        for index in range(list_end, start):
+            token = tokens[index]
+            if token in _LIST_WORDS:
+                continue
+            # "dont have", "didnt feel": one verb right after an auxiliary cue
+            if index == list_end and len(cue) == 1 and cue[0] in _AUXILIARY_CUES and token in _NEGATED_VERBS:
+                continue
+            return False
+        return True
+
+    @staticmethod
+    def _applies(cue_end: Optional[int], start: int, clauses: List[int]) -> bool:
+        """Whether a severity word ending at cue_end reaches a match starting at start"""
+        return cue_end is not None and start - cue_end < NEGATION_WINDOW and \
+            clauses[cue_end - 1] == clauses[start]
+
+    def stats(self) -> dict:
+        return {
+            "terms": self.terms,
+            "entries": len(self.entries),
+            "states": len(self.matcher)
+        }
@@ -0,0 +1,71 @@
+"""
+Unit tests for the analytics rollups, their closed-day memo and the report endpoint
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import ml
+from analytics import AnalyticsEngine, DAY_S
+
+# 2026-03-11 12:00 UTC
+NOW = 20523 * DAY_S + 12 * 3600
+
+def meal(id: str, created_at: str, kcal: float) -> dict:
+    return {"id": id, "createdAt": created_at, "kcal": kcal, "protein_g": 10, "carbs_g": 20, "fat_g": 5}
+
+def test_closed_days_are_reused():
+    engine = AnalyticsEngine()
+    engine.add_meal_rows("ana", [meal("1", "2026-03-09T08:00:00Z", 400), meal("2", "2026-03-11T08:00:00Z", 600)])
+    first = engine.report("ana", days=3, now=NOW)
+    assert first["memo"] == {"days_reused": 0, "days_computed": 3}
+    second = engine.report("ana", days=3, now=NOW)
+    # Only today is rescanned
+    assert second["memo"] == {"days_reused": 2, "days_computed": 1}
+    assert [row["total_kcal"] for row in second["periods"]] == [400, 0, 600]
+
+def test_late_rows_drop_their_day_from_the_memo():
+    engine = AnalyticsEngine()
+    engine.add_meal_rows("ana", [meal("1", "2026-03-09T08:00:00Z", 400)])
+    engine.report("ana", days=3, now=NOW)
+    engine.add_meal_rows("ana", [meal("2", "2026-03-09T19:00:00Z", 300)])
+    report = engine.report("ana", days=3, now=NOW)
+    assert report["memo"] == {"days_reused": 1, "days_computed": 2}
+    assert report["periods"][0]["total_kcal"] == 700
+
+def test_resent_rows_are_skipped():
+    engine = AnalyticsEngine()
+    rows = [meal("1", "2026-03-10T08:00:00Z", 400)]
+    assert engine.add_meal_rows("ana", rows) == 1
+    assert engine.add_meal_rows("ana", rows) == 0
+
+def test_users_are_kept_apart():
+    engine = AnalyticsEngine()
+    engine.add_meal_rows("ana", [meal("1", "2026-03-10T08:00:00Z", 400)])
+    assert engine.report("ben", days=3, now=NOW)["summary"]["meals"] == 0
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = AnalyticsEngine()
+    monkeypatch.setattr(ml, "analytics_engine", engine)
+    return engine
+
+def report(body: dict, user: str = None) -> dict:
+    return asyncio.run(ml.analytics_report(ml.AnalyticsRequest(**body), x_user_id=user))
+
+def test_report_needs_a_user(engine):
+    with pytest.raises(HTTPException) as error:
+        report({"meals": [meal("1", "2026-03-10T08:00:00Z", 400)]})
+    assert error.value.status_code == 400
+    assert not engine.stats()["users"]
+
+def test_report_user_comes_from_the_header(engine):
+    created_at = datetime.now(timezone.utc).isoformat()
+    report({"meals": [meal("1", created_at, 400)]}, user="ana")
+    assert report({"user_id": "ana"})["summary"]["meals"] == 1
+    with pytest.raises(HTTPException) as error:
+        report({"user_id": "ben"}, user="ana")
+    assert error.value.status_code == 403
@@ -0,0 +1,82 @@
+"""
+Unit tests for prompt packing, packed-answer parsing and the micro-batcher
+"""
+
+import asyncio
+
+from batching import MicroBatcher, pack_items, parse_batch_response
+
+def test_pack_items_respects_both_limits():
+    assert pack_items([10, 10, 10, 10], max_tokens=25, max_items=10) == [[0, 1], [2, 3]]
+    assert pack_items([1, 1, 1], max_tokens=100, max_items=2) == [[0, 1], [2]]
+    # Too large on its own: still gets a group
+    assert pack_items([5, 50, 5], max_tokens=20, max_items=10) == [[0], [1], [2]]
+
+def test_parse_batch_response():
+    text = '```json\n[{"item": 2, "dishes": [{"name": "Toast"}]}, {"item": 9, "dishes": [{"name": "Stray"}]}, {"item": 1, "dishes": []}]\n```'
+    assert parse_batch_response(text, 3) == [None, [{"name": "Toast"}], None]
+    assert parse_batch_response('Sure! [{"item": 1, "dishes": [{"name": "Egg"}]}] Enjoy.', 1) == [[{"name": "Egg"}]]
+    assert parse_batch_response('{"items": [{"item": "1", "dishes": [{"name": "Egg"}]}]}', 1) == [[{"name": "Egg"}]]
+    assert parse_batch_response("not json", 2) == [None, None]
+
+def test_concurrent_submissions_share_one_batch():
+    batches = []
+
+    async def process(items):
+        batches.append(items)
+        return [item * 2 for item in items]
+
+    async def run():
+        batcher = MicroBatcher(process, window_ms=20, max_items=10)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(4))), batcher
+
+    results, batcher = asyncio.run(run())
+    assert results == [0, 2, 4, 6]
+    assert batches == [[0, 1, 2, 3]]
+    assert batcher.stats() == {"batches": 1, "items": 4, "upstream_calls_saved": 3}
+
+def test_full_batch_is_sent_before_the_window_ends():
+    batches = []
+
+    async def process(items):
+        batches.append(items)
+        return items
+
+    async def run():
+        batcher = MicroBatcher(process, window_ms=10000, max_items=2)
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(4))), 1)
+
+    assert asyncio.run(run()) == [0, 1, 2, 3]
+    assert batches == [[0, 1], [2, 3]]
+
+def test_errors_reach_only_their_callers():
+    async def process(items):
+        return [ValueError(item) if item == "bad" else item for item in items]
+
+    async def run():
+        batcher = MicroBatcher(process, window_ms=10)
+        return await asyncio.gather(batcher.submit("good"), batcher.submit("bad"), return_exceptions=True)
+
+    good, bad = asyncio.run(run())
+    assert good == "good"
+    assert isinstance(bad, ValueError)
+
+def test_failed_batch_fails_every_item():
+    async def process(items):
+        raise RuntimeError("upstream failed")
+
+    async def run():
+        batcher = MicroBatcher(process, window_ms=10)
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    assert [str(result) for result in asyncio.run(run())] == ["upstream failed"] * 2
+
+def test_zero_window_calls_through():
+    async def process(items):
+        return [len(items)]
+
+    async def run():
+        batcher = MicroBatcher(process, window_ms=0)
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("b"))
+
+    assert asyncio.run(run()) == [1, 1]
@@ -0,0 +1,72 @@
+"""
+Unit tests for the token-budgeted chat context and its rolling summary
+"""
+
+import asyncio
+
+from chat_context import ContextManager, count_tokens, extractive_summary, truncate_tokens
+
+BUDGETS = {"chat": 200}
+
+def conversation(turns: int) -> str:
+    lines = ["User: I am vegetarian and allergic to peanuts, goal 1800 kcal a day."]
+    for turn in range(turns):
+        lines.append(f"User: what could I have for meal number {turn} today please")
+        lines.append(f"Assistant: try a lentil bowl with rice and roasted vegetables, option {turn}")
+    return "\n".join(lines)
+
+def test_count_and_truncate_tokens():
+    assert count_tokens("protein 1800") == 2 + 2
+    text = "one two six ten fig oat"
+    assert truncate_tokens(text, 3) == "one two six"
+    assert truncate_tokens(text, 3, keep_end=True) == "ten fig oat"
+
+def test_short_context_passes_through():
+    manager = ContextManager(budgets=BUDGETS)
+    result = manager.compact("chat", conversation(2))
+    assert (result.summary, result.recent) == ("", conversation(2))
+    assert manager.stats()["passthrough"] == 1
+
+def test_long_history_is_trimmed_under_the_budget():
+    manager = ContextManager(budgets=BUDGETS)
+    context = conversation(40)
+    result = manager.compact("chat", context)
+    assert result.original_tokens > 5 * BUDGETS["chat"]
+    assert result.tokens <= BUDGETS["chat"]
+    # The newest turn is kept verbatim, older ones are folded into the summary
+    assert context.endswith(result.recent)
+    assert "option 39" in result.recent
+    assert "option 0" not in result.recent
+    # Facts from the dropped turns survive in the summary
+    assert "allergic to peanuts" in result.summary
+
+def test_summary_stays_put_while_the_tail_fits():
+    manager = ContextManager(budgets=BUDGETS)
+    first = manager.compact("chat", conversation(40))
+    second = manager.compact("chat", conversation(41))
+    assert second.summary == first.summary
+    assert "option 40" in second.recent
+    assert manager.stats()["summary_hits"] == 1
+
+def test_model_summary_replaces_the_extractive_one():
+    calls = []
+
+    async def summarize(previous, new_text, max_tokens):
+        calls.append((previous, new_text))
+        return "Vegetarian, peanut allergy, 1800 kcal goal; asked for many meal ideas."
+
+    async def run():
+        manager = ContextManager(summarize=summarize, budgets=BUDGETS)
+        manager.compact("chat", conversation(40))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return manager.compact("chat", conversation(41)), manager
+
+    result, manager = asyncio.run(run())
+    assert result.summary == "Vegetarian, peanut allergy, 1800 kcal goal; asked for many meal ideas."
+    assert "option 0" in calls[0][1] and calls[0][0] is None
+    assert manager.stats()["summaries_generated"] == 1
+
+def test_extractive_summary_prefers_facts():
+    text = "hello there\nI am allergic to shellfish.\nnice weather today\nmy target is 2000 kcal"
+    assert extractive_summary(text, 16) == "I am allergic to shellfish.\nmy target is 2000 kcal"
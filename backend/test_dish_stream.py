@@ -0,0 +1,53 @@
+"""
+Unit tests for the incremental dish parser and the shared dish validator
+"""
+
+import json
+
+from dish_stream import DishStreamParser, parse_dishes, validate_dish, DISH_DEFAULTS
+
+DISHES = [
+    {"name": "Rice {steamed}", "weight_g": 150, "kcal": 195, "protein_g": 4, "carbs_g": 42, "fat_g": 0, "confidence": 0.9},
+    {"name": "Chicken \"tikka\" \\ masala", "weight_g": 200, "kcal": 300, "protein_g": 28, "carbs_g": 8, "fat_g": 16, "confidence": 0.8}
+]
+TEXT = "Here you go:\n```json\n" + json.dumps(DISHES) + "\n```"
+
+def feed_in_chunks(text: str, size: int) -> list:
+    parser = DishStreamParser()
+    dishes = []
+    for i in range(0, len(text), size):
+        dishes.extend(parser.feed(text[i:i + size]))
+    return dishes
+
+def test_any_chunking_gives_the_same_dishes():
+    for size in (1, 2, 3, 7, 64, len(TEXT)):
+        assert feed_in_chunks(TEXT, size) == DISHES
+
+def test_each_dish_is_emitted_when_it_closes():
+    parser = DishStreamParser()
+    first_end = TEXT.index("}, {") + 1
+    assert parser.feed(TEXT[:first_end - 1]) == []
+    assert parser.feed(TEXT[first_end - 1:first_end + 2]) == DISHES[:1]
+    assert parser.feed(TEXT[first_end + 2:]) == DISHES[1:]
+
+def test_malformed_objects_are_skipped():
+    text = '[{"name": "Soup", "kcal": }, {"name": "Bread", "kcal": 80}]'
+    assert feed_in_chunks(text, 5) == [{"name": "Bread", "kcal": 80}]
+
+def test_parse_dishes_accepts_every_shape():
+    assert parse_dishes(json.dumps(DISHES)) == DISHES
+    assert parse_dishes(json.dumps({"dishes": DISHES})) == DISHES
+    assert parse_dishes(json.dumps(DISHES[0])) == DISHES[:1]
+    assert parse_dishes(TEXT) == DISHES
+    assert parse_dishes("no dishes here") == []
+
+def test_validate_dish_coerces_model_output():
+    dish = validate_dish({"name": "Toast", "weight_g": "60 g", "kcal": 150.7, "protein_g": -3, "carbs_g": True, "confidence": 85})
+    assert dish == {
+        "name": "Toast", "weight_g": 60, "kcal": 150, "protein_g": 0,
+        "carbs_g": DISH_DEFAULTS["carbs_g"], "fat_g": DISH_DEFAULTS["fat_g"], "confidence": 85.0
+    }
+
+def test_validate_dish_fills_defaults():
+    assert validate_dish("not a dish")["name"] == DISH_DEFAULTS["name"]
+    assert validate_dish({}, defaults={**DISH_DEFAULTS, "kcal": 0})["kcal"] == 0
@@ -0,0 +1,54 @@
+"""
+Unit tests for the trigram food index behind /quick-log
+"""
+
+import pytest
+
+from food_index import FoodIndex, normalize_food_name, parse_quantity, words_agree
+
+@pytest.fixture(scope="module")
+def index():
+    return FoodIndex()
+
+def test_normalize_singularizes():
+    assert normalize_food_name("Blueberries, fresh!") == "blueberry fresh"
+
+@pytest.mark.parametrize("text, expected", [
+    ("2 eggs", (2.0, None, "eggs")),
+    ("200g chicken breast", (200.0, "g", "chicken breast")),
+    ("1 1/2 cups rice", (1.5, "cup", "rice")),
+    ("half a cup of oats", (0.5, "cup", "oats"))
+])
+def test_parse_quantity(text, expected):
+    assert parse_quantity(text) == expected
+
+def test_words_agree():
+    assert words_agree("chiken breast", "chicken breast")
+    assert words_agree("brown rice cooked", "brown rice")
+    assert not words_agree("chocolate milk", "milk chocolate")
+    assert not words_agree("butter peanut", "peanut butter")
+    assert not words_agree("sweet potato pie", "sweet potato")
+    assert words_agree("grilled chicken", "grilled chicken breast")
+
+def test_exact_and_typo_matches(index):
+    food_id, score = index.match("Chicken Breast")
+    assert index.names[food_id] == "Chicken Breast" and score == 1.0
+    food_id, score = index.match("chiken breast")
+    assert index.names[food_id] == "Chicken Breast"
+
+@pytest.mark.parametrize("text", [
+    "chocolate milk", "butter peanut", "rice brown",
+    "sweet potato pie", "sweet potato fries", "peanut butter cup"
+])
+def test_swapped_words_are_not_served_locally(index, text):
+    local = index.estimate(text)
+    assert local is None or local["confidence"] < index.min_confidence
+
+def test_estimate_scales_by_quantity(index):
+    one = index.estimate("1 egg")
+    two = index.estimate("2 eggs")
+    assert two["weight_g"] == 2 * one["weight_g"]
+    assert index.estimate("200g chicken breast")["weight_g"] == 200
+
+def test_multi_item_entries_go_upstream(index):
+    assert index.estimate("rice and chicken") is None
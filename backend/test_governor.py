@@ -0,0 +1,138 @@
+"""
+Unit tests for the upstream governor: fair queuing, shedding and Retry-After
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from governor import UpstreamGovernor, UpstreamBusyError, PRIORITY_LOGGING, PRIORITY_CHAT, PRIORITY_BATCH
+
+WEIGHTS = {PRIORITY_LOGGING: 8, PRIORITY_CHAT: 2, PRIORITY_BATCH: 1}
+NO_CLASS_LIMITS = {PRIORITY_LOGGING: 1.0, PRIORITY_CHAT: 1.0, PRIORITY_BATCH: 1.0}
+
+def make_governor(**kwargs) -> UpstreamGovernor:
+    settings = {
+        "max_concurrency": 1, "rpm": 0, "tpm": 0, "max_queue": 64, "queue_timeout_s": 5,
+        "weights": WEIGHTS, "class_queue_size": {}, "class_max_share": NO_CLASS_LIMITS
+    }
+    return UpstreamGovernor(**{**settings, **kwargs})
+
+async def call(governor: UpstreamGovernor, priority: str, order: list):
+    lease = await governor.acquire(100, priority)
+    order.append(priority)
+    await asyncio.sleep(0)
+    lease.release()
+
+def test_waiters_are_served_in_proportion_to_their_weights():
+    async def run():
+        governor = make_governor()
+        holder = await governor.acquire(100)
+        order = []
+        tasks = [asyncio.create_task(call(governor, priority, order))
+                 for priority in [PRIORITY_BATCH] * 4 + [PRIORITY_CHAT] * 4]
+        await asyncio.sleep(0)
+        assert governor.queued == 8
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(run())
+    # Chat (weight 2) gets two slots for every batch slot (weight 1), whoever queued first
+    assert order[:6].count(PRIORITY_CHAT) == 4
+    assert order[-2:] == [PRIORITY_BATCH, PRIORITY_BATCH]
+
+def test_class_over_its_queue_limit_is_refused():
+    async def run():
+        governor = make_governor(class_queue_size={PRIORITY_CHAT: 1})
+        holder = await governor.acquire(100)
+        waiter = asyncio.create_task(governor.acquire(100, PRIORITY_CHAT))
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamBusyError) as error:
+            await governor.acquire(100, PRIORITY_CHAT)
+        # Other classes still queue
+        logging = asyncio.create_task(governor.acquire(100, PRIORITY_LOGGING))
+        await asyncio.sleep(0)
+        assert governor.queued == 2
+        holder.release()
+        (await logging).release()
+        (await waiter).release()
+        return error.value, governor
+
+    error, governor = asyncio.run(run())
+    assert error.status_code == 503
+    assert error.headers["Retry-After"] == str(error.retry_after)
+    assert governor.classes[PRIORITY_CHAT].shed == 1
+
+def test_full_queue_sheds_the_newest_lower_class_waiter():
+    async def run():
+        governor = make_governor(max_queue=2)
+        holder = await governor.acquire(100)
+        first = asyncio.create_task(governor.acquire(100, PRIORITY_BATCH))
+        newest = asyncio.create_task(governor.acquire(100, PRIORITY_BATCH))
+        await asyncio.sleep(0)
+        logging = asyncio.create_task(governor.acquire(100, PRIORITY_LOGGING))
+        with pytest.raises(UpstreamBusyError):
+            await newest
+        with pytest.raises(UpstreamBusyError) as error:
+            # Nothing ranks below batch, so a full queue refuses it
+            await governor.acquire(100, PRIORITY_BATCH)
+        holder.release()
+        (await logging).release()
+        (await first).release()
+        return error.value, governor
+
+    error, governor = asyncio.run(run())
+    assert error.status_code == 503
+    assert governor.rejected == {"queue_full": 1, "quota": 0, "timeout": 0, "shed": 1}
+
+def test_quota_that_cannot_refill_in_time_is_a_429():
+    async def run():
+        governor = make_governor(max_concurrency=4, rpm=1, queue_timeout_s=2)
+        (await governor.acquire(100)).release()
+        with pytest.raises(UpstreamBusyError) as error:
+            await governor.acquire(100)
+        return error.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 429
+    # One request per minute: the next one is a minute away
+    assert 55 <= error.retry_after <= 60
+
+def test_upstream_429_holds_calls_back():
+    async def run():
+        governor = make_governor(max_concurrency=4, queue_timeout_s=1)
+        governor.rate_limited(5)
+        with pytest.raises(UpstreamBusyError) as error:
+            await governor.acquire(100)
+        return error.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 429
+    assert error.retry_after == 5
+
+def test_waiter_times_out():
+    async def run():
+        governor = make_governor(queue_timeout_s=0.05)
+        holder = await governor.acquire(100)
+        with pytest.raises(UpstreamBusyError) as error:
+            await governor.acquire(100)
+        holder.release()
+        return error.value, governor
+
+    error, governor = asyncio.run(run())
+    assert error.status_code == 503
+    assert governor.rejected["timeout"] == 1
+    assert governor.stats()["queue_depth"] == 0
+
+def test_usage_replaces_the_token_estimate():
+    async def run():
+        governor = make_governor(tpm=1000)
+        async with await governor.acquire(100) as lease:
+            lease.record_usage(SimpleNamespace(total_token_count=300))
+        return governor
+
+    governor = asyncio.run(run())
+    assert governor.active == 0
+    assert 690 <= governor.tpm.level <= 710
@@ -0,0 +1,59 @@
+"""
+Unit tests for the perceptual-hash image cache and its file on disk
+"""
+
+import json
+import time
+import multiprocessing
+
+from PIL import Image, ImageDraw
+
+from image_cache import PerceptualHashCache, hamming_distance, perceptual_hash
+
+def plate(shade: int = 200) -> Image.Image:
+    image = Image.new("RGB", (256, 256), (shade, shade, shade))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((40, 40, 216, 216), fill=(180, 90, 40))
+    draw.rectangle((100, 20, 140, 120), fill=(30, 140, 30))
+    return image
+
+def test_resized_photo_is_a_near_duplicate():
+    original = perceptual_hash(plate())
+    assert hamming_distance(original, perceptual_hash(plate().resize((640, 640)))) <= 2
+    assert hamming_distance(original, perceptual_hash(plate().rotate(90))) > 6
+
+def test_near_duplicates_hit(tmp_path):
+    cache = PerceptualHashCache(path=None)
+    cache.put(0b1011, [{"name": "Salad"}])
+    assert cache.get(0b1001) == [{"name": "Salad"}]
+    assert cache.get(0xFFFF_0000_FFFF_0000) is None
+    assert cache.near_hits == 1
+
+def test_saves_from_several_workers_are_merged(tmp_path):
+    path = str(tmp_path / "image_cache.json")
+    first, second = PerceptualHashCache(path=path), PerceptualHashCache(path=path)
+    first.put(1, [{"name": "Soup"}])
+    second.put(2, [{"name": "Rice"}])
+    first.save()
+    second.save()
+    restored = PerceptualHashCache(path=path)
+    restored.load()
+    assert restored.get(1) == [{"name": "Soup"}]
+    assert restored.get(2) == [{"name": "Rice"}]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["image_cache.json", "image_cache.json.lock"]
+
+def save_many(path: str, worker: int):
+    cache = PerceptualHashCache(path=path)
+    for i in range(20):
+        cache._entries[worker << 32 | i] = (time.time(), [{"name": f"{worker}-{i}"}])
+        cache.save()
+
+def test_concurrent_saves_keep_every_entry(tmp_path):
+    path = str(tmp_path / "image_cache.json")
+    workers = [multiprocessing.Process(target=save_many, args=(path, worker)) for worker in (1, 2, 3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    with open(path) as f:
+        assert len(json.load(f)) == 60
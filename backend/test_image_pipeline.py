@@ -0,0 +1,154 @@
+"""
+Unit tests for upload preprocessing (downscale, EXIF orientation, re-encode,
+reduced-scale JPEG decode) and the chunked upload checks
+"""
+
+import io
+import asyncio
+import hashlib
+
+import pytest
+from PIL import Image
+
+import image_pipeline
+from image_pipeline import IMAGE_MAX_EDGE, ImageRejectedError, UploadLimitMiddleware, preprocess_image, scan_upload
+
+def encode(image: Image.Image, image_format: str, **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **kwargs)
+    return buffer.getvalue()
+
+def photo(width: int, height: int) -> Image.Image:
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    image.paste((200, 60, 30), (width // 4, height // 4, width // 2, height // 2))
+    return image
+
+def test_large_photo_is_downscaled_and_reencoded():
+    original = encode(photo(3000, 2000), "PNG")
+    encoded, mime_type, stats = preprocess_image(original)
+    assert mime_type == "image/jpeg"
+    assert stats["original_size"] == [3000, 2000]
+    assert stats["processed_size"] == [IMAGE_MAX_EDGE, round(IMAGE_MAX_EDGE * 2 / 3)]
+    assert stats["processed_bytes"] == len(encoded) < len(original)
+    assert Image.open(io.BytesIO(encoded)).format == "JPEG"
+    assert len(stats["phash"]) == 16
+
+def test_exif_orientation_is_applied():
+    exif = Image.Exif()
+    # 6: the camera was turned 90 degrees; viewers rotate the stored landscape to portrait
+    exif[0x0112] = 6
+    encoded, _, stats = preprocess_image(encode(photo(400, 200), "JPEG", exif=exif))
+    assert stats["processed_size"] == [200, 400]
+    assert 0x0112 not in Image.open(io.BytesIO(encoded)).getexif()
+
+def test_small_photo_keeps_its_size():
+    _, _, stats = preprocess_image(io.BytesIO(encode(photo(320, 240), "PNG")))
+    assert stats["processed_size"] == [320, 240]
+
+def test_undecodable_upload_is_rejected():
+    with pytest.raises(ImageRejectedError) as error:
+        preprocess_image(b"\xff\xd8\xff not really a jpeg")
+    assert error.value.status_code == 400
+
+def test_large_jpeg_decodes_at_reduced_scale(monkeypatch):
+    decoded = []
+    thumbnail = Image.Image.thumbnail
+
+    def record(image, size, *args, **kwargs):
+        decoded.append(image.size)
+        return thumbnail(image, size, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, "thumbnail", record)
+    _, _, stats = preprocess_image(encode(photo(4096, 3072), "JPEG", quality=90))
+    # The decoder halved it once (a quarter would go below the target)
+    assert decoded == [(2048, 1536)]
+    assert stats["processed_size"] == [IMAGE_MAX_EDGE, IMAGE_MAX_EDGE * 3 // 4]
+
+class CountingFile(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+def test_scan_upload_hashes_in_chunks(monkeypatch):
+    monkeypatch.setattr(image_pipeline, "UPLOAD_CHUNK_BYTES", 1024)
+    data = encode(photo(300, 300), "PNG")
+    source = CountingFile(data)
+    assert scan_upload(source) == (len(data), "PNG", hashlib.sha256(data).hexdigest())
+    assert source.reads > 2
+    assert source.tell() == 0
+
+def test_scan_upload_stops_at_the_cap(monkeypatch):
+    monkeypatch.setattr(image_pipeline, "UPLOAD_CHUNK_BYTES", 1024)
+    source = CountingFile(b"\xff\xd8\xff" + bytes(100_000))
+    with pytest.raises(ImageRejectedError) as error:
+        scan_upload(source, limit=4096)
+    assert error.value.status_code == 413
+    assert source.reads == 5
+
+@pytest.mark.parametrize("head, declared, status", [
+    (b"%PDF-1.4", None, 415),
+    (b"\xff\xd8\xff", 10**9, 413)
+])
+def test_scan_upload_rejects_before_reading_it_all(head, declared, status):
+    with pytest.raises(ImageRejectedError) as error:
+        scan_upload(io.BytesIO(head + bytes(10_000)), declared_size=declared, limit=5000)
+    assert error.value.status_code == status
+
+def run_upload(headers: list, chunks: list, limit: int) -> tuple:
+    """(status sent, body chunks the app was handed) for one request through the middleware"""
+    received, sent = [], []
+
+    async def app(scope, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            received.append(message["body"])
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def receive():
+        body = chunks.pop(0)
+        return {"type": "http.request", "body": body, "more_body": bool(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": "/infer", "headers": headers}
+    asyncio.run(UploadLimitMiddleware(app, {"/infer": limit})(scope, receive, send))
+    return sent[0]["status"], received
+
+def test_declared_oversized_body_is_refused_unread():
+    chunks = [bytes(1000)] * 10
+    status, received = run_upload([(b"content-length", b"10000")], chunks, limit=4000)
+    assert status == 413
+    assert received == [] and len(chunks) == 10
+
+def test_chunked_body_is_cut_off_at_the_cap():
+    chunks = [bytes(1000)] * 10
+    status, received = run_upload([], chunks, limit=4000)
+    assert status == 413
+    # The fifth chunk crossed the cap; the rest was never read
+    assert len(received) == 4 and len(chunks) == 5
+
+def test_body_under_the_cap_passes():
+    status, received = run_upload([], [bytes(1000)] * 3, limit=4000)
+    assert status == 200
+    assert len(received) == 3
+
+def test_read_upload_turns_rejections_into_http_errors():
+    from fastapi import HTTPException, UploadFile
+    import ml
+
+    upload = UploadFile(io.BytesIO(b"\xff\xd8\xff" + bytes(10)), size=ml.IMAGE_MAX_BYTES + 1)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(ml.read_upload(upload))
+    assert error.value.status_code == 413
+    data = encode(photo(64, 64), "PNG")
+    assert asyncio.run(ml.read_upload(UploadFile(io.BytesIO(data), size=len(data)))) == hashlib.sha256(data).hexdigest()
@@ -0,0 +1,62 @@
+"""
+Unit tests for the drug-food interaction knowledge base
+"""
+
+import pytest
+
+from interactions import InteractionChecker, PhraseIndex, hours_apart, minute_of_day
+
+@pytest.fixture(scope="module")
+def checker():
+    return InteractionChecker()
+
+def test_minute_of_day_clock_and_naive_timestamps():
+    assert minute_of_day("08:30") == 510
+    assert minute_of_day("2026-10-17T08:30:00") == 510
+    assert minute_of_day("soon") is None
+    assert minute_of_day(None) is None
+
+def test_minute_of_day_aware_timestamps_need_an_offset():
+    assert minute_of_day("2026-10-17T03:30:00Z") is None
+    assert minute_of_day("2026-10-17T03:30:00Z", 300) == 510
+    assert minute_of_day("2026-10-17T08:30:00+05:00", 0) == 210
+    assert minute_of_day("2026-10-17T23:30:00Z", 120) == 90
+
+def test_hours_apart_wraps_midnight():
+    assert hours_apart(23 * 60, 60) == 2
+
+def test_phrase_index_prefers_longest():
+    index = PhraseIndex()
+    index.add("grapefruit", "citrus")
+    index.add("grapefruit juice", "juice")
+    assert index.find("fresh grapefruit juices") == [("grapefruit juice", {"juice"})]
+
+def test_brand_names_resolve_to_ingredients(checker):
+    assert checker.ingredients("Synthroid 50mcg") == ["levothyroxine"]
+
+def test_timing_rule_respects_separation(checker):
+    profile = checker.compile([{"name": "Synthroid", "time": "08:00"}])
+    assert len(checker.check_meal(profile, ["Coffee"], "08:30")) == 1
+    assert checker.check_meal(profile, ["Coffee"], "10:30") == []
+    assert len(checker.check_meal(profile, ["Coffee"])) == 1
+
+def test_utc_timestamp_without_offset_keeps_the_alert(checker):
+    profile = checker.compile([{"name": "Synthroid", "time": "08:00"}])
+    alerts = checker.check_meal(profile, ["Coffee"], "2026-10-17T03:30:00Z")
+    assert len(alerts) == 1
+    assert alerts[0]["hours_from_dose"] is None
+
+def test_utc_timestamp_converted_with_offset(checker):
+    profile = checker.compile([{"name": "Synthroid", "time": "08:00"}], tz_offset_minutes=300)
+    assert len(checker.check_meal(profile, ["Coffee"], "2026-10-17T03:30:00Z", 300)) == 1
+    assert checker.check_meal(profile, ["Coffee"], "2026-10-17T06:00:00Z", 300) == []
+
+def test_check_day_summary(checker):
+    result = checker.check_day(
+        [{"name": "Synthroid", "time": "08:00"}, {"name": "Mystery pill"}],
+        [{"dishes": ["Espresso"], "eaten_at": "2026-10-17T03:15:00Z"}, {"dishes": ["Rice"], "eaten_at": "12:00"}],
+        tz_offset_minutes=300
+    )
+    assert [len(meal["alerts"]) for meal in result["results"]] == [1, 0]
+    assert result["summary"][0]["meals"] == [0]
+    assert result["unrecognized_medications"] == ["Mystery pill"]
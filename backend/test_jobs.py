@@ -0,0 +1,103 @@
+"""
+Unit tests for the persistent photo analysis job queue
+"""
+
+import time
+import asyncio
+
+import pytest
+
+import jobs
+from governor import UpstreamBusyError, PRIORITY_BATCH
+from jobs import JobQueue
+
+async def handler(claimed):
+    return [{"dishes": [job["meta"]["name"]]} for job in claimed]
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(handler, path=str(tmp_path / "jobs.sqlite3"), workers=1)
+    queue.open()
+    yield queue
+    queue.close()
+
+def expire_leases(queue):
+    queue._execute("UPDATE jobs SET lease_until = 0 WHERE status = 'running'")
+
+def test_submit_dedupes_pending_digests(queue):
+    first = queue.submit(b"image", {"name": "Salad"}, digest="abc")
+    assert queue.submit(b"image", {"name": "Salad"}, digest="abc")["id"] == first["id"]
+    assert queue.get(first["id"])["queue_position"] == 0
+
+def test_known_result_is_done_at_once(queue):
+    job = queue.submit(None, {}, result={"dishes": ["Soup"]})
+    assert job["status"] == "done"
+    assert queue.claim() == []
+
+def test_claim_orders_interactive_before_batch(queue):
+    batch = queue.submit(b"1", {"name": "a"}, priority=PRIORITY_BATCH)
+    interactive = queue.submit(b"2", {"name": "b"})
+    assert [job["id"] for job in queue.claim(2)] == [interactive["id"], batch["id"]]
+
+def test_finish_stores_result(queue):
+    job = queue.submit(b"image", {"name": "Salad"})
+    claimed = queue.claim()[0]
+    queue.finish(claimed, {"dishes": ["Salad"]})
+    assert queue.get(job["id"])["status"] == "done"
+    assert queue.get(job["id"])["result"] == {"dishes": ["Salad"]}
+
+def test_busy_error_requeues_without_using_an_attempt(queue):
+    job = queue.submit(b"image", {})
+    queue.finish(queue.claim()[0], UpstreamBusyError(503, "busy", 1))
+    stored = queue.get(job["id"])
+    assert (stored["status"], stored["attempts"]) == ("queued", 0)
+
+def test_errors_retry_until_failed(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_POLL_S", 0)
+    job = queue.submit(b"image", {})
+    for _ in range(jobs.JOB_MAX_ATTEMPTS):
+        queue.finish(queue.claim()[0], RuntimeError("boom"))
+    stored = queue.get(job["id"])
+    assert stored["status"] == "failed"
+    assert stored["status_code"] == 500
+
+def test_expired_lease_is_claimed_again(queue):
+    job = queue.submit(b"image", {})
+    queue.claim()
+    expire_leases(queue)
+    assert [claimed["id"] for claimed in queue.claim()] == [job["id"]]
+
+def test_job_that_keeps_losing_its_lease_fails(queue):
+    job = queue.submit(b"image", {})
+    for _ in range(jobs.JOB_MAX_ATTEMPTS):
+        assert queue.claim()
+        expire_leases(queue)
+    assert queue.claim() == []
+    stored = queue.get(job["id"])
+    assert stored["status"] == "failed"
+    assert "lost the job" in stored["error"]
+
+def test_stale_claim_cannot_overwrite_the_new_one(queue, tmp_path):
+    other = JobQueue(handler, path=str(tmp_path / "jobs.sqlite3"), workers=1)
+    other.open()
+    job = queue.submit(b"image", {})
+    stale = queue.claim()[0]
+    expire_leases(queue)
+    fresh = other.claim()[0]
+    other.finish(fresh, {"dishes": ["Fresh"]})
+    queue.finish(stale, {"dishes": ["Stale"]})
+    assert queue.get(job["id"])["result"] == {"dishes": ["Fresh"]}
+    assert queue.processed == 0
+    other.close()
+
+def test_workers_run_jobs_and_stop_requeues(queue):
+    async def run():
+        queue.start()
+        job = queue.submit(b"image", {"name": "Salad"})
+        finished = await queue.wait(job["id"], timeout=2)
+        await queue.stop()
+        return finished
+
+    finished = asyncio.run(run())
+    assert finished["status"] == "done"
+    assert finished["result"] == {"dishes": ["Salad"]}
@@ -0,0 +1,63 @@
+"""
+Unit tests for the local meal planner behind /suggest-meals
+"""
+
+import pytest
+
+from meal_planner import DIETS, CONTENTS, MEAL_TYPES, MealPlanner, parse_exclusions, parse_meal_type, parse_targets
+
+@pytest.fixture(scope="module")
+def planner():
+    return MealPlanner()
+
+@pytest.mark.parametrize("text, expected", [
+    ("What fits my remaining 650 kcal and 40 g protein?", {"kcal": 650, "protein_g": 40}),
+    ("I have 1,200 kcal left", {"kcal": 1200}),
+    ("carbs: 60, fat 20g", {"carbs_g": 60, "fat_g": 20}),
+    ("I ate 500 calories at breakfast, what about dinner?", {}),
+    ("I had 1500 calories so far, 500 kcal left", {"kcal": 500}),
+    ("I ate 30g protein at lunch and have 600 kcal left", {"kcal": 600})
+])
+def test_parse_targets(text, expected):
+    assert parse_targets(text) == expected
+
+@pytest.mark.parametrize("text, expected", [
+    ("I ate 500 calories at breakfast, what about dinner?", "dinner"),
+    ("Ideas for lunch? I had a big breakfast", "lunch"),
+    ("Something light for supper", "dinner"),
+    ("I skipped breakfast and lunch", "lunch"),
+    ("650 kcal left", None)
+])
+def test_parse_meal_type(text, expected):
+    assert parse_meal_type(text) == expected
+
+def test_parse_exclusions():
+    assert parse_exclusions("I'm vegetarian and allergic to peanuts, no dairy please") == {"vegetarian", "nut_free", "dairy"}
+    assert parse_exclusions("gluten-free, avoiding shrimp") == {"gluten_free", "shellfish"}
+
+def test_suggestions_fit_the_targets(planner):
+    suggestions = planner.suggest({"kcal": 650, "protein_g": 40}, count=3)
+    assert len(suggestions) == 3
+    for suggestion in suggestions:
+        assert abs(suggestion["estimated_kcal"] - 650) <= 100
+        assert abs(suggestion["protein_g"] - 40) <= 10
+    # No meal repeats across suggestions
+    items = [item for suggestion in suggestions for item in suggestion["items"]]
+    assert len(items) == len(set(items))
+    assert [s["fit"] for s in suggestions] == sorted((s["fit"] for s in suggestions), reverse=True)
+
+def test_exclusions_and_meal_type_are_respected(planner):
+    excluded = 0
+    for content in DIETS["vegan"]:
+        excluded |= 1 << CONTENTS.index(content)
+    for suggestion in planner.suggest({"kcal": 500}, {"vegan"}, "breakfast", count=5):
+        for item in suggestion["items"]:
+            meal = planner.names.index(item)
+            assert not planner.contents[meal] & excluded
+            assert MEAL_TYPES[planner.meal_types[meal]] in ("breakfast", "snack")
+
+def test_unknown_exclusion_and_missing_targets(planner):
+    with pytest.raises(ValueError):
+        planner.suggest({"kcal": 500}, {"carnivore"})
+    with pytest.raises(ValueError):
+        planner.suggest({})
@@ -0,0 +1,79 @@
+"""
+Unit tests for the memory-mapped meal store and its compaction
+"""
+
+import numpy as np
+import pytest
+
+from analytics import AnalyticsEngine, DAY_S, NUTRIENTS
+from meal_store import MealStore, MealStores
+
+DAY = 20523 * DAY_S
+
+def rows(hours: list) -> tuple:
+    timestamps = np.array([DAY + hour * 3600 for hour in hours], dtype=np.int64)
+    values = np.array([[100 * (i + 1)] + [1] * (len(NUTRIENTS) - 1) for i in range(len(hours))], dtype=np.float32)
+    return timestamps, values
+
+@pytest.fixture
+def store(tmp_path):
+    return MealStore(str(tmp_path / "ana"), compact_rows=4)
+
+def test_late_rows_go_to_the_tail_until_compaction(store):
+    store.extend(*rows([8, 12, 18]), names=["Oats", "Soup", "Rice"])
+    store.extend(*rows([10]), names=["Apple"])
+    assert store.stats()["tail_rows"] == 1
+    assert store.late_rows == 1
+    found = store.range(DAY, DAY + DAY_S)
+    assert (np.diff(found["timestamps"]) > 0).all()
+    assert store.decode(found["names"]) == ["Oats", "Apple", "Soup", "Rice"]
+
+    store.compact()
+    stats = store.stats()
+    assert (stats["tail_rows"], stats["generation"], stats["compactions"]) == (0, 1, 1)
+    found = store.range(DAY, DAY + DAY_S)
+    assert store.decode(found["names"]) == ["Oats", "Apple", "Soup", "Rice"]
+    assert found["values"][:, 0].tolist() == [100, 100, 200, 300]
+
+def test_tail_compacts_itself_at_the_threshold(store):
+    store.extend(*rows([20]))
+    for hour in (1, 2, 3, 4):
+        store.extend(*rows([hour]))
+    stats = store.stats()
+    assert (stats["rows"], stats["tail_rows"], stats["compactions"]) == (5, 0, 1)
+    assert store.range(DAY, DAY + DAY_S)["timestamps"].tolist() == [DAY + hour * 3600 for hour in (1, 2, 3, 4, 20)]
+
+def test_day_sums_count_tail_rows(store):
+    store.extend(*rows([30, 40]))
+    store.extend(*rows([2]))
+    sums = store.day_sums(20523, 20524, 0)
+    # Hours 30 and 40 fall on the next day
+    assert sums[:, 0].tolist() == [1, 2]
+    assert sums[:, 1].tolist() == [100, 300]
+
+def test_known_ids_are_skipped_after_reopening(store):
+    ids = np.array([11, 12], dtype=np.int64)
+    assert len(store.extend(*rows([8, 9]), ids=ids)) == 2
+    reopened = MealStore(store.path)
+    assert len(reopened.extend(*rows([8, 9]), ids=ids)) == 0
+    assert len(reopened) == 2
+
+def test_other_workers_see_commits_and_compactions(store):
+    other = MealStore(store.path, compact_rows=4)
+    store.extend(*rows([8, 12]))
+    assert other.refresh().tolist() == [DAY + 8 * 3600, DAY + 12 * 3600]
+    assert other.refresh().tolist() == []
+    store.extend(*rows([1]))
+    store.compact()
+    # Rows moved: which days changed is unknown
+    assert other.refresh() is None
+    assert other.range(DAY, DAY + DAY_S)["timestamps"].tolist() == [DAY + hour * 3600 for hour in (1, 8, 12)]
+
+def test_analytics_over_stores(tmp_path):
+    stores = MealStores(str(tmp_path), compact_rows=4)
+    assert stores.directory("a/b") != stores.directory("a_b")
+    engine = AnalyticsEngine(history_factory=stores.open)
+    engine.add_meal_rows("ana", [{"id": "1", "createdAt": "2026-03-11T08:00:00Z", "kcal": 400}])
+    report = engine.report("ana", days=1, now=DAY + 12 * 3600)
+    assert report["summary"]["meals"] == 1
+    assert stores.stats()["rows"] == 1
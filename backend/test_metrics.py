@@ -0,0 +1,108 @@
+"""
+Unit tests for the metrics registry, the text exposition and /metrics
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+from metrics import Counter, Gauge, Histogram, MetricsMiddleware, REQUESTS, REQUEST_LATENCY, REQUESTS_IN_FLIGHT
+
+@pytest.fixture
+def registry():
+    """Metrics created in a test are dropped from the registry afterwards"""
+    before = list(metrics._registry)
+    yield
+    metrics._registry[:] = before
+
+def test_counter_and_gauge(registry):
+    counter = Counter("test_events_total", "Events by kind", ("kind",))
+    counter.inc(("a",))
+    counter.inc(("a",), 2)
+    counter.inc(("b\"c",))
+    gauge = Gauge("test_depth", "Queue depth")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert counter.render() == [
+        "# HELP test_events_total Events by kind",
+        "# TYPE test_events_total counter",
+        'test_events_total{kind="a"} 3',
+        'test_events_total{kind="b\\"c"} 1'
+    ]
+    assert gauge.render()[-1] == "test_depth 1"
+    gauge.set(0.5)
+    assert gauge.render()[-1] == "test_depth 0.5"
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = Histogram("test_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, ("/chat",))
+    assert histogram.render() == [
+        "# HELP test_seconds Latency",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{route="/chat",le="0.1"} 2',
+        'test_seconds_bucket{route="/chat",le="1"} 3',
+        'test_seconds_bucket{route="/chat",le="+Inf"} 4',
+        'test_seconds_sum{route="/chat"} 3.65',
+        'test_seconds_count{route="/chat"} 4'
+    ]
+
+def test_histogram_timer(registry):
+    histogram = Histogram("test_block_seconds", "Block time")
+    with histogram.time():
+        pass
+    assert histogram.render()[-1] == "test_block_seconds_count 1"
+
+def test_callback_metric_is_read_at_scrape_time(registry):
+    depth = {(): 1}
+    gauge = Gauge("test_callback", "Read on scrape", function=lambda: depth)
+    assert gauge.render()[-1] == "test_callback 1"
+    depth[()] = 4
+    assert gauge.render()[-1] == "test_callback 4"
+    broken = Gauge("test_broken", "Raises on scrape", function=lambda: 1 / 0)
+    assert broken.render() == ["# HELP test_broken Raises on scrape", "# TYPE test_broken gauge"]
+
+def test_render_covers_the_registry(registry):
+    Counter("test_rendered_total", "Rendered").inc()
+    text = metrics.render()
+    assert text.endswith("\n")
+    assert "# TYPE intake_upstream_duration_seconds histogram" in text
+    assert "# TYPE intake_stage_duration_seconds histogram" in text
+    assert "test_rendered_total 1" in text.splitlines()
+
+def test_middleware_records_the_route_template():
+    route = SimpleNamespace(path="/infer/jobs/{job_id}")
+
+    async def app(scope, receive, send):
+        scope["route"] = route
+        assert REQUESTS_IN_FLIGHT._values[()] >= 1
+        await send({"type": "http.response.start", "status": 404, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    labels = ("GET", "/infer/jobs/{job_id}", "404")
+    before = REQUESTS._values.get(labels, 0)
+    in_flight = REQUESTS_IN_FLIGHT._values.get((), 0)
+    for job_id in ("a", "b"):
+        scope = {"type": "http", "method": "GET", "path": f"/infer/jobs/{job_id}"}
+        asyncio.run(MetricsMiddleware(app)(scope, receive, send))
+    assert REQUESTS._values[labels] == before + 2
+    assert REQUESTS_IN_FLIGHT._values[()] == in_flight
+    assert ("GET", "/infer/jobs/{job_id}") in REQUEST_LATENCY._values
+
+def test_metrics_endpoint():
+    import ml
+
+    response = asyncio.run(ml.metrics())
+    assert response.media_type == "text/plain; version=0.0.4"
+    body = response.body.decode()
+    assert "# HELP intake_requests_total HTTP requests by endpoint and status code" in body
+    assert "# TYPE intake_upstream_errors_total counter" in body
@@ -0,0 +1,90 @@
+"""
+Unit tests for the semantic chat cache and its guards
+"""
+
+import pytest
+
+from semantic_cache import SemanticChatCache, question_guard, terms_agree
+from shared_state import SharedState
+
+@pytest.fixture
+def cache():
+    cache = SemanticChatCache(max_entries=8, dims=1024)
+    cache.put("How much protein is in an egg?", {"answer": "protein"})
+    cache.put("Which foods are good sources of iron?", {"answer": "iron"})
+    cache.put("Is coffee good for you?", {"answer": "coffee"})
+    return cache
+
+def test_exact_repeats_ignore_wording_noise(cache):
+    assert cache.get("protein in eggs?") == {"answer": "protein", "similarity": 1.0}
+
+def test_rewording_is_a_near_hit(cache):
+    answer = cache.get("good iron sources foods")
+    assert answer["answer"] == "iron"
+    assert cache.min_similarity <= answer["similarity"] < 1.0
+    assert cache.near_hits == 1
+
+@pytest.mark.parametrize("question", [
+    "How much protein is in 2 eggs?",
+    "Is coffee not good for you?",
+    "Is coffee bad for you?",
+    "How many calories are in an egg?"
+])
+def test_guard_rejects_similar_questions_that_differ(cache, question):
+    assert cache.get(question) is None
+
+BACKGROUND = [
+    "Can I eat eggs while pregnant?", "Is peanut butter safe for my child?",
+    "Should I eat carbs before a workout?", "How much protein is in eggs?",
+    "What are good sources of iron?", "Is coffee bad for you?", "How many calories in a banana?",
+    "Is rice healthy?", "What should I eat after a workout?", "Are eggs good for cholesterol?",
+    "How much water should I drink a day?", "Is it okay to skip breakfast?"
+]
+
+@pytest.mark.parametrize("question", [
+    "Can I eat sushi while pregnant?",
+    "Is peanut butter safe for my dog?",
+    "Should I eat carbs before bed?",
+    "How much protein is in egg whites?",
+    "Is drinking coffee bad for you?"
+])
+def test_another_subject_or_condition_is_a_miss(question):
+    cache = SemanticChatCache(max_entries=32)
+    for cached in BACKGROUND:
+        cache.put(cached, {"answer": cached})
+    assert cache.get(question) is None
+
+def test_terms_agree():
+    assert terms_agree(["good", "iron", "source"], ["source", "iron", "good"])
+    assert terms_agree(["vitamine"], ["vitamin"])
+    assert not terms_agree(["egg", "white", "protein"], ["egg", "protein"])
+
+def test_question_guard():
+    assert question_guard("Is 200g of rice healthy?") == (("200",), False, frozenset({"good"}))
+    assert question_guard("Aren't eggs high in cholesterol?")[1:] == (True, frozenset({"cholesterol"}))
+
+def test_expired_answers_are_dropped():
+    cache = SemanticChatCache(max_entries=4, dims=1024, ttl_seconds=-1)
+    cache.put("How much protein is in an egg?", {"answer": "protein"})
+    assert cache.get("How much protein is in an egg?") is None
+    assert len(cache) == 0
+
+def test_least_recently_used_answer_is_evicted():
+    cache = SemanticChatCache(max_entries=2, dims=1024)
+    cache.put("How much protein is in an egg?", {"answer": "protein"})
+    cache.put("Is coffee good for you?", {"answer": "coffee"})
+    cache._last_used[cache._exact[cache._normalize("Is coffee good for you?")]] -= 60
+    cache.get("How much protein is in an egg?")
+    cache.put("Which foods are good sources of iron?", {"answer": "iron"})
+    assert cache.get("Is coffee good for you?") is None
+    assert cache.get("How much protein is in an egg?")["answer"] == "protein"
+    assert cache.evictions == 1
+
+def test_answers_are_shared_between_workers(tmp_path):
+    state = SharedState(str(tmp_path / "state.sqlite3"))
+    first = SemanticChatCache(max_entries=4, dims=1024, shared=state)
+    second = SemanticChatCache(max_entries=4, dims=1024, shared=state)
+    first.put("How much protein is in an egg?", {"answer": "protein"})
+    assert second.get("protein in eggs") == {"answer": "protein", "similarity": 1.0}
+    assert second.shared_hits == 1
+    state.close()
@@ -0,0 +1,157 @@
+"""
+Unit tests for the cross-worker shared state and what is built on it
+"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+import subprocess
+
+import pytest
+
+from governor import UpstreamGovernor, UpstreamBusyError
+from image_cache import PerceptualHashCache
+from shared_state import SharedState
+from singleflight import SingleFlight
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "shared.sqlite3")
+
+def test_entries_are_visible_to_other_workers(path):
+    first, second = SharedState(path), SharedState(path)
+    first.put("ns", "key", {"value": 1}, 60)
+    assert second.get("ns", "key") == {"value": 1}
+    assert second.get("ns", "key") == {"value": 1}
+    stats = second.stats()["namespaces"]["ns"]
+    assert (stats["shared_hits"], stats["memory_hits"]) == (1, 1)
+
+def test_expired_entries_are_misses(path):
+    state = SharedState(path)
+    state.put("ns", "key", 1, -1)
+    assert state.get("ns", "key", memory=False) is None
+    assert state.purge_expired() == 1
+
+def test_bucket_take_is_all_or_nothing(path):
+    state = SharedState(path)
+    assert state.bucket_take([("rpm", 1, 10), ("tpm", 90, 100)])
+    assert not state.bucket_take([("rpm", 1, 10), ("tpm", 20, 100)])
+    assert round(state.bucket_level("rpm", 10)) == 9
+
+def test_bucket_take_never_overshoots_across_workers(path):
+    states = [SharedState(path) for _ in range(4)]
+    taken = []
+
+    def worker(state):
+        for _ in range(10):
+            if state.bucket_take([("rpm", 1, 10)]):
+                taken.append(1)
+
+    threads = [threading.Thread(target=worker, args=(state,)) for state in states]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # A minute's refill in the test's few milliseconds is far below one unit
+    assert len(taken) == 10
+
+def test_refund_does_not_exceed_the_limit(path):
+    state = SharedState(path)
+    state.bucket_adjust("tpm", 5, 10)
+    state.bucket_adjust("tpm", -50, 10)
+    assert state.bucket_level("tpm", 10) == 10
+
+def test_leases(path):
+    first, second = SharedState(path), SharedState(path)
+    assert first.acquire("key", 5)
+    assert not second.acquire("key", 5)
+    assert second.held("key")
+    first.release("key")
+    assert second.acquire("key", 5)
+
+def test_governor_quota_is_host_wide(path):
+    governors = [UpstreamGovernor(rpm=3, queue_timeout_s=0.5, shared=SharedState(path)) for _ in range(2)]
+
+    async def admit(governor):
+        try:
+            lease = await governor.acquire(10)
+            lease.release()
+            return 200
+        except UpstreamBusyError as e:
+            return e.status_code
+
+    async def run():
+        return [await admit(governors[i % 2]) for i in range(4)]
+
+    assert asyncio.run(run()) == [200, 200, 200, 429]
+    assert governors[0].stats()["rpm"]["scope"] == "host"
+
+def test_rate_limit_back_off_reaches_other_workers(path):
+    first = UpstreamGovernor(shared=SharedState(path))
+    second = UpstreamGovernor(shared=SharedState(path))
+    first.rate_limited(30)
+    assert second._budget_wait(0, 0, time.monotonic()) > 29
+
+def test_shared_back_off_is_cached_between_reads(path):
+    state = SharedState(path)
+    governor = UpstreamGovernor(shared=state)
+    governor._budget_wait(0, 0, time.monotonic())
+    reads = state.stats()["namespaces"]["governor"]["misses"]
+    for _ in range(100):
+        governor._budget_wait(0, 0, time.monotonic())
+    assert state.stats()["namespaces"]["governor"]["misses"] == reads
+
+def test_image_cache_shares_exact_hashes(path):
+    first = PerceptualHashCache(path=None, shared=SharedState(path))
+    second = PerceptualHashCache(path=None, shared=SharedState(path))
+    first.put(0xABC, [{"name": "Salad"}])
+    assert second.get(0xABC) == [{"name": "Salad"}]
+    assert second.stats()["shared_hits"] == 1
+    assert second.get(0xABC) == [{"name": "Salad"}]
+    assert second.stats()["shared_hits"] == 1
+
+def test_single_flight_across_workers(path):
+    flights = [SingleFlight(SharedState(path)) for _ in range(3)]
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.3)
+        return {"dishes": ["Salad"]}
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", call) for flight in flights))
+
+    assert asyncio.run(run()) == [{"dishes": ["Salad"]}] * 3
+    assert len(calls) == 1
+    assert sum(flight.shared_deduplicated for flight in flights) == 2
+
+def test_single_flight_waiters_run_the_call_when_the_holder_fails(path):
+    flights = [SingleFlight(SharedState(path)) for _ in range(2)]
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        await asyncio.sleep(0.1)
+        if len(attempts) == 1:
+            raise RuntimeError("upstream failed")
+        return "ok"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", call) for flight in flights), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert sorted(map(str, results)) == ["ok", "upstream failed"]
+
+def test_importing_ml_opens_no_stores(tmp_path):
+    environment = {
+        **os.environ,
+        "SHARED_STATE_PATH": str(tmp_path / "shared.sqlite3"),
+        "TEXT_CACHE_PATH": str(tmp_path / "text.sqlite3"),
+        "JOBS_DB_PATH": str(tmp_path / "jobs.sqlite3"),
+        "IMAGE_CACHE_PATH": str(tmp_path / "image.json")
+    }
+    subprocess.run([sys.executable, "-c", "import ml"], cwd=os.path.dirname(__file__), env=environment, check=True, capture_output=True)
+    assert os.listdir(tmp_path) == []
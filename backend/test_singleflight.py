@@ -0,0 +1,73 @@
+"""
+Unit tests for in-process single-flight deduplication
+"""
+
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight, content_key
+
+def test_content_key():
+    assert content_key("quick-log", "2 eggs") == content_key("quick-log", b"2 eggs")
+    assert content_key("quick-log", "2 eggs") != content_key("analyze-text", "2 eggs")
+
+def test_identical_requests_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"kcal": 140}
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", call) for _ in range(5)))
+
+    assert asyncio.run(run()) == [{"kcal": 140}] * 5
+    assert len(calls) == 1
+    stats = flight.stats()
+    assert (stats["in_flight"], stats["upstream_calls"], stats["upstream_calls_saved"]) == (0, 1, 4)
+
+def test_every_waiter_gets_the_exception():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream failed")
+
+    async def run():
+        return await asyncio.gather(*(flight.do("key", call) for _ in range(3)), return_exceptions=True)
+
+    assert [str(result) for result in asyncio.run(run())] == ["upstream failed"] * 3
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def run():
+        first = asyncio.create_task(flight.do("key", call))
+        second = asyncio.create_task(flight.do("key", call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "ok"
+
+def test_finished_keys_run_again():
+    flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        return [await flight.do("key", call), await flight.do("key", call)]
+
+    assert asyncio.run(run()) == [1, 2]
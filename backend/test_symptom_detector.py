@@ -0,0 +1,78 @@
+"""
+Unit tests for the Aho-Corasick symptom detector and its negation scope
+"""
+
+import pytest
+
+from symptom_detector import AhoCorasick, SymptomDetector, tokenize
+
+@pytest.fixture(scope="module")
+def detector():
+    return SymptomDetector()
+
+def test_tokenize_drops_apostrophes_and_keeps_clause_punctuation():
+    assert tokenize("I can't breathe, help!") == ["i", "cant", "breathe", ",", "help", "!"]
+
+def test_aho_corasick_finds_overlapping_patterns():
+    matcher = AhoCorasick()
+    matcher.add(["chest", "pain"], "chest pain")
+    matcher.add(["pain"], "pain")
+    matcher.add(["severe", "chest"], "severe chest")
+    matcher.build()
+    found = sorted(matcher.find(["severe", "chest", "pain"]))
+    assert found == [(0, 2, "severe chest"), (1, 3, "chest pain"), (2, 3, "pain")]
+
+def test_longest_match_wins(detector):
+    result = detector.detect("I have chest pain")
+    assert result["symptoms"] == ["chest pain"]
+    assert result["urgency"] == "high"
+
+@pytest.mark.parametrize("message", [
+    "I had no breakfast and now chest pain",
+    "I have never had chest pain like this before",
+    "without warning I got chest pain",
+    "my kid had no dinner and passed out"
+])
+def test_negation_does_not_reach_past_its_list(detector, message):
+    assert detector.detect(message)["urgency"] == "high"
+
+def test_negated_list(detector):
+    result = detector.detect("no nausea or vomiting")
+    assert result["symptoms"] == []
+    assert result["negated_symptoms"] == ["nausea", "vomiting"]
+    assert result["urgency"] == "low"
+
+def test_auxiliary_negation_takes_one_verb(detector):
+    result = detector.detect("I don't have a fever")
+    assert result["negated_symptoms"] == ["fever"]
+    assert result["urgency"] == "low"
+
+def test_negation_never_lowers_high_urgency(detector):
+    result = detector.detect("no chest pain")
+    assert result["negated_symptoms"] == ["chest pain"]
+    assert result["urgency"] == "high"
+
+def test_contrast_ends_negation(detector):
+    result = detector.detect("I didn't feel dizzy but I have a headache")
+    assert result["negated_symptoms"] == ["dizziness"]
+    assert result["symptoms"] == ["headache"]
+
+def test_negated_feeling_stays_negated(detector):
+    for message in ("I'm not feeling dizzy", "not feeling dizzy", "she isn't having any nausea"):
+        result = detector.detect(message)
+        assert result["symptoms"] == []
+        assert result["negated_symptoms"]
+        assert result["urgency"] == "low"
+
+def test_pseudo_negation_does_not_negate(detector):
+    assert detector.detect("not sure if this is chest pain")["symptoms"] == ["chest pain"]
+
+def test_severity_raises_one_level(detector):
+    assert detector.detect("headache")["urgency"] == "low"
+    assert detector.detect("severe headache")["urgency"] == "moderate"
+
+def test_topics(detector):
+    rows = [("protein", "topic", None, ["protein", "proteins"]), ("nausea", "symptom", "moderate", ["nausea"])]
+    small = SymptomDetector(rows=rows)
+    result = small.detect("Is protein ok with nausea?")
+    assert result == {"symptoms": ["nausea"], "negated_symptoms": [], "topics": ["protein"], "urgency": "moderate"}
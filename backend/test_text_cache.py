@@ -0,0 +1,60 @@
+"""
+Unit tests for the normalized-text response cache and the endpoints using it
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import ml
+from text_cache import TextResponseCache, bucket_weight, normalize_description
+
+def test_normalize_description():
+    assert normalize_description("  Rice,  Chicken & 1.5 cups  beans. ") == "rice chicken 1.5 cups beans"
+
+def test_bucket_weight():
+    assert bucket_weight(None) == 0
+    assert bucket_weight(110) == 100
+    assert bucket_weight(5) == 25
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "text.sqlite3")
+    first, second = TextResponseCache(path=path), TextResponseCache(path=path)
+    first.open()
+    second.open()
+    first.put("quick-log", "2 Eggs!", 100, {"kcal": 140})
+    assert second.get("quick-log", "2 eggs", 110) == {"kcal": 140}
+    assert second.stats()["disk_hits"] == 1
+    assert second.invalidate(description="2 eggs") == 1
+    # The other worker keeps its memory copy for up to TEXT_CACHE_MEMORY_TTL
+    assert first.get("quick-log", "2 eggs", 100) == {"kcal": 140}
+
+def test_memory_only_until_opened(tmp_path):
+    cache = TextResponseCache(path=str(tmp_path / "text.sqlite3"))
+    cache.put("quick-log", "toast", None, {"kcal": 80})
+    assert cache.get("quick-log", "toast") == {"kcal": 80}
+    assert not (tmp_path / "text.sqlite3").exists()
+
+@pytest.fixture
+def no_gemini(monkeypatch):
+    cache = TextResponseCache(path=None)
+    monkeypatch.setattr(ml, "text_cache", cache)
+    monkeypatch.setattr(ml, "gemini_model", None)
+    monkeypatch.setattr(ml, "food_index", None)
+    return cache
+
+def test_analyze_text_serves_cache_while_gemini_is_down(no_gemini):
+    no_gemini.put("analyze-text", "rice and beans", None, {"dishes": [{"name": "Rice"}]})
+    response = asyncio.run(ml.analyze_text_meal(ml.TextMealRequest(description="Rice and beans")))
+    assert response == {"dishes": [{"name": "Rice"}], "cached": True}
+
+def test_quick_log_serves_cache_while_gemini_is_down(no_gemini):
+    no_gemini.put("quick-log", "banana bread", None, {"name": "Banana Bread", "kcal": 200})
+    response = asyncio.run(ml.quick_log_meal(ml.TextMealRequest(description="banana bread")))
+    assert response["source"] == "cache"
+
+def test_uncached_request_without_gemini_is_503(no_gemini):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(ml.quick_log_meal(ml.TextMealRequest(description="banana bread")))
+    assert error.value.status_code == 503
@@ -0,0 +1,80 @@
+"""
+Unit tests for the async model-call layer
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+import upstream
+from fake_gemini import FakeGenerativeModel, FakeResponse, FakeUsage
+from governor import UpstreamGovernor
+
+@pytest.fixture
+def governor(monkeypatch):
+    governor = UpstreamGovernor(max_concurrency=4, tpm=100000)
+    monkeypatch.setattr(upstream, "governor", governor)
+    yield governor
+    upstream.shutdown_executor()
+
+class GatedModel:
+    """Streams one chunk, then waits for `gate` before the final one"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.finished = threading.Event()
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        yield FakeResponse("first ")
+        self.gate.wait(5)
+        yield FakeResponse("last", FakeUsage(10, 5000))
+        self.finished.set()
+
+def test_generate_content_async_holds_and_releases_the_lease(governor):
+    model = FakeGenerativeModel(latency_ms=10, latency_sigma=0)
+    response = asyncio.run(upstream.generate_content_async(model, "Say hi"))
+    assert response.text
+    assert governor.active == 0
+    assert governor.admitted == 1
+
+def test_stream_collects_chunks(governor):
+    model = FakeGenerativeModel(latency_ms=10, latency_sigma=0, stream_chunks=4)
+
+    async def run():
+        return [chunk async for chunk in upstream.stream_content_async(model, "Say hi")]
+
+    assert len(asyncio.run(run())) >= 4
+    assert governor.active == 0
+
+def test_stream_lease_outlives_an_early_consumer(governor):
+    model = GatedModel()
+
+    async def run():
+        stream = upstream.stream_content_async(model, "Say hi")
+        assert await stream.__anext__() == "first "
+        await stream.aclose()
+        # The producer thread is still reading the upstream stream
+        held = governor.active
+        model.gate.set()
+        while governor.active:
+            await asyncio.sleep(0.01)
+        return held
+
+    assert asyncio.run(run()) == 1
+    assert governor.active == 0
+
+def test_stream_tokens_are_charged_after_an_early_stop(governor):
+    model = GatedModel()
+
+    async def run():
+        stream = upstream.stream_content_async(model, "Say hi")
+        await stream.__anext__()
+        await stream.aclose()
+        model.gate.set()
+        while governor.active:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    # The final chunk's usage (5010 tokens) replaced the small up-front estimate
+    assert governor.tpm.level < governor.tpm.per_minute - 5000
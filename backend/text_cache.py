@@ -0,0 +1,210 @@
+"""
+Normalized-text response cache for /analyze-text and /quick-log
+An in-process LRU sits in front of a SQLite (WAL) store that every
+uvicorn worker on the host shares
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+TEXT_CACHE_SIZE = int(os.environ.get("TEXT_CACHE_SIZE", "4096"))
+TEXT_CACHE_TTL = int(os.environ.get("TEXT_CACHE_TTL", str(30 * 24 * 3600)))
+# How long a worker trusts its in-memory copy before re-reading SQLite,
+# which bounds how late an invalidation from another worker is seen
+TEXT_CACHE_MEMORY_TTL = int(os.environ.get("TEXT_CACHE_MEMORY_TTL", "60"))
+# Weights within the same bucket share one cached answer
+TEXT_CACHE_WEIGHT_BUCKET_G = int(os.environ.get("TEXT_CACHE_WEIGHT_BUCKET_G", "25"))
+TEXT_CACHE_PATH = os.environ.get(
+    "TEXT_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), ".cache", "text_cache.sqlite3")
+)
+
+_PUNCTUATION = re.compile(r"[^\w\s.]|(?<!\d)\.|\.(?!\d)")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_description(description: str) -> str:
+    """Lowercase, drop punctuation (keeping decimal points) and collapse whitespace"""
+    text = _PUNCTUATION.sub(" ", description.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+def bucket_weight(weight_g: Optional[int]) -> int:
+    """Round a weight hint to its bucket; 0 means no hint was given"""
+    if not weight_g or weight_g <= 0:
+        return 0
+    bucket = TEXT_CACHE_WEIGHT_BUCKET_G
+    return max(bucket, int(round(weight_g / bucket)) * bucket)
+
+class TextResponseCache:
+    """Two-tier (memory LRU + SQLite) cache of endpoint responses"""
+
+    def __init__(
+        self,
+        path: Optional[str] = TEXT_CACHE_PATH,
+        max_entries: int = TEXT_CACHE_SIZE,
+        ttl_seconds: int = TEXT_CACHE_TTL
+    ):
+        self.path = path or None
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def open(self):
+        """Connect the SQLite tier; until then (or without a path) the cache is memory only"""
+        if self.path and self._db is None:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute("PRAGMA busy_timeout=2000")
+                self._db.execute("""
+                    CREATE TABLE IF NOT EXISTS text_cache (
+                        endpoint TEXT NOT NULL,
+                        description TEXT NOT NULL,
+                        weight_bucket INTEGER NOT NULL,
+                        value TEXT NOT NULL,
+                        stored_at REAL NOT NULL,
+                        PRIMARY KEY (endpoint, description, weight_bucket)
+                    )
+                """)
+            except sqlite3.Error as e:
+                print(f"⚠️ Text cache store unavailable, using memory only: {e}")
+                self._db = None
+
+    @staticmethod
+    def make_key(endpoint: str, description: str, weight_g: Optional[int]) -> tuple:
+        return (endpoint, normalize_description(description), bucket_weight(weight_g))
+
+    def get(self, endpoint: str, description: str, weight_g: Optional[int] = None) -> Optional[dict]:
+        key = self.make_key(endpoint, description, weight_g)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, loaded_at, value = entry
+                if now - stored_at <= self.ttl_seconds and now - loaded_at <= TEXT_CACHE_MEMORY_TTL:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+        if self._db is not None:
+            try:
+                row = self._db.execute(
+                    "SELECT value, stored_at FROM text_cache "
+                    "WHERE endpoint = ? AND description = ? AND weight_bucket = ?",
+                    key
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"⚠️ Text cache read failed: {e}")
+                row = None
+
+            if row is not None and now - row[1] <= self.ttl_seconds:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._remember(key, row[1], value)
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, endpoint: str, description: str, weight_g: Optional[int], value: dict):
+        key = self.make_key(endpoint, description, weight_g)
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, now, value)
+
+        if self._db is not None:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO text_cache "
+                    "(endpoint, description, weight_bucket, value, stored_at) VALUES (?, ?, ?, ?, ?)",
+                    (*key, json.dumps(value), now)
+                )
+            except sqlite3.Error as e:
+                print(f"⚠️ Text cache write failed: {e}")
+
+    def _remember(self, key: tuple, stored_at: float, value: dict):
+        self._memory[key] = (stored_at, time.time(), value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def invalidate(self, description: Optional[str] = None, endpoint: Optional[str] = None) -> int:
+        """
+        Drop cached answers for one description (every weight bucket), one
+        endpoint, or everything when called with no arguments
+        Returns the number of persisted rows removed
+        """
+        normalized = normalize_description(description) if description else None
+
+        with self._lock:
+            for key in list(self._memory):
+                if (endpoint is None or key[0] == endpoint) and (normalized is None or key[1] == normalized):
+                    del self._memory[key]
+
+        if self._db is None:
+            return 0
+
+        clauses, params = [], []
+        if endpoint is not None:
+            clauses.append("endpoint = ?")
+            params.append(endpoint)
+        if normalized is not None:
+            clauses.append("description = ?")
+            params.append(normalized)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        try:
+            return self._db.execute(f"DELETE FROM text_cache{where}", params).rowcount
+        except sqlite3.Error as e:
+            print(f"⚠️ Text cache invalidation failed: {e}")
+            return 0
+
+    def purge_expired(self) -> int:
+        """Delete persisted rows older than the TTL"""
+        if self._db is None:
+            return 0
+        try:
+            cutoff = time.time() - self.ttl_seconds
+            return self._db.execute("DELETE FROM text_cache WHERE stored_at < ?", (cutoff,)).rowcount
+        except sqlite3.Error as e:
+            print(f"⚠️ Text cache purge failed: {e}")
+            return 0
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        persisted = None
+        if self._db is not None:
+            try:
+                persisted = self._db.execute("SELECT COUNT(*) FROM text_cache").fetchone()[0]
+            except sqlite3.Error:
+                pass
+        return {
+            "memory_entries": len(self._memory),
+            "persisted_entries": persisted,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,148 @@
+"""
+Async model-call layer shared by every Gemini endpoint
+Runs the blocking generate_content calls on a bounded thread pool
+so a slow upstream never stalls the event loop; every call is admitted
+through the governor (concurrency, RPM/TPM quota, bounded wait queue)
+"""
+
+import os
+import asyncio
+import functools
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from governor import governor, estimate_request_tokens, is_rate_limit_error, UpstreamBusyError, PRIORITY_LOGGING
+from metrics import UPSTREAM_LATENCY, UPSTREAM_ERRORS, UPSTREAM_TOKENS
+
+# Upper bound on concurrent upstream calls per worker process
+GEMINI_MAX_WORKERS = int(os.environ.get("GEMINI_MAX_WORKERS", "16"))
+
+_executor: ThreadPoolExecutor = None
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the shared upstream thread pool, creating it on first use"""
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=GEMINI_MAX_WORKERS,
+            thread_name_prefix="gemini"
+        )
+    return _executor
+
+def _rate_limited(error: Exception) -> UpstreamBusyError:
+    """Back the governor off after a Gemini 429 and turn it into our own 429"""
+    governor.rate_limited()
+    return UpstreamBusyError(429, "AI request quota exceeded. Please retry later.", 10)
+
+def _failed(error: Exception) -> Exception:
+    """Count a failed call and return the exception the caller should raise"""
+    if is_rate_limit_error(error):
+        UPSTREAM_ERRORS.inc(("rate_limited",))
+        return _rate_limited(error)
+    if isinstance(error, TimeoutError) or type(error).__name__ == "DeadlineExceeded":
+        UPSTREAM_ERRORS.inc(("timeout",))
+    else:
+        UPSTREAM_ERRORS.inc(("error",))
+    return error
+
+def _record_tokens(usage):
+    prompt = getattr(usage, "prompt_token_count", None)
+    answer = getattr(usage, "candidates_token_count", None)
+    if isinstance(prompt, int):
+        UPSTREAM_TOKENS.inc(("prompt",), prompt)
+    if isinstance(answer, int):
+        UPSTREAM_TOKENS.inc(("response",), answer)
+
+async def generate_content_async(model, contents, priority: str = PRIORITY_LOGGING, **kwargs):
+    """
+    Await model.generate_content(contents, **kwargs) without blocking the event loop
+    The call waits for admission by the governor in its priority class and
+    then runs on the shared executor; UpstreamBusyError (429/503) is raised
+    when it can't be admitted
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(model.generate_content, contents, **kwargs)
+    async with await governor.acquire(estimate_request_tokens(contents), priority) as lease:
+        started = time.perf_counter()
+        try:
+            response = await loop.run_in_executor(get_executor(), call)
+        except Exception as e:
+            error = _failed(e)
+            if error is e:
+                raise
+            raise error from e
+        finally:
+            UPSTREAM_LATENCY.observe(time.perf_counter() - started, (priority,))
+        usage = getattr(response, "usage_metadata", None)
+        lease.record_usage(usage)
+        _record_tokens(usage)
+        return response
+
+async def stream_content_async(model, contents, priority: str = PRIORITY_LOGGING, **kwargs):
+    """
+    Async generator over the text chunks of model.generate_content(contents, stream=True)
+    The blocking iteration runs on the shared executor and hands chunks to the
+    event loop as they arrive; closing the generator stops the producer early,
+    and the governor lease is released once the producer thread has finished
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stopped = threading.Event()
+    done = object()
+    # usage_metadata of the latest chunk (the final one carries the totals)
+    usage = [None]
+
+    def produce():
+        try:
+            for chunk in model.generate_content(contents, stream=True, **kwargs):
+                usage[0] = getattr(chunk, "usage_metadata", None) or usage[0]
+                if stopped.is_set():
+                    break
+                text = getattr(chunk, "text", "")
+                if text:
+                    loop.call_soon_threadsafe(queue.put_nowait, text)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    lease = await governor.acquire(estimate_request_tokens(contents), priority)
+    started = time.perf_counter()
+
+    def produced(_):
+        # The call holds its slot and is charged its tokens until the
+        # producer is done reading, however early the consumer stopped
+        lease.record_usage(usage[0])
+        _record_tokens(usage[0])
+        lease.release()
+        UPSTREAM_LATENCY.observe(time.perf_counter() - started, (priority,))
+
+    try:
+        producer = loop.run_in_executor(get_executor(), produce)
+    except BaseException:
+        lease.release()
+        raise
+    producer.add_done_callback(produced)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                error = _failed(item)
+                if error is item:
+                    raise item
+                raise error from item
+            yield item
+    finally:
+        stopped.set()
+
+def shutdown_executor():
+    """Release the upstream thread pool (called on application shutdown)"""
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None